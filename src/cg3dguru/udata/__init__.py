@@ -1 +1 @@
-from .core import * 
\ No newline at end of file
+from .core import *
@@ -0,0 +1,1884 @@
+"""The dependency graph operations used by the udata module
+
+Every read and write udata makes to a scene goes through the active Backend
+(see udata.get_backend() and udata.set_backend()). Three backends are
+available:
+
+1. PymelBackend : Works on PyNodes and pymel Attributes. This is how udata
+has always talked to Maya.
+
+2. CmdsBackend : The default. Nodes are still PyNodes at the API boundary,
+but attribute work is done with maya.cmds on plug strings and bulk reads are
+done with OpenMaya 2.0 MPlugs, which avoids building pymel wrappers in the
+hot loops.
+
+3. MemoryBackend : A pure-Python stand-in for the dependency graph. It
+doesn't import Maya, so the udata module can be unit tested and
+benchmarked on machines without a Maya install.
+
+Backends work with node handles (whatever the backend's ls() and
+create_node() return) and attribute names, which may include a multi index
+such as 'DataRecords[2]'. Methods that read or write values take the
+attr_type/data_type of the attribute, since Maya needs to be told the type
+of typed (-dt) attributes.
+"""
+
+__author__ = "Nathaniel Albright"
+__email__ = "developer@3dcg.guru"
+
+
+import collections
+import contextlib
+import fnmatch
+import re
+import warnings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+COMPOUND_TYPES = set(['compound', 'reflectance', 'spectrum', 'float2', 'float3',
+                      'double2', 'double3', 'long2', 'long3', 'short2', 'short3'])
+"""Attribute types whose values are read as a tuple of child values"""
+
+NUMERIC_CHILD_TYPES = {'reflectance':'float', 'spectrum':'float',
+                       'float2':'float', 'float3':'float', 'double2':'double',
+                       'double3':'double', 'long2':'long', 'long3':'long', 'short2':'short',
+                       'short3':'short'}
+"""The child type of each numeric compound type"""
+
+ARRAY_TYPES = {'doubleArray': ('float64', 1), 'floatArray': ('float32', 1), 'Int32Array': ('int32', 1),
+               'vectorArray': ('float64', 3), 'pointArray': ('float64', 4)}
+"""The numpy dtype and row width of each array data type"""
+
+_ELEMENT = re.compile(r'^(?P<name>[^\[]+)(\[(?P<index>\d+)\])?$')
+
+
+
+def _split_plug(attr):
+    """Splits 'attr[3]' into ('attr', 3) and 'attr' into ('attr', None)"""
+    match = _ELEMENT.match(attr.split('.')[-1])
+    if not match:
+        raise RuntimeError('Invalid attribute name "{0}"'.format(attr))
+
+    index = match.group('index')
+    return (match.group('name'), int(index) if index is not None else None)
+
+
+def as_array(data_type, values):
+    """Returns values as a numpy array shaped for an array data type
+
+    Vector and point arrays have one row per element. Points can be given
+    as (x, y, z) rows, which get a w of 1.0.
+    """
+    if numpy is None:
+        raise RuntimeError('udata Module: array attributes require numpy')
+
+    dtype, width = ARRAY_TYPES[data_type]
+    array = numpy.asarray(values, dtype = dtype)
+    if width == 1:
+        return array.reshape(-1)
+
+    array = array.reshape(-1, array.shape[-1] if array.ndim > 1 else width)
+    if data_type == 'pointArray' and array.shape[1] == 3:
+        array = numpy.hstack([array, numpy.ones((len(array), 1), dtype = dtype)])
+
+    if array.shape[1] != width:
+        raise RuntimeError('udata Module: {0} rows need {1} values'.format(data_type, width))
+
+    return array
+
+
+def _pop_flag(flags, *names):
+    value = None
+    for name in names:
+        if name in flags:
+            value = flags.pop(name)
+
+    return value
+
+
+
+class IndexHook(object):
+    """Reports scene changes that happen outside of the udata module
+
+    The SceneIndex installs a hook the first time it's built. Sub-classes
+    should call index.node_added(), index.node_removed() and
+    index.invalidate() whenever the scene changes. The default
+    implementation does nothing, which is useful when the scene is only
+    ever edited through the udata module.
+    """
+
+    def install(self, index):
+        """Start reporting scene changes to the input SceneIndex"""
+        pass
+
+
+    def uninstall(self):
+        """Stop reporting scene changes"""
+        pass
+
+
+    def get_node(self, handle):
+        """Returns the node of a handle passed to index.node_added()
+
+        Returns None if the node no longer exists.
+        """
+        return handle
+
+
+
+class MayaIndexHook(IndexHook):
+    """Reports scene changes to the SceneIndex through OpenMaya callbacks"""
+
+    scene_messages = ['kBeforeOpen', 'kBeforeNew', 'kAfterOpen', 'kAfterNew', 'kAfterImport',
+                      'kAfterCreateReference', 'kAfterLoadReference',
+                      'kAfterUnloadReference', 'kAfterRemoveReference']
+    """MSceneMessage events that invalidate the whole index"""
+
+    events = ['Undo', 'Redo']
+    """MEventMessage events that invalidate the whole index"""
+
+
+    def __init__(self):
+        super(MayaIndexHook, self).__init__()
+        self._index = None
+        self._callback_ids = []
+
+
+    def install(self, index):
+        import maya.OpenMaya as om
+
+        self._index = index
+        self._callback_ids = [
+            om.MDGMessage.addNodeAddedCallback(self._node_added, 'dependNode'),
+            om.MDGMessage.addNodeRemovedCallback(self._node_removed, 'dependNode')
+        ]
+
+        for message in self.scene_messages:
+            self._callback_ids.append(
+                om.MSceneMessage.addCallback(getattr(om.MSceneMessage, message), self._invalidate) )
+
+        for event in self.events:
+            self._callback_ids.append(om.MEventMessage.addEventCallback(event, self._invalidate))
+
+
+    def uninstall(self):
+        import maya.OpenMaya as om
+
+        for callback_id in self._callback_ids:
+            om.MMessage.removeCallback(callback_id)
+
+        self._callback_ids = []
+        self._index = None
+
+
+    def get_node(self, handle):
+        if not handle.isValid():
+            return None
+
+        import pymel.core as pm
+        return pm.PyNode(handle.object())
+
+
+    def _node_added(self, mobject, *args):
+        #an index that isn't built finds every node with records when it's
+        #built, including nodes the udataIndex node doesn't have yet, and the
+        #PyNode is only made if the node is still around on the next query
+        if not self._index.is_built():
+            return
+
+        import maya.OpenMaya as om
+        self._index.node_added(om.MObjectHandle(mobject))
+
+
+    def _node_removed(self, mobject, *args):
+        if not self._index.is_tracking():
+            return
+
+        import pymel.core as pm
+        self._index.node_removed(pm.PyNode(mobject))
+
+
+    def _invalidate(self, *args):
+        self._index.invalidate()
+
+
+
+class JournalHook(object):
+    """Reports attribute edits made outside of the udata module
+
+    The ChangeJournal installs a hook when it's enabled and asks it to
+    watch every node that carries data. Sub-classes should call
+    journal.attribute_changed(node name, attribute name) whenever a watched
+    attribute is set. The default implementation does nothing, so only edits
+    made through the udata API are journaled.
+    """
+
+    def install(self, journal):
+        """Start reporting attribute edits to the input ChangeJournal"""
+        pass
+
+
+    def uninstall(self):
+        """Stop reporting attribute edits"""
+        pass
+
+
+    def watch(self, node):
+        """Report the attribute edits of the input node"""
+        pass
+
+
+
+class MayaJournalHook(JournalHook):
+    """Reports attribute edits to the ChangeJournal through OpenMaya callbacks
+
+    The journal is also saved before the scene is saved and re-loaded when
+    a scene is opened.
+    """
+
+    def __init__(self):
+        super(MayaJournalHook, self).__init__()
+        self._journal = None
+        self._callback_ids = []
+        self._node_callbacks = {}
+
+
+    def install(self, journal):
+        import maya.OpenMaya as om
+
+        self._journal = journal
+        self._callback_ids = [
+            om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeSave, self._save),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, self._load),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, self._load),
+        ]
+
+
+    def uninstall(self):
+        import maya.OpenMaya as om
+
+        for callback_id in self._callback_ids + list(self._node_callbacks.values()):
+            om.MMessage.removeCallback(callback_id)
+
+        self._callback_ids = []
+        self._node_callbacks = {}
+        self._journal = None
+
+
+    def watch(self, node):
+        import maya.OpenMaya as om
+
+        node_name = node.longName() if hasattr(node, 'longName') else str(node)
+        if node_name in self._node_callbacks:
+            return
+
+        selection = om.MSelectionList()
+        selection.add(node_name)
+        mobject = om.MObject()
+        selection.getDependNode(0, mobject)
+        self._node_callbacks[node_name] = om.MNodeMessage.addAttributeChangedCallback(mobject, self._attribute_changed)
+
+
+    def _attribute_changed(self, message, plug, other_plug, *args):
+        import maya.OpenMaya as om
+
+        if message & om.MNodeMessage.kAttributeSet:
+            action = 'set'
+        elif message & (om.MNodeMessage.kConnectionMade | om.MNodeMessage.kConnectionBroken):
+            action = 'connect'
+        else:
+            return
+
+        node_name = om.MFnDagNode(plug.node()).fullPathName() if plug.node().hasFn(om.MFn.kDagNode) \
+            else om.MFnDependencyNode(plug.node()).name()
+        attr_name = plug.partialName(False, False, False, False, False, True)
+        self._journal.attribute_changed(node_name, attr_name, action)
+
+
+    def _save(self, *args):
+        self._journal.save()
+
+
+    def _load(self, *args):
+        import maya.OpenMaya as om
+
+        #the old scene's nodes are gone along with their callbacks' nodes
+        for callback_id in self._node_callbacks.values():
+            om.MMessage.removeCallback(callback_id)
+
+        self._node_callbacks = {}
+        self._journal.load()
+
+
+
+class Backend(object):
+    """The interface udata uses to read and write the dependency graph
+
+    Sub-classes must implement the node and attribute methods. The bulk
+    methods (read_multi_strings, read_columns, write_columns) have generic
+    implementations built on the attribute methods that faster backends can
+    override.
+    """
+
+    name = ''
+    """A short name for reports and benchmarks"""
+
+###----Messages----
+
+    def error(self, message):
+        """Raise an error. Must not return."""
+        raise RuntimeError(message)
+
+
+    def warning(self, message):
+        """Report a warning"""
+        warnings.warn(message)
+
+
+    @contextlib.contextmanager
+    def undo_chunk(self, name, undoable = True):
+        """Groups all the edits made inside the context into one undo"""
+        yield
+
+
+    def create_index_hook(self):
+        """Returns the IndexHook that reports scene changes for this backend"""
+        return IndexHook()
+
+
+    def create_journal_hook(self):
+        """Returns the JournalHook that reports attribute edits for this backend"""
+        return JournalHook()
+
+
+    def scene_path(self):
+        """Returns the file path of the open scene, '' if it's never been saved"""
+        return ''
+
+
+    def defer(self, func):
+        """Run func once the application is idle"""
+        raise NotImplementedError()
+
+###----Nodes----
+
+    def ls(self, *args, **kwargs):
+        """Returns node handles, accepts the common maya.cmds.ls() flags"""
+        raise NotImplementedError()
+
+
+    def create_node(self, node_type, **kwargs):
+        """Create a node and return its handle"""
+        raise NotImplementedError()
+
+
+    def delete_node(self, node):
+        """Delete a node"""
+        raise NotImplementedError()
+
+
+    def to_node(self, node_name):
+        """Returns the node handle of a node name"""
+        raise NotImplementedError()
+
+
+    def node_name(self, node):
+        """Returns a unique name for a node handle"""
+        raise NotImplementedError()
+
+
+    def iter_node_names(self, node_type = None):
+        """Yield the name of every node in the scene
+
+        Args:
+            node_type (str, optional) : Only yield nodes of this type.
+        """
+        nodes = self.ls(type = node_type) if node_type else self.ls()
+        for node in nodes:
+            yield self.node_name(node)
+
+
+    def node_exists(self, node):
+        """Does the node still exist?"""
+        raise NotImplementedError()
+
+###----Attributes----
+
+    def plug(self, node, attr):
+        """Returns the object users work with to access an attribute"""
+        raise NotImplementedError()
+
+
+    def has_attr(self, node, attr):
+        raise NotImplementedError()
+
+
+    def list_attrs(self, node):
+        """Returns the long names of every attribute on the node"""
+        raise NotImplementedError()
+
+
+    def add_attr(self, node, long_name, **flags):
+        """Add an attribute, takes the maya.cmds.addAttr() flags"""
+        raise NotImplementedError()
+
+
+    def edit_attr(self, node, attr, **flags):
+        """Edit an existing attribute with maya.cmds.addAttr() flags"""
+        raise NotImplementedError()
+
+
+    def delete_attr(self, node, attr):
+        raise NotImplementedError()
+
+
+    def get_attr_type(self, node, attr):
+        """Returns ('at' or 'dt', type name) of an existing attribute"""
+        raise NotImplementedError()
+
+
+    def list_children(self, node, attr):
+        """Returns the long names of a compound attribute's children"""
+        raise NotImplementedError()
+
+
+    def get_attr(self, node, attr, attr_type = None):
+        """Returns an attribute value
+
+        Compound values are returned as a tuple of child values.
+        """
+        raise NotImplementedError()
+
+
+    def set_attr(self, node, attr, value, data_type = None):
+        """Set an attribute value
+
+        Args:
+            data_type (str, optional) : The type of a typed (-dt) attribute.
+            Tuples and lists are spread over the children of -at compounds.
+        """
+        raise NotImplementedError()
+
+
+    def is_locked(self, node, attr):
+        raise NotImplementedError()
+
+
+    def set_locked(self, node, attr, locked):
+        raise NotImplementedError()
+
+
+    def get_multi_indices(self, node, attr):
+        """Returns the sorted logical indices of a multi attribute"""
+        raise NotImplementedError()
+
+
+    def remove_multi_instance(self, node, attr):
+        """Remove the element of a multi attribute, ie. 'attr[3]'"""
+        raise NotImplementedError()
+
+
+    def list_connections(self, node, attr):
+        """Returns (source plug, destination plug) pairs of an attribute
+
+        Connections to the attribute's children are included.
+        """
+        raise NotImplementedError()
+
+
+    def connect(self, source, destination):
+        """Connect two plug names, if they aren't already connected"""
+        raise NotImplementedError()
+
+
+    def copy_attrs(self, source_node, destination_node, attrs):
+        """Copy the values and connections of the named attributes"""
+        raise NotImplementedError()
+
+###----Bulk Methods----
+
+    def read_multi_strings(self, attr, nodes = None):
+        """Returns the string elements of a multi attribute on many nodes
+
+        Args:
+            attr (str) : The multi attribute to read.
+            nodes (list, optional) : The nodes to read. Every node in the
+            scene is read when this is None.
+
+        Returns:
+            list : (node name, [(index, string)]) for each node that has the
+            attribute.
+        """
+        if nodes is None:
+            nodes = self.ls()
+
+        found = []
+        for node in nodes:
+            if not self.node_exists(node) or not self.has_attr(node, attr):
+                continue
+
+            elements = []
+            for index in self.get_multi_indices(node, attr):
+                elements.append( (index, self.get_attr(node, '{0}[{1}]'.format(attr, index))) )
+
+            found.append( (self.node_name(node), elements) )
+
+        return found
+
+
+    def list_connections_many(self, plugs):
+        """Returns the connections of many attributes at once
+
+        Attributes that don't exist are skipped.
+
+        Args:
+            plugs (list) : (node name, attribute name) tuples.
+
+        Returns:
+            list : (plug index, own plug, other plug, incoming) tuples. The
+            own plug is the 'node.attr' (or one of its children) that was
+            connected, the other plug is the 'node.attr' on the other end
+            and incoming is True when the other plug is the source.
+        """
+        found = []
+        for i, (node_name, attr) in enumerate(plugs):
+            if not self.has_attr(node_name, attr):
+                continue
+
+            for source, destination in self.list_connections(node_name, attr):
+                own_source = source.split('.')[0] == node_name and _split_plug(source)[0] == attr
+                if own_source:
+                    found.append( (i, source, destination, False) )
+                else:
+                    found.append( (i, destination, source, True) )
+
+        return found
+
+
+    def find_attrs(self, attrs, nodes = None):
+        """Returns the names of the nodes that have each attribute
+
+        Args:
+            attrs (str list) : The attribute names to look for.
+            nodes (list, optional) : The nodes to search. Every node in the
+            scene is searched when this is None.
+
+        Returns:
+            dict : Node name lists keyed by attribute name.
+        """
+        if nodes is None:
+            nodes = self.ls()
+
+        found = dict((attr, []) for attr in attrs)
+        for node in nodes:
+            if not self.node_exists(node):
+                continue
+
+            for attr in attrs:
+                if self.has_attr(node, attr):
+                    found[attr].append(self.node_name(node))
+
+        return found
+
+
+    def read_value(self, node, entry):
+        """Returns the value of the attribute described by a PlanEntry
+
+        Message attributes return the names of the connected nodes.
+        """
+        if entry.attr_type == 'message':
+            node_name = self.node_name(node)
+            names = []
+            for source, destination in self.list_connections(node, entry.name):
+                other = destination if source.split('.')[0] == node_name else source
+                names.append(other.split('.')[0])
+
+            return names
+
+        return self.get_attr(node, entry.name, entry.attr_type)
+
+
+    def write_value(self, node, entry, value):
+        """Set the value of the attribute described by a PlanEntry"""
+        data_type = entry.attr_type if entry.type_flag == 'dt' else None
+        self.set_attr(node, entry.name, value, data_type)
+
+
+    def resolve_plug(self, node, attr):
+        """Returns a handle that read_plug() can read the attribute through
+
+        Callers that read the same attribute many times can resolve it
+        once and keep the handle for as long as the attribute exists.
+        """
+        return (node, attr)
+
+
+    def read_plug(self, resolved, entry):
+        """Returns the value of a resolve_plug() handle described by a PlanEntry"""
+        return self.read_value(resolved[0], entry)
+
+
+    def read_columns(self, nodes, entries):
+        """Returns one list of values per PlanEntry, in the node order"""
+        return [[self.read_value(node, entry) for node in nodes] for entry in entries]
+
+
+    def write_columns(self, nodes, entries, columns):
+        """Write one sequence of values per PlanEntry, in the node order"""
+        for entry, column in zip(entries, columns):
+            for node, value in zip(nodes, column):
+                self.write_value(node, entry, value)
+
+
+    def read_array(self, node, entry):
+        """Returns the array attribute described by a PlanEntry as a numpy array
+
+        See as_array() for the shape of the result.
+        """
+        return as_array(entry.attr_type, self.get_attr(node, entry.name, entry.attr_type) or [])
+
+
+    def write_array(self, node, entry, array, undoable = True):
+        """Set the array attribute described by a PlanEntry from a numpy array
+
+        Args:
+            undoable (bool, optional) : Backends may write faster when the
+            write doesn't need to be undoable.
+        """
+        array = as_array(entry.attr_type, array)
+        values = array.tolist()
+        if array.ndim > 1:
+            values = [tuple(row) for row in values]
+
+        self.set_attr(node, entry.name, values, entry.attr_type)
+
+
+    def write_array_chunks(self, node, entry, chunks):
+        """Set an array attribute from an iterable of numpy array chunks
+
+        Each chunk is converted to the written values as it's read, so the
+        chunks are never joined into one numpy array. The attribute is set
+        once, with a normal setAttr.
+        """
+        values = []
+        for chunk in chunks:
+            array = as_array(entry.attr_type, chunk)
+            rows = array.tolist()
+            values.extend([tuple(row) for row in rows] if array.ndim > 1 else rows)
+
+        self.set_attr(node, entry.name, values, entry.attr_type)
+
+
+
+class PymelBackend(Backend):
+    """Reads and writes the scene with pymel"""
+
+    name = 'pymel'
+
+    def __init__(self):
+        super(PymelBackend, self).__init__()
+
+        import pymel.core
+        self.pm = pymel.core
+
+
+    def error(self, message):
+        self.pm.error(message)
+
+
+    def warning(self, message):
+        self.pm.warning(message)
+
+
+    @contextlib.contextmanager
+    def undo_chunk(self, name, undoable = True):
+        pm = self.pm
+        if undoable:
+            pm.undoInfo(openChunk = True, chunkName = name)
+            try:
+                yield
+            finally:
+                pm.undoInfo(closeChunk = True)
+        else:
+            state = pm.undoInfo(query = True, state = True)
+            pm.undoInfo(stateWithoutFlush = False)
+            try:
+                yield
+            finally:
+                pm.undoInfo(stateWithoutFlush = state)
+
+
+    def create_index_hook(self):
+        return MayaIndexHook()
+
+
+    def create_journal_hook(self):
+        return MayaJournalHook()
+
+
+    def scene_path(self):
+        return str(self.pm.sceneName())
+
+
+    def defer(self, func):
+        import maya.utils
+        maya.utils.executeDeferred(func)
+
+
+    def ls(self, *args, **kwargs):
+        return self.pm.ls(*args, **kwargs)
+
+
+    def create_node(self, node_type, **kwargs):
+        return self.pm.general.createNode(node_type, **kwargs)
+
+
+    def delete_node(self, node):
+        self.pm.delete(node)
+
+
+    def to_node(self, node_name):
+        return self.pm.PyNode(node_name)
+
+
+    def node_name(self, node):
+        if hasattr(node, 'longName'):
+            return node.longName()
+
+        return str(node)
+
+
+    def node_exists(self, node):
+        if hasattr(node, 'exists'):
+            return node.exists()
+
+        return self.pm.objExists(node)
+
+
+    def plug(self, node, attr):
+        if not hasattr(node, 'attr'):
+            node = self.pm.PyNode(node)
+
+        return node.attr(attr)
+
+
+    def has_attr(self, node, attr):
+        return self.pm.hasAttr(node, attr)
+
+
+    def list_attrs(self, node):
+        return self.pm.listAttr(node)
+
+
+    def add_attr(self, node, long_name, **flags):
+        self.pm.addAttr(node, ln = long_name, **flags)
+
+
+    def edit_attr(self, node, attr, **flags):
+        self.pm.addAttr(self.plug(node, attr), edit = True, **flags)
+
+
+    def delete_attr(self, node, attr):
+        self.pm.deleteAttr(node, at = attr)
+
+
+    def get_attr_type(self, node, attr):
+        plug = self.plug(node, attr)
+        attr_type = self.pm.addAttr(plug, query = True, attributeType = True)
+        if attr_type == 'typed':
+            return ('dt', (self.pm.addAttr(plug, query = True, dataType = True) or ['typed'])[0])
+
+        return ('at', attr_type)
+
+
+    def list_children(self, node, attr):
+        return [child.attrName(longName = True) for child in self.plug(node, attr).getChildren()]
+
+
+    def get_attr(self, node, attr, attr_type = None):
+        value = self.plug(node, attr).get()
+
+        datatypes = self.pm.datatypes
+        if isinstance(value, datatypes.Matrix):
+            value = [x for row in value for x in row]
+        elif isinstance(value, datatypes.Array):
+            value = tuple(value)
+        elif isinstance(value, list) and value and isinstance(value[0], datatypes.Array):
+            value = [tuple(item) for item in value]
+
+        return value
+
+
+    def set_attr(self, node, attr, value, data_type = None):
+        plug = self.plug(node, attr)
+        if data_type == 'matrix':
+            plug.set(self.pm.datatypes.Matrix(value))
+        elif data_type:
+            plug.set(value, type = data_type)
+        else:
+            plug.set(value)
+
+
+    def is_locked(self, node, attr):
+        return self.plug(node, attr).isLocked()
+
+
+    def set_locked(self, node, attr, locked):
+        if locked:
+            self.plug(node, attr).lock()
+        else:
+            self.plug(node, attr).unlock()
+
+
+    def get_multi_indices(self, node, attr):
+        return self.plug(node, attr).getArrayIndices()
+
+
+    def remove_multi_instance(self, node, attr):
+        self.pm.removeMultiInstance(self.plug(node, attr), b = True)
+
+
+    def list_connections(self, node, attr):
+        plug = self.plug(node, attr)
+        connections = []
+        for this, other in plug.connections(connections = True, plugs = True, source = True, destination = False):
+            connections.append( (str(other), str(this)) )
+
+        for this, other in plug.connections(connections = True, plugs = True, source = False, destination = True):
+            connections.append( (str(this), str(other)) )
+
+        return connections
+
+
+    def connect(self, source, destination):
+        if not self.pm.isConnected(source, destination):
+            self.pm.connectAttr(source, destination, force = True)
+
+
+    def copy_attrs(self, source_node, destination_node, attrs):
+        self.pm.copyAttr(source_node, destination_node, at = attrs, ic = True, oc = True, values = True)
+
+
+
+class CmdsBackend(PymelBackend):
+    """Reads and writes the scene with maya.cmds and OpenMaya 2.0
+
+    Node handles and user facing attributes are still pymel objects, but
+    every attribute operation works on plug strings and the bulk reads work
+    on MPlugs so no pymel wrappers are built in the hot loops.
+    """
+
+    name = 'cmds'
+
+    def __init__(self):
+        super(CmdsBackend, self).__init__()
+
+        import maya.cmds
+        import maya.api.OpenMaya
+        self.cmds = maya.cmds
+        self.om2 = maya.api.OpenMaya
+
+        om2 = self.om2
+        self._readers = {
+            'bool' : lambda plug: plug.asBool(),
+            'long' : lambda plug: plug.asInt(),
+            'short' : lambda plug: plug.asInt(),
+            'byte' : lambda plug: plug.asInt(),
+            'char' : lambda plug: plug.asInt(),
+            'enum' : lambda plug: plug.asInt(),
+            'float' : lambda plug: plug.asDouble(),
+            'double' : lambda plug: plug.asDouble(),
+            'doubleLinear' : lambda plug: plug.asMDistance().asUnits(om2.MDistance.uiUnit()),
+            'doubleAngle' : lambda plug: plug.asMAngle().asUnits(om2.MAngle.uiUnit()),
+            'time' : lambda plug: plug.asMTime().asUnits(om2.MTime.uiUnit()),
+            'string' : lambda plug: plug.asString(),
+        }
+
+        self._writers = {
+            'bool' : lambda mod, plug, value: mod.newPlugValueBool(plug, value),
+            'long' : lambda mod, plug, value: mod.newPlugValueInt(plug, value),
+            'short' : lambda mod, plug, value: mod.newPlugValueInt(plug, value),
+            'byte' : lambda mod, plug, value: mod.newPlugValueInt(plug, value),
+            'char' : lambda mod, plug, value: mod.newPlugValueInt(plug, value),
+            'enum' : lambda mod, plug, value: mod.newPlugValueInt(plug, value),
+            'float' : lambda mod, plug, value: mod.newPlugValueDouble(plug, value),
+            'double' : lambda mod, plug, value: mod.newPlugValueDouble(plug, value),
+            'doubleLinear' : lambda mod, plug, value: mod.newPlugValueMDistance(plug, om2.MDistance(value, om2.MDistance.uiUnit())),
+            'doubleAngle' : lambda mod, plug, value: mod.newPlugValueMAngle(plug, om2.MAngle(value, om2.MAngle.uiUnit())),
+            'time' : lambda mod, plug, value: mod.newPlugValueMTime(plug, om2.MTime(value, om2.MTime.uiUnit())),
+            'string' : lambda mod, plug, value: mod.newPlugValueString(plug, value),
+        }
+
+        self._array_data = {
+            'doubleArray' : (om2.MFnDoubleArrayData, om2.MDoubleArray),
+            'floatArray' : (om2.MFnFloatArrayData, om2.MFloatArray),
+            'Int32Array' : (om2.MFnIntArrayData, om2.MIntArray),
+            'vectorArray' : (om2.MFnVectorArrayData, om2.MVectorArray),
+            'pointArray' : (om2.MFnPointArrayData, om2.MPointArray),
+        }
+
+
+    def scene_path(self):
+        return self.cmds.file(query = True, sceneName = True) or ''
+
+
+    def iter_node_names(self, node_type = None):
+        #walk the DG without building the full ls() list or any PyNodes
+        om2 = self.om2
+        iterator = om2.MItDependencyNodes()
+        while not iterator.isDone():
+            mobject = iterator.thisNode()
+            fn_node = om2.MFnDependencyNode(mobject)
+            if node_type is None or fn_node.typeName == node_type:
+                if mobject.hasFn(om2.MFn.kDagNode):
+                    yield om2.MFnDagNode(mobject).partialPathName()
+                else:
+                    yield fn_node.name()
+
+            iterator.next()
+
+
+    def _plug_name(self, node, attr):
+        return '{0}.{1}'.format(self.node_name(node), attr)
+
+
+    def has_attr(self, node, attr):
+        return self.cmds.attributeQuery(_split_plug(attr)[0], node = self.node_name(node), exists = True)
+
+
+    def list_attrs(self, node):
+        return self.cmds.listAttr(self.node_name(node)) or []
+
+
+    def add_attr(self, node, long_name, **flags):
+        self.cmds.addAttr(self.node_name(node), ln = long_name, **flags)
+
+
+    def edit_attr(self, node, attr, **flags):
+        self.cmds.addAttr(self._plug_name(node, attr), edit = True, **flags)
+
+
+    def delete_attr(self, node, attr):
+        self.cmds.deleteAttr(self._plug_name(node, attr))
+
+
+    def get_attr_type(self, node, attr):
+        plug = self._plug_name(node, attr)
+        attr_type = self.cmds.addAttr(plug, query = True, attributeType = True)
+        if attr_type == 'typed':
+            return ('dt', (self.cmds.addAttr(plug, query = True, dataType = True) or ['typed'])[0])
+
+        return ('at', attr_type)
+
+
+    def list_children(self, node, attr):
+        return self.cmds.attributeQuery(attr, node = self.node_name(node), listChildren = True) or []
+
+
+    def get_attr(self, node, attr, attr_type = None):
+        value = self.cmds.getAttr(self._plug_name(node, attr))
+
+        #compounds are returned as [(x, y, z)]
+        if attr_type in COMPOUND_TYPES and isinstance(value, list) and value:
+            value = tuple(value[0])
+
+        return value
+
+
+    def set_attr(self, node, attr, value, data_type = None):
+        plug = self._plug_name(node, attr)
+        cmds = self.cmds
+        if data_type is None:
+            if isinstance(value, (tuple, list)):
+                cmds.setAttr(plug, *value)
+            else:
+                cmds.setAttr(plug, value)
+        elif data_type == 'string':
+            cmds.setAttr(plug, value, type = 'string')
+        elif data_type in ('doubleArray', 'floatArray', 'Int32Array'):
+            cmds.setAttr(plug, value, type = data_type)
+        elif data_type in ('stringArray', 'vectorArray', 'pointArray'):
+            cmds.setAttr(plug, len(value), *value, type = data_type)
+        else:
+            #matrix, float3, double2, etc.
+            cmds.setAttr(plug, *value, type = data_type)
+
+
+    def is_locked(self, node, attr):
+        return self.cmds.getAttr(self._plug_name(node, attr), lock = True)
+
+
+    def set_locked(self, node, attr, locked):
+        self.cmds.setAttr(self._plug_name(node, attr), lock = locked)
+
+
+    def get_multi_indices(self, node, attr):
+        return self.cmds.getAttr(self._plug_name(node, attr), multiIndices = True) or []
+
+
+    def remove_multi_instance(self, node, attr):
+        self.cmds.removeMultiInstance(self._plug_name(node, attr), b = True)
+
+
+    def list_connections(self, node, attr):
+        plug = self._plug_name(node, attr)
+        connections = []
+
+        incoming = self.cmds.listConnections(plug, source = True, destination = False, plugs = True, connections = True) or []
+        for i in range(0, len(incoming), 2):
+            connections.append( (incoming[i + 1], incoming[i]) )
+
+        outgoing = self.cmds.listConnections(plug, source = False, destination = True, plugs = True, connections = True) or []
+        for i in range(0, len(outgoing), 2):
+            connections.append( (outgoing[i], outgoing[i + 1]) )
+
+        return connections
+
+
+    def connect(self, source, destination):
+        if not self.cmds.isConnected(source, destination):
+            self.cmds.connectAttr(source, destination, force = True)
+
+
+    def copy_attrs(self, source_node, destination_node, attrs):
+        self.cmds.copyAttr(self.node_name(source_node), self.node_name(destination_node),
+                           attribute = attrs, ic = True, oc = True, values = True)
+
+
+    def read_multi_strings(self, attr, nodes = None):
+        #list every node with the attribute in one call, recursive so
+        #namespaced and referenced nodes are found too.
+        if nodes is None:
+            patterns = ['*.' + attr]
+        else:
+            patterns = [self._plug_name(node, attr) for node in nodes]
+
+        if not patterns:
+            return []
+
+        found_names = self.cmds.ls(*patterns, recursive = nodes is None, objectsOnly = True, long = True) or []
+        node_names = list(collections.OrderedDict.fromkeys(found_names))
+
+        plugs = self.om2.MSelectionList()
+        for node_name in node_names:
+            plugs.add('{0}.{1}'.format(node_name, attr))
+
+        found = []
+        for i, node_name in enumerate(node_names):
+            plug = plugs.getPlug(i)
+            elements = []
+            for j in range(plug.numElements()):
+                element = plug.elementByPhysicalIndex(j)
+                elements.append( (element.logicalIndex(), element.asString()) )
+
+            found.append( (node_name, elements) )
+
+        return found
+
+
+    def list_connections_many(self, plugs):
+        #two listConnections() calls, one per direction, for every plug
+        cmds = self.cmds
+        plugs = [(self.node_name(node), attr) for node, attr in plugs]
+        plug_names = ['{0}.{1}'.format(node_name, attr) for node_name, attr in plugs]
+        plug_names = cmds.ls(*plug_names) if plug_names else []
+        if not plug_names:
+            return []
+
+        #DAG nodes can share a short name, so plugs are matched by full path
+        paths = self._get_full_paths([node_name for node_name, attr in plugs])
+        lookup = {}
+        for i, (node_name, attr) in enumerate(plugs):
+            lookup[(paths[node_name], attr)] = i
+
+        found = []
+        for incoming in (True, False):
+            pairs = cmds.listConnections(plug_names, source = incoming, destination = not incoming,
+                                         connections = True, plugs = True, fullNodeName = True) or []
+            own_paths = self._get_full_paths([pairs[j].split('.', 1)[0] for j in range(0, len(pairs), 2)])
+            for j in range(0, len(pairs), 2):
+                own, other = pairs[j], pairs[j + 1]
+                node_name, attr = own.split('.', 1)
+                i = lookup.get( (own_paths[node_name], _split_plug(attr)[0]) )
+                if i is not None:
+                    found.append( (i, '{0}.{1}'.format(own_paths[node_name], attr), other, incoming) )
+
+        return found
+
+
+    def find_attrs(self, attrs, nodes = None):
+        #one ls() per attribute instead of a query per node and attribute
+        found = {}
+        for attr in attrs:
+            if nodes is None:
+                patterns = ['*.' + attr]
+            else:
+                patterns = [self._plug_name(node, attr) for node in nodes]
+
+            names = self.cmds.ls(*patterns, recursive = nodes is None, objectsOnly = True, long = True) if patterns else []
+            found[attr] = list(collections.OrderedDict.fromkeys(names or []))
+
+        return found
+
+
+    def _get_full_paths(self, node_names):
+        """Returns the full DAG path (or name) of each node name, keyed by name"""
+        om2 = self.om2
+        unique_names = list(collections.OrderedDict.fromkeys(node_names))
+        paths = {}
+        for node_name, mobject in zip(unique_names, self._get_mobjects(unique_names)):
+            if mobject.hasFn(om2.MFn.kDagNode):
+                paths[node_name] = om2.MDagPath.getAPathTo(mobject).fullPathName()
+            else:
+                paths[node_name] = om2.MFnDependencyNode(mobject).name()
+
+        return paths
+
+
+    def _get_mobjects(self, node_names):
+        unique_names = list(collections.OrderedDict.fromkeys(node_names))
+
+        selection = self.om2.MSelectionList()
+        for node_name in unique_names:
+            selection.add(node_name)
+
+        mobjects = dict((node_name, selection.getDependNode(i)) for i, node_name in enumerate(unique_names))
+        return [mobjects[node_name] for node_name in node_names]
+
+
+    def _read_mplug(self, node, plug, entry):
+        reader = self._readers.get(entry.attr_type)
+        if reader is not None:
+            return reader(plug)
+
+        child_type = NUMERIC_CHILD_TYPES.get(entry.attr_type)
+        if entry.type_flag == 'at' and child_type is not None:
+            reader = self._readers[child_type]
+            return tuple(reader(plug.child(i)) for i in range(plug.numChildren()))
+
+        return self.read_value(node, entry)
+
+
+    def resolve_plug(self, node, attr):
+        node_name = self.node_name(node)
+        selection = self.om2.MSelectionList()
+        selection.add('{0}.{1}'.format(node_name, attr))
+        return (node_name, selection.getPlug(0))
+
+
+    def read_plug(self, resolved, entry):
+        return self._read_mplug(resolved[0], resolved[1], entry)
+
+
+    def read_columns(self, nodes, entries):
+        node_names = [self.node_name(node) for node in nodes]
+        columns = [[] for entry in entries]
+
+        for node_name, mobject in zip(node_names, self._get_mobjects(node_names)):
+            fn_node = self.om2.MFnDependencyNode(mobject)
+            for column, entry in zip(columns, entries):
+                try:
+                    plug = fn_node.findPlug(entry.name, False)
+                except RuntimeError:
+                    self.error('udata Module: {0} has no attribute {1}'.format(node_name, entry.name))
+
+                column.append( self._read_mplug(node_name, plug, entry) )
+
+        return columns
+
+
+    def _get_writer(self, entry):
+        """Returns a function that queues a value on an MDGModifier, else None"""
+        writer = self._writers.get(entry.attr_type)
+        if writer is not None:
+            return writer
+
+        child_type = NUMERIC_CHILD_TYPES.get(entry.attr_type)
+        if entry.type_flag == 'at' and child_type is not None:
+            child_writer = self._writers[child_type]
+            def write_children(mod, plug, value):
+                for i, child_value in enumerate(value):
+                    child_writer(mod, plug.child(i), child_value)
+
+            return write_children
+
+        return None
+
+
+    def write_columns(self, nodes, entries, columns):
+        #an MDGModifier isn't on the undo queue, so it's only used when
+        #undo is off, ie. write_table(undoable = False)
+        if self.cmds.undoInfo(query = True, state = True):
+            super(CmdsBackend, self).write_columns(nodes, entries, columns)
+            return
+
+        writers = [self._get_writer(entry) for entry in entries]
+        node_names = [self.node_name(node) for node in nodes]
+        modifier = self.om2.MDGModifier()
+
+        for i, (node_name, mobject) in enumerate(zip(node_names, self._get_mobjects(node_names))):
+            fn_node = self.om2.MFnDependencyNode(mobject)
+            for entry, column, writer in zip(entries, columns, writers):
+                if writer is None:
+                    self.write_value(node_name, entry, column[i])
+                    continue
+
+                try:
+                    plug = fn_node.findPlug(entry.name, False)
+                except RuntimeError:
+                    self.error('udata Module: {0} has no attribute {1}'.format(node_name, entry.name))
+
+                writer(modifier, plug, column[i])
+
+        modifier.doIt()
+
+
+    def read_array(self, node, entry):
+        #OpenMaya arrays don't expose their buffer, so the elements are
+        #copied once straight into numpy without building pymel Vectors.
+        dtype, width = ARRAY_TYPES[entry.attr_type]
+        plug = self.resolve_plug(node, entry.name)[1]
+        try:
+            data = plug.asMObject()
+        except RuntimeError:
+            #the attribute has never been set
+            return as_array(entry.attr_type, [])
+
+        fn_class, array_class = self._array_data[entry.attr_type]
+        values = fn_class(data).array()
+        array = numpy.array(values, dtype = dtype) if len(values) else numpy.empty((0, width), dtype)
+        return array.reshape(-1, width) if width > 1 else array
+
+
+    def write_array(self, node, entry, array, undoable = True):
+        if undoable:
+            super(CmdsBackend, self).write_array(node, entry, array)
+        else:
+            self.write_array_chunks(node, entry, [array])
+
+
+    def write_array_chunks(self, node, entry, chunks):
+        #the om2 array is built from the plain lists in one call, instead of
+        #appending one converted MVector/MPoint/float per element
+        fn_class, array_class = self._array_data[entry.attr_type]
+        values = []
+        for chunk in chunks:
+            values.extend(as_array(entry.attr_type, chunk).tolist())
+
+        plug = self.resolve_plug(node, entry.name)[1]
+        plug.setMObject(fn_class().create(array_class(values)))
+
+
+
+class MemoryNode(object):
+    """A node of the MemoryBackend"""
+
+    def __init__(self, name, node_type):
+        super(MemoryNode, self).__init__()
+
+        self.name = name
+        self.node_type = node_type
+        self.attrs = collections.OrderedDict()
+        self.parent = None
+        self.exists = True
+
+
+    def path(self):
+        """Returns the '|parent|name' DAG path of the node"""
+        path = '|' + self.name
+        return self.parent.path() + path if self.parent is not None else path
+
+
+    def __repr__(self):
+        return 'MemoryNode({0!r})'.format(self.name)
+
+
+    def __str__(self):
+        return self.name
+
+
+    def __lt__(self, other):
+        return self.name < str(other)
+
+
+
+class MemoryAttr(object):
+    """An attribute of a MemoryNode"""
+
+    def __init__(self, name, type_flag, attr_type, parent, child_count, multi, flags):
+        super(MemoryAttr, self).__init__()
+
+        self.name = name
+        self.type_flag = type_flag
+        self.attr_type = attr_type
+        self.parent = parent
+        self.child_count = child_count
+        self.children = []
+        self.multi = multi
+        self.flags = flags
+        self.locked = False
+        self.elements = {}
+        self.element_locks = set()
+        self.value = self.get_default()
+
+
+    def get_default(self):
+        default = self.flags.get('dv', self.flags.get('defaultValue'))
+        if self.type_flag == 'dt':
+            if self.attr_type in NUMERIC_CHILD_TYPES:
+                return (0,) * int(self.attr_type[-1])
+            if self.attr_type == 'matrix':
+                return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+            return None
+
+        if self.attr_type == 'message':
+            return None
+        if self.attr_type == 'bool':
+            return bool(default)
+
+        return default if default is not None else 0
+
+
+
+class MemoryPlug(object):
+    """A pymel Attribute like object for the attributes of a MemoryBackend"""
+
+    def __init__(self, backend, node, attr):
+        super(MemoryPlug, self).__init__()
+
+        self._backend = backend
+        self._node = node
+        self._attr = attr
+
+
+    def __repr__(self):
+        return 'MemoryPlug({0!r})'.format(self.name())
+
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryPlug) and other._node is self._node and other._attr == self._attr
+
+
+    def __hash__(self):
+        return hash((id(self._node), self._attr))
+
+
+    def __getitem__(self, index):
+        return MemoryPlug(self._backend, self._node, '{0}[{1}]'.format(self._attr, index))
+
+
+    def name(self):
+        return '{0}.{1}'.format(self._node.name, self._attr)
+
+
+    def attrName(self, longName = True):
+        return self._attr
+
+
+    def node(self):
+        return self._node
+
+
+    def attr(self, attr):
+        return MemoryPlug(self._backend, self._node, attr)
+
+
+    def exists(self):
+        return self._node.exists and self._backend.has_attr(self._node, self._attr)
+
+
+    def get(self):
+        return self._backend.get_attr(self._node, self._attr)
+
+
+    def set(self, *value, **kwargs):
+        value = value[0] if len(value) == 1 else value
+        self._backend.set_attr(self._node, self._attr, value, kwargs.get('type'))
+
+
+    def lock(self):
+        self._backend.set_locked(self._node, self._attr, True)
+
+
+    def unlock(self):
+        self._backend.set_locked(self._node, self._attr, False)
+
+
+    def isLocked(self):
+        return self._backend.is_locked(self._node, self._attr)
+
+
+    def getArrayIndices(self):
+        return self._backend.get_multi_indices(self._node, self._attr)
+
+
+    def getChildren(self):
+        return [self.attr(child) for child in self._backend.list_children(self._node, self._attr)]
+
+
+
+class MemoryIndexHook(IndexHook):
+    """Reports MemoryBackend node changes to the SceneIndex"""
+
+    def __init__(self, backend):
+        super(MemoryIndexHook, self).__init__()
+        self._backend = backend
+        self.index = None
+
+
+    def install(self, index):
+        self.index = index
+        self._backend._hooks.append(self)
+
+
+    def uninstall(self):
+        if self in self._backend._hooks:
+            self._backend._hooks.remove(self)
+
+        self.index = None
+
+
+
+class MemoryJournalHook(JournalHook):
+    """Reports MemoryBackend attribute edits to the ChangeJournal"""
+
+    def __init__(self, backend):
+        super(MemoryJournalHook, self).__init__()
+        self._backend = backend
+        self._watched = set()
+        self.journal = None
+
+
+    def install(self, journal):
+        self.journal = journal
+        self._backend._journal_hooks.append(self)
+
+
+    def uninstall(self):
+        if self in self._backend._journal_hooks:
+            self._backend._journal_hooks.remove(self)
+
+        self._watched = set()
+        self.journal = None
+
+
+    def watch(self, node):
+        self._watched.add(node)
+
+
+    def attribute_changed(self, node, attr, action = 'set'):
+        if node in self._watched:
+            self.journal.attribute_changed(node.name, _split_plug(attr)[0], action)
+
+
+
+class MemoryBackend(Backend):
+    """A pure-Python stand-in for Maya's dependency graph
+
+    The backend models nodes, dynamic attributes (including compounds and
+    multis), values, locks and connections closely enough to exercise the
+    whole udata module. Like Maya, children can't be added to a compound
+    that already has all of its children and children of a compound can't
+    be deleted on their own. Node names are unique. A node created with a
+    parent (-p) can also be found by its '|parent|name' path.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        super(MemoryBackend, self).__init__()
+        self._hooks = []
+        self._journal_hooks = []
+        self.new_scene()
+
+
+    def new_scene(self, path = ''):
+        """Remove every node, like File > New
+
+        Args:
+            path (str, optional) : The file path scene_path() reports.
+        """
+        self._nodes = collections.OrderedDict()
+        self._connections = set()
+        self._selection = []
+        self._scene_path = path
+        self.deferred = []
+        """Functions passed to defer() that run_deferred() hasn't run yet"""
+
+        for hook in self._hooks:
+            hook.index.invalidate()
+
+
+    def save_scene(self, path):
+        """Change the path scene_path() reports, like File > Save As"""
+        self._scene_path = path
+
+
+    def create_index_hook(self):
+        return MemoryIndexHook(self)
+
+
+    def create_journal_hook(self):
+        return MemoryJournalHook(self)
+
+
+    def scene_path(self):
+        return self._scene_path
+
+
+    def defer(self, func):
+        self.deferred.append(func)
+
+
+    def run_deferred(self, limit = None):
+        """Run the deferred functions, like Maya does when it's idle
+
+        Functions deferred while running are run too, up to limit calls.
+
+        Returns:
+            int : How many functions were run.
+        """
+        count = 0
+        while self.deferred and (limit is None or count < limit):
+            self.deferred.pop(0)()
+            count += 1
+
+        return count
+
+
+    def iter_node_names(self, node_type = None):
+        for node in list(self._nodes.values()):
+            if node_type is None or node.node_type == node_type:
+                yield node.name
+
+
+    def select(self, nodes):
+        """Replace the selection that ls(sl=True) returns"""
+        self._selection = list(nodes)
+
+###----Nodes----
+
+    def ls(self, *args, **kwargs):
+        if kwargs.get('sl') or kwargs.get('selection'):
+            nodes = [node for node in self._selection if node.exists]
+        else:
+            nodes = list(self._nodes.values())
+
+        node_type = kwargs.get('type') or kwargs.get('typ')
+        if node_type:
+            nodes = [node for node in nodes if node.node_type == node_type]
+
+        if args:
+            patterns = []
+            for arg in args:
+                patterns.extend(arg if isinstance(arg, (list, tuple)) else [arg])
+
+            nodes = [node for node in nodes
+                     if any(pattern is node or fnmatch.fnmatchcase(node.name, str(pattern)) for pattern in patterns)]
+
+        return nodes
+
+
+    def create_node(self, node_type, **kwargs):
+        name = _pop_flag(kwargs, 'n', 'name') or node_type + '1'
+        parent = _pop_flag(kwargs, 'p', 'parent')
+        if parent is not None:
+            parent = self._get_node(parent)
+
+        if name in self._nodes:
+            base = name.rstrip('0123456789')
+            i = 1
+            while '{0}{1}'.format(base, i) in self._nodes:
+                i += 1
+
+            name = '{0}{1}'.format(base, i)
+
+        node = MemoryNode(name, node_type)
+        node.parent = parent
+        node.attrs['message'] = MemoryAttr('message', 'at', 'message', None, None, False, {})
+        self._nodes[name] = node
+
+        for hook in self._hooks:
+            hook.index.node_added(node)
+
+        return node
+
+
+    def delete_node(self, node):
+        node = self._get_node(node)
+        self._connections = set(connection for connection in self._connections
+                                if self._plug_node(connection[0]) != node.name
+                                and self._plug_node(connection[1]) != node.name)
+        node.exists = False
+        del self._nodes[node.name]
+
+        for hook in self._hooks:
+            hook.index.node_removed(node)
+
+
+    def to_node(self, node_name):
+        return self._get_node(node_name)
+
+
+    def node_name(self, node):
+        return node.name if isinstance(node, MemoryNode) else str(node)
+
+
+    def node_exists(self, node):
+        if isinstance(node, MemoryNode):
+            return node.exists
+
+        node = str(node)
+        if '|' not in node:
+            return node in self._nodes
+
+        found = self._nodes.get(node.split('|')[-1])
+        if found is None:
+            return False
+
+        path = found.path()
+        return path == node if node.startswith('|') else path.endswith('|' + node)
+
+
+    def _get_node(self, node):
+        if isinstance(node, MemoryNode):
+            if not node.exists:
+                self.error('Node "{0}" no longer exists'.format(node.name))
+            return node
+
+        name = str(node).split('|')[-1]
+        if name not in self._nodes:
+            self.error('No object matches name: {0}'.format(node))
+
+        return self._nodes[name]
+
+
+    def _get_attr(self, node, attr):
+        node = self._get_node(node)
+        name, index = _split_plug(attr)
+        if name not in node.attrs:
+            self.error('No attribute "{0}" on "{1}"'.format(name, node.name))
+
+        return (node, node.attrs[name], index)
+
+###----Attributes----
+
+    def plug(self, node, attr):
+        return MemoryPlug(self, self._get_node(node), attr)
+
+
+    def has_attr(self, node, attr):
+        return _split_plug(attr)[0] in self._get_node(node).attrs
+
+
+    def list_attrs(self, node):
+        return list(self._get_node(node).attrs)
+
+
+    def add_attr(self, node, long_name, **flags):
+        node = self._get_node(node)
+        if long_name in node.attrs:
+            self.error('Attribute "{0}" already exists on "{1}"'.format(long_name, node.name))
+
+        at = _pop_flag(flags, 'at', 'attributeType')
+        dt = _pop_flag(flags, 'dt', 'dataType')
+        parent = _pop_flag(flags, 'p', 'parent')
+        child_count = _pop_flag(flags, 'nc', 'numberOfChildren')
+        multi = bool(_pop_flag(flags, 'm', 'multi'))
+
+        if at in COMPOUND_TYPES and child_count is None:
+            self.error('Compound attribute "{0}" needs a child count'.format(long_name))
+
+        if parent:
+            if parent not in node.attrs:
+                self.error('Parent attribute "{0}" doesn\'t exist'.format(parent))
+
+            parent_attr = node.attrs[parent]
+            if parent_attr.child_count is None or len(parent_attr.children) >= parent_attr.child_count:
+                self.error('Compound "{0}" already has all of its children'.format(parent))
+
+            parent_attr.children.append(long_name)
+
+        type_flag = 'dt' if dt else 'at'
+        node.attrs[long_name] = MemoryAttr(long_name, type_flag, dt or at or 'double',
+                                           parent, child_count, multi, flags)
+
+
+    def edit_attr(self, node, attr, **flags):
+        node, memory_attr, index = self._get_attr(node, attr)
+        memory_attr.flags.update(flags)
+
+
+    def delete_attr(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if memory_attr.parent:
+            self.error('Can\'t delete "{0}", it\'s the child of a compound'.format(attr))
+
+        names = set()
+        pending = [memory_attr.name]
+        while pending:
+            name = pending.pop()
+            names.add(name)
+            pending.extend(node.attrs[name].children)
+
+        for name in names:
+            del node.attrs[name]
+
+        self._connections = set(connection for connection in self._connections
+                                if not any(self._plug_node(plug) == node.name and
+                                           _split_plug(plug)[0] in names for plug in connection))
+
+
+    def get_attr_type(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        return (memory_attr.type_flag, memory_attr.attr_type)
+
+
+    def list_children(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        return list(memory_attr.children)
+
+
+    def get_attr(self, node, attr, attr_type = None):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if memory_attr.children:
+            return tuple(self.get_attr(node, child) for child in memory_attr.children)
+
+        if memory_attr.multi:
+            if index is None:
+                return [memory_attr.elements[i] for i in sorted(memory_attr.elements)]
+
+            return memory_attr.elements.get(index, memory_attr.get_default())
+
+        value = memory_attr.value
+        return list(value) if isinstance(value, list) else value
+
+
+    def set_attr(self, node, attr, value, data_type = None):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if self.is_locked(node, attr):
+            self.error('The attribute "{0}.{1}" is locked'.format(node.name, attr))
+
+        if data_type and memory_attr.type_flag == 'dt' and data_type != memory_attr.attr_type:
+            self.error('"{0}" is not a {1} attribute'.format(attr, data_type))
+
+        if memory_attr.children:
+            for child, child_value in zip(memory_attr.children, value):
+                self.set_attr(node, child, child_value)
+        elif memory_attr.multi:
+            if index is None:
+                self.error('"{0}" is a multi attribute, set an element instead'.format(attr))
+
+            memory_attr.elements[index] = value
+        elif isinstance(value, (list, tuple)) and memory_attr.type_flag == 'dt':
+            memory_attr.value = tuple(value) if memory_attr.attr_type in NUMERIC_CHILD_TYPES else list(value)
+        else:
+            memory_attr.value = value
+
+        for hook in self._journal_hooks:
+            hook.attribute_changed(node, attr)
+
+
+    def is_locked(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if index is not None:
+            return index in memory_attr.element_locks
+
+        return memory_attr.locked
+
+
+    def set_locked(self, node, attr, locked):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if index is None:
+            memory_attr.locked = locked
+        elif locked:
+            memory_attr.element_locks.add(index)
+        else:
+            memory_attr.element_locks.discard(index)
+
+
+    def get_multi_indices(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        return sorted(memory_attr.elements)
+
+
+    def remove_multi_instance(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        if index in memory_attr.element_locks:
+            self.error('The attribute "{0}.{1}" is locked'.format(node.name, attr))
+
+        memory_attr.elements.pop(index, None)
+        plug = '{0}.{1}'.format(node.name, attr)
+        self._connections = set(connection for connection in self._connections if plug not in connection)
+
+
+    @staticmethod
+    def _plug_node(plug):
+        return plug.split('.', 1)[0]
+
+
+    def _get_names(self, node, attr):
+        names = set()
+        pending = [_split_plug(attr)[0]]
+        while pending:
+            name = pending.pop()
+            names.add(name)
+            pending.extend(node.attrs[name].children)
+
+        return names
+
+
+    def list_connections(self, node, attr):
+        node, memory_attr, index = self._get_attr(node, attr)
+        names = self._get_names(node, attr)
+
+        connections = []
+        for connection in sorted(self._connections):
+            for plug in connection:
+                if self._plug_node(plug) == node.name and _split_plug(plug)[0] in names:
+                    connections.append(connection)
+                    break
+
+        return connections
+
+
+    def connect(self, source, destination):
+        plugs = []
+        for plug in (source, destination):
+            node_name, attr = plug.split('.', 1)
+            plugs.append( (self._get_attr(node_name, attr)[0], attr) )
+
+        #like connectAttr -force, an input replaces any existing input
+        self._connections = set(connection for connection in self._connections if connection[1] != destination)
+        self._connections.add( (source, destination) )
+
+        for hook in self._journal_hooks:
+            for node, attr in plugs:
+                hook.attribute_changed(node, attr, 'connect')
+
+
+    def copy_attrs(self, source_node, destination_node, attrs):
+        source_node = self._get_node(source_node)
+        destination_node = self._get_node(destination_node)
+
+        for attr in attrs:
+            source, source_attr, index = self._get_attr(source_node, attr)
+            if attr not in destination_node.attrs:
+                continue
+
+            destination_attr = destination_node.attrs[attr]
+            if not source_attr.children:
+                destination_attr.value = source_attr.value
+                destination_attr.elements = dict(source_attr.elements)
+
+            for connection in list(self._connections):
+                source_plug = '{0}.{1}'.format(source_node.name, attr)
+                destination_plug = '{0}.{1}'.format(destination_node.name, attr)
+                if connection[1] == source_plug:
+                    self.connect(connection[0], destination_plug)
+                elif connection[0] == source_plug:
+                    self.connect(destination_plug, connection[1])
@@ -0,0 +1,345 @@
+"""Benchmarks for the udata module that run without Maya
+
+Each case builds a scene on a fresh MemoryBackend, wraps it in a
+CountingBackend and times one udata operation while counting the backend
+(DG) calls the operation makes. Cases are swept over the number of nodes,
+the number of BaseData classes and the nesting depth of Compound
+attributes, so the results show how each operation scales.
+
+Running the default sweep and saving the results might look like this:
+
+    python -m cg3dguru.udata.benchmark -o udata_bench.json
+
+and a later run can be compared against the saved results with:
+
+    python -m cg3dguru.udata.benchmark --nodes 1000 10000 --baseline udata_bench.json
+
+Call counts are deterministic, so any change in them between two runs is a
+real change in how much work udata asks of the DG.
+"""
+
+__author__ = "Nathaniel Albright"
+__email__ = "developer@3dcg.guru"
+
+
+import argparse
+import collections
+import gc
+import json
+import math
+import platform
+import sys
+import time
+
+from . import core
+from .backend import MemoryBackend
+
+
+OPERATIONS = ['add_data', 'get_data', 'update_version', 'get_nodes_with_data',
+              'validate_version', 'find_attribute_conflicts']
+"""The benchmarked operations, in the order each case runs them"""
+
+DEFAULT_NODES = [1000, 10000, 100000]
+DEFAULT_CLASSES = [1, 4]
+DEFAULT_DEPTHS = [0, 2]
+
+
+
+class CountingBackend(object):
+    """Wraps a Backend and counts how many times each method is called
+
+    Only the calls udata makes are counted. Calls a backend makes to itself
+    (ie. a bulk read built on get_attr()) count as the one call udata made.
+    """
+
+    def __init__(self, backend):
+        super(CountingBackend, self).__init__()
+
+        self.backend = backend
+        self.counts = collections.Counter()
+
+
+    def __getattr__(self, name):
+        value = getattr(self.backend, name)
+        if not callable(value) or name.startswith('_'):
+            return value
+
+        counts = self.counts
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return value(*args, **kwargs)
+
+        return counted
+
+
+    def reset(self):
+        """Clear the counts and return what they were"""
+        counts = dict(self.counts)
+        self.counts.clear()
+        return counts
+
+
+
+def _make_nest(prefix, depth):
+    children = [core.Attr('{0}_leaf{1}'.format(prefix, depth), 'double')]
+    if depth > 1:
+        children.append(_make_nest(prefix, depth - 1))
+
+    return core.Compound('{0}_nest{1}'.format(prefix, depth), 'compound', children = children)
+
+
+def make_classes(count, depth):
+    """Create BaseData sub-classes with unique attribute names
+
+    Each class has a long, string, float3 and message attribute plus a
+    chain of Compounds nested depth levels deep.
+    """
+    classes = []
+    for i in range(count):
+        prefix = 'bench{0}'.format(i)
+
+        def get_attributes(cls, prefix = prefix):
+            attrs = [core.Attr(prefix + '_count', 'long'),
+                     core.Attr(prefix + '_label', 'string'),
+                     core.Compound(prefix + '_pos', 'float3'),
+                     core.Attr(prefix + '_link', 'message')]
+            if cls._depth:
+                attrs.append(_make_nest(prefix, cls._depth))
+
+            return attrs
+
+        def get_class_version(cls):
+            return cls._version
+
+        members = {'_depth': depth, '_version': (1, 0, 0), 'attributes': [],
+                   'get_attributes': classmethod(get_attributes),
+                   'get_class_version': classmethod(get_class_version)}
+        classes.append( type('BenchData{0}'.format(i), (core.BaseData,), members) )
+
+    return classes
+
+
+def _bump_versions(classes):
+    for data_class in classes:
+        major, minor, patch = data_class._version
+        data_class._version = (major, minor + 1, patch)
+
+
+def _timed(backend, func):
+    backend.reset()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return (elapsed, backend.reset())
+
+
+def run_case(node_count, class_count, depth, backend_factory = MemoryBackend):
+    """Time every operation against one scene
+
+    Args:
+        node_count (int) : How many nodes carry data.
+        class_count (int) : How many BaseData classes are on each node.
+        depth (int) : How deeply Compound attributes are nested.
+        backend_factory (callable, optional) : Returns the Backend to run
+        the case on. It must start with an empty scene.
+
+    Returns:
+        list : One result dict per operation.
+    """
+    backend = CountingBackend(backend_factory())
+    core.set_backend(backend)
+
+    classes = make_classes(class_count, depth)
+    nodes = [backend.backend.create_node(core.DEFAULT_NODE_TYPE) for i in range(node_count)]
+
+    def add_data():
+        for data_class in classes:
+            for node in nodes:
+                data_class.add_data(node)
+
+    def get_data():
+        for data_class in classes:
+            for node in nodes:
+                data_class.get_data(node)
+
+    def update_version():
+        _bump_versions(classes)
+        for data_class in classes:
+            data_class.update_version_many(nodes)
+
+    def get_nodes_with_data():
+        core._scene_index.invalidate()
+        for data_class in classes:
+            core.Utils.get_nodes_with_data(data_class = data_class)
+
+    def validate_version():
+        _bump_versions(classes)
+        core._scene_index.invalidate()
+        core.Utils.validate_version()
+
+    def find_attribute_conflicts():
+        core.Utils.find_attribute_conflicts(error_on_conflict = False)
+
+    functions = {'add_data': add_data, 'get_data': get_data, 'update_version': update_version,
+                 'get_nodes_with_data': get_nodes_with_data, 'validate_version': validate_version,
+                 'find_attribute_conflicts': find_attribute_conflicts}
+    results = []
+    for operation in OPERATIONS:
+        elapsed, calls = _timed(backend, functions[operation])
+        results.append({'operation': operation, 'nodes': node_count, 'classes': class_count,
+                        'depth': depth, 'seconds': elapsed, 'calls': calls,
+                        'total_calls': sum(calls.values())})
+
+    for data_class in classes:
+        core.Utils.get_registry().unregister(data_class)
+
+    return results
+
+
+def _get_exponent(points):
+    """The least squares slope of log(seconds) over log(nodes)"""
+    points = [(math.log(n), math.log(seconds)) for n, seconds in points if n > 0 and seconds > 0]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    denominator = sum((x - mean_x) ** 2 for x, y in points)
+    return numerator / denominator if denominator else None
+
+
+def get_curves(results):
+    """Group results into per operation scaling curves over the node count
+
+    Returns:
+        dict : {operation: {'classes=M,depth=D': curve}} where each curve
+        has its [nodes, seconds, total calls] points and the fitted
+        exponent (1.0 is linear, 2.0 is quadratic).
+    """
+    curves = {}
+    for result in results:
+        key = 'classes={0},depth={1}'.format(result['classes'], result['depth'])
+        curve = curves.setdefault(result['operation'], {}).setdefault(key, {'points': []})
+        curve['points'].append([result['nodes'], result['seconds'], result['total_calls']])
+
+    for series in curves.values():
+        for curve in series.values():
+            curve['points'].sort()
+            curve['exponent'] = _get_exponent([(n, seconds) for n, seconds, calls in curve['points']])
+
+    return curves
+
+
+def run(nodes = None, classes = None, depths = None, backend_factory = MemoryBackend, log = None):
+    """Run the benchmark sweep
+
+    Args:
+        nodes (int list, optional) : The node counts to sweep.
+        classes (int list, optional) : The class counts to sweep.
+        depths (int list, optional) : The Compound nesting depths to sweep.
+        backend_factory (callable, optional) : See run_case().
+        log (file, optional) : A stream to write progress to.
+
+    Returns:
+        dict : The JSON serializable results.
+    """
+    nodes = nodes or DEFAULT_NODES
+    classes = classes or DEFAULT_CLASSES
+    depths = depths or DEFAULT_DEPTHS
+
+    #benchmarks shouldn't leave udata pointed at the benchmark scene
+    previous = (core._backend, core.AUTO_UPDATE, core.REPORT_WARNINGS)
+    core.AUTO_UPDATE = True
+    core.REPORT_WARNINGS = False
+
+    results = []
+    try:
+        for class_count in classes:
+            for depth in depths:
+                for node_count in nodes:
+                    if log:
+                        log.write('nodes={0} classes={1} depth={2}\n'.format(node_count, class_count, depth))
+
+                    results.extend(run_case(node_count, class_count, depth, backend_factory))
+
+                    core.BaseData._schema_plans = {}
+                    gc.collect()
+    finally:
+        core.set_backend(previous[0])
+        core.AUTO_UPDATE, core.REPORT_WARNINGS = previous[1:]
+
+    return {'udata_version': core.__version__,
+            'python': platform.python_version(),
+            'backend': getattr(backend_factory, 'name', str(backend_factory)),
+            'results': results,
+            'curves': get_curves(results)}
+
+
+def compare(baseline, current, threshold = 0.25):
+    """Find the cases that got slower or make more calls than the baseline
+
+    Args:
+        baseline (dict) : Results from an earlier run().
+        current (dict) : Results from this run().
+        threshold (float, optional) : How much slower (0.25 = 25%) a case
+        can get before it's reported. Any increase in calls is reported.
+
+    Returns:
+        list : A message for each regression.
+    """
+    def key(result):
+        return (result['operation'], result['nodes'], result['classes'], result['depth'])
+
+    old_results = dict((key(result), result) for result in baseline['results'])
+
+    messages = []
+    for result in current['results']:
+        old = old_results.get(key(result))
+        if old is None:
+            continue
+
+        case = '{0} nodes={1} classes={2} depth={3}'.format(*key(result))
+        if result['total_calls'] > old['total_calls']:
+            messages.append('{0} : calls {1} -> {2}'.format(case, old['total_calls'], result['total_calls']))
+
+        if old['seconds'] and result['seconds'] > old['seconds'] * (1.0 + threshold):
+            messages.append('{0} : {1:.3f}s -> {2:.3f}s'.format(case, old['seconds'], result['seconds']))
+
+    return messages
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Benchmark the udata module on an in-memory scene.')
+    parser.add_argument('--nodes', type=int, nargs='+', default=DEFAULT_NODES, help='node counts to sweep')
+    parser.add_argument('--classes', type=int, nargs='+', default=DEFAULT_CLASSES, help='class counts to sweep')
+    parser.add_argument('--depths', type=int, nargs='+', default=DEFAULT_DEPTHS, help='Compound nesting depths to sweep')
+    parser.add_argument('-o', '--output', help='JSON output file (defaults to stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before a case is reported')
+    args = parser.parse_args(argv)
+
+    results = run(args.nodes, args.classes, args.depths, log = sys.stderr)
+    text = json.dumps(results, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as stream:
+            messages = compare(json.load(stream), results, args.threshold)
+
+        for message in messages:
+            sys.stderr.write('REGRESSION ' + message + '\n')
+
+        return 1 if messages else 0
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
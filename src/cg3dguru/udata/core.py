@@ -29,7 +29,28 @@ VERSION = (0, 9, 0)
 __version__ = '.'.join(map(str, VERSION))
 
 
-import pymel.core as pm
+import base64
+import bisect
+import collections
+import contextlib
+import gzip
+import heapq
+import json
+import lzma
+import os
+import re
+import time
+import zlib
+
+from .backend import (Backend, PymelBackend, CmdsBackend, MemoryBackend,
+                      IndexHook, MayaIndexHook, JournalHook, MayaJournalHook,
+                      ARRAY_TYPES, as_array)
+from .store import ExternalStore, MemoryStore, SqliteStore, PackStore, open_store
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #Don't change _RECORDS_NAME unless your project really desires an alternative
 #name for the life of all scripts and tools that leverage the udata module
@@ -52,11 +73,161 @@ BaseData.pre_update_version().
 REPORT_WARNINGS = True
 """Should this module throw warnings?"""
 
+USE_SCENE_INDEX = True
+"""Should Utils queries be answered from the in-memory scene index?
+
+The index remembers which nodes carry which BaseData records so repeated
+queries don't need to inspect every node in the scene. Set this to False
+to always inspect the scene directly.
+"""
+
+USE_INDEX_NODE = False
+"""Should the scene index also be saved on a node in the scene?
+
+When True, an IndexNode connects every node that carries data to a single
+'udataIndex' node. The first query after a scene is opened then only
+inspects the indexed nodes instead of every node in the scene.
+"""
+
+DEFER_UPDATES = False
+"""Should outdated data be updated when Maya is idle instead of straight away?
+
+When True, BaseData.get_data() puts outdated data on the UpgradeQueue
+(see Utils.get_upgrade_queue()) which updates it in small batches through
+Backend.defer(), so the first tool to touch an old scene doesn't stall.
+"""
+
+READ_OLD_DATA = True
+"""While an update is deferred, should get_data() return the outdated data?
+
+Only used when DEFER_UPDATES is True. When False, get_data() updates the
+data it's asked for on the spot, so only data found by scans is deferred.
+"""
+
+STREAM_FORMAT = 'udata-stream'
+"""The format name in the header of Utils.export_stream() files"""
+
+STREAM_FORMAT_VERSION = 1
+"""The version of the Utils.export_stream() file layout"""
+
 class VersionUpdateException(Exception):
     """Thrown when BaseData.update_version() errors"""
     pass
 
 
+_backend = None
+
+
+def get_backend():
+    """Returns the Backend that udata reads and writes the scene with
+
+    A CmdsBackend is created the first time the backend is needed.
+    """
+    global _backend
+    if _backend is None:
+        _backend = CmdsBackend()
+
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the Backend that udata reads and writes the scene with
+
+    Cached records and the scene index belong to the old backend's scene,
+    so they're discarded and the index hook is re-installed from the new
+    backend on the next query. An enabled ChangeJournal keeps its entries
+    and moves to the new backend's journal hook.
+
+    Args:
+        backend (udata.Backend) : ie. udata.MemoryBackend() to work without
+        Maya.
+    """
+    global _backend
+    _scene_index.set_hook(None)
+    journaling = _journal.is_enabled()
+    _journal.disable()
+
+    _backend = backend
+    if journaling:
+        _journal.enable()
+
+
+_external_store = None
+_external_store_auto = False
+
+
+def get_external_store():
+    """Returns the ExternalStore that External attributes are stored in
+
+    Unless set_external_store() was called, a SqliteStore is opened next to
+    the current scene file (ie. shot010.udata.sqlite next to shot010.ma)
+    and it follows the scene when another scene is opened.
+    """
+    global _external_store, _external_store_auto
+    scene_path = get_backend().scene_path()
+
+    if _external_store is None or _external_store_auto:
+        if not scene_path:
+            _error('udata Module: Save the scene or call set_external_store() before using External attributes')
+
+        path = os.path.splitext(scene_path)[0] + '.udata.sqlite'
+        if _external_store is None or _external_store.path != path:
+            if _external_store is not None:
+                _external_store.close()
+
+            _external_store = SqliteStore(path)
+            _external_store_auto = True
+
+    return _external_store
+
+
+_external_fallbacks = {}
+"""Stores opened from the location saved with a key, keyed by location"""
+
+
+def _get_fallback_store(location):
+    """Returns the store at the location a key was written to, else None"""
+    if not location:
+        return None
+
+    if location not in _external_fallbacks:
+        _external_fallbacks[location] = open_store(location)
+
+    return _external_fallbacks[location]
+
+
+def set_external_store(store):
+    """Replace the ExternalStore that External attributes are stored in
+
+    Args:
+        store (udata.ExternalStore) : ie. udata.PackStore(path) or
+        udata.MemoryStore(). None goes back to a SqliteStore next to the
+        scene.
+    """
+    global _external_store, _external_store_auto
+    _external_store = store
+    _external_store_auto = False
+
+    for fallback in _external_fallbacks.values():
+        if fallback is not None:
+            fallback.close()
+
+    _external_fallbacks.clear()
+
+
+def _error(message):
+    get_backend().error(message)
+
+
+def _warning(message):
+    get_backend().warning(message)
+
+
+def _undo_chunk(name, undoable = True):
+    """Groups all the Maya edits made inside the context into one undo"""
+    return get_backend().undo_chunk(name, undoable)
+
+
 class Attr(object):
     """A Wrapper for Maya's attribute arguements"""
     
@@ -168,14 +339,14 @@ class Compound(Attr):
             children = []
         
         if attr_type not in Compound.compound_types:
-            pm.error('udata Module: {0} is not a valid CompoundType.  Print Compound.CompoundTypes for valid list'.format(attr_type))
+            _error('udata Module: {0} is not a valid CompoundType.  Print Compound.CompoundTypes for valid list'.format(attr_type))
         
         self._target_size = Compound.compound_types[attr_type]
         self._children   = children
         
         if self._target_size and make_elements:
             if self._children:
-                pm.error('udata Module: You supplied children, but also have make_elements = True.  Children will be erased')
+                _error('udata Module: You supplied children, but also have make_elements = True.  Children will be erased')
             
             self._make_elements()
 
@@ -208,7 +379,7 @@ class Compound(Attr):
         """Add an attribute to this Compound as a child"""
         
         if self._target_size and len(self._children) > self._target_size:
-            pm.error('udata Module: Compound instance has reached the max allowed children')
+            _error('udata Module: Compound instance has reached the max allowed children')
             
         self._children.append(child)
         
@@ -233,7 +404,175 @@ class Compound(Attr):
             valid_size = self.count() == self._target_size
             
         if not valid_size:
-            pm.error('udata module: {0} does not have the required number of children'.format(self.attr_type))
+            _error('udata module: {0} does not have the required number of children'.format(self.attr_type))
+
+
+
+class Blob(Compound):
+    """A Compound that stores a large value as compressed text
+
+    Payloads such as pose libraries or retarget maps would need thousands of
+    Attrs to model directly. A Blob instead serializes the value to JSON,
+    compresses it with zlib or lzma and stores it base64 encoded across the
+    elements of a stringArray, so no single string gets too long. A second
+    string child holds a JSON header with the codec, schema version,
+    checksum and size of the payload.
+
+    Blobs are read and written with BaseData.read_blob() and write_blob().
+    Reading only decodes the payload when the header has changed since the
+    last read, so a scene can carry large blobs that are never paid for
+    until they're used.
+
+    Example:
+        Blob('poses', codec='lzma', schema_version=2)
+    creates poses (compound), posesHeader (string) and posesChunks
+    (stringArray).
+    """
+
+    codecs = {'zlib': (zlib.compress, zlib.decompress),
+              'lzma': (lzma.compress, lzma.decompress)}
+    """The (compress, decompress) functions of each codec name"""
+
+    cache_size = 32
+    """How many decoded values are kept in memory"""
+
+    _cache = collections.OrderedDict()
+
+
+    def __init__(self, name, codec = 'zlib', schema_version = 1, chunk_size = 32768, *args, **kwargs):
+        if codec not in Blob.codecs:
+            _error('udata Module: {0} is not a valid Blob codec. Print Blob.codecs for valid list'.format(codec))
+
+        children = [Attr(name + 'Header', 'string'), Attr(name + 'Chunks', 'stringArray')]
+        super(Blob, self).__init__(name, 'compound', children, False, *args, **kwargs)
+
+        self.codec = codec
+        self.schema_version = schema_version
+        self.chunk_size = chunk_size
+
+
+    @property
+    def header_name(self):
+        """The name of the child that holds the header"""
+        return self._children[0].name
+
+
+    @property
+    def chunks_name(self):
+        """The name of the child that holds the encoded payload"""
+        return self._children[1].name
+
+
+    def encode(self, value):
+        """Returns the (header string, chunk list) that stores the value"""
+        raw = json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        compress = Blob.codecs[self.codec][0]
+        text = base64.b64encode(compress(raw)).decode('ascii')
+
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        header = {'codec': self.codec, 'schema': self.schema_version,
+                  'crc32': zlib.crc32(raw), 'size': len(raw), 'chunks': len(chunks)}
+
+        return (json.dumps(header, sort_keys=True), chunks)
+
+
+    def decode(self, header, chunks):
+        """Returns the value stored by encode()
+
+        Values stored with an older schema version are passed through
+        upgrade() before they're returned.
+        """
+        try:
+            header = json.loads(header)
+            decompress = Blob.codecs[header['codec']][1]
+        except (ValueError, KeyError, TypeError):
+            _error('udata Module: Invalid Blob header "{0}"'.format(header))
+
+        chunks = chunks or []
+        if len(chunks) != header['chunks']:
+            _error('udata Module: Blob has {0} of {1} chunks'.format(len(chunks), header['chunks']))
+
+        try:
+            raw = decompress(base64.b64decode(''.join(chunks)))
+        except (ValueError, zlib.error, lzma.LZMAError):
+            _error('udata Module: Blob payload can\'t be decompressed, the payload is corrupt')
+
+        if zlib.crc32(raw) != header['crc32']:
+            _error('udata Module: Blob checksum mismatch, the payload is corrupt')
+
+        value = json.loads(raw.decode('utf-8'))
+        if header['schema'] != self.schema_version:
+            value = self.upgrade(value, header['schema'])
+
+        return value
+
+
+    def upgrade(self, value, schema_version):
+        """Convert a value stored with an older schema version
+
+        The default implimentation returns the value unchanged. Users can
+        sub-class Blob and override this to migrate their payloads.
+        """
+        return value
+
+
+    @classmethod
+    def get_cached(cls, key, header):
+        """Returns (True, value) if the value of the header is cached"""
+        cached = cls._cache.get(key)
+        if cached is None or cached[0] != header:
+            return (False, None)
+
+        cls._cache.move_to_end(key)
+        return (True, cached[1])
+
+
+    @classmethod
+    def set_cached(cls, key, header, value):
+        cls._cache[key] = (header, value)
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > cls.cache_size:
+            cls._cache.popitem(last=False)
+
+
+    @classmethod
+    def clear_cache(cls):
+        """Forget every decoded value"""
+        cls._cache.clear()
+
+
+
+class External(Attr):
+    """A string attribute that holds the key of bytes kept outside the scene
+
+    The bytes are stored in the ExternalStore returned by
+    udata.get_external_store() and only the content-addressed key is saved
+    with the scene, so heavy payloads don't slow down opening or saving the
+    scene. Externals are read and written with BaseData.read_external() and
+    write_external(). See Utils.collect_external_garbage() for removing
+    bytes that are no longer referenced.
+
+    The location of the store the bytes were written to is saved after the
+    key. When the current store doesn't have the key (ie. after Save As or
+    when the data comes from a referenced file) the bytes are read from
+    that store instead.
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        super(External, self).__init__(name, 'string', *args, **kwargs)
+
+
+    @staticmethod
+    def join_value(key, location = None):
+        """Returns the attribute value that saves a key and store location"""
+        return '{0} {1}'.format(key, location) if location else key
+
+
+    @staticmethod
+    def split_value(value):
+        """Returns the (key, store location or None) of an attribute value"""
+        key, _, location = (value or '').partition(' ')
+        return (key, location or None)
 
 
 
@@ -246,13 +585,46 @@ def create_attr(name, attr_type, *args, **kwargs):
     
 
 
+def _get_node_name(node):
+    """Returns a unique name for the input node that maya.cmds can use"""
+    return get_backend().node_name(node)
+
+
+def _parse_record_string(value):
+    """Splits a 'name:version' record string into (name, version tuple)
+
+    Returns None if the value is empty or isn't a valid record string.
+    """
+    if not value:
+        return None
+
+    try:
+        name, str_version = value.split(':')
+        version = tuple(map(int, str_version.split('.')))
+    except ValueError:
+        return None
+
+    return (name, version)
+
+
+ScanRecord = collections.namedtuple('ScanRecord', ['node', 'name', 'version'])
+"""A (node name, class name, version) record found by Utils.scan_records()"""
+
+
+
 class Record(object):
     """The name of the class data found on a Maya node and its version info"""
-    
-    def __init__(self, attr):
+
+    def __init__(self, attr, name = None, version = None, table = None):
         self._attr = attr
-        self._name, str_version = attr.get().split(':')
-        self._version = tuple(map(int, str_version.split('.')))
+        self._table = table
+
+        if name is None:
+            name, str_version = attr.get().split(':')
+            version = tuple(map(int, str_version.split('.')))
+
+        self._name = name
+        self._version = version
         
 
     @property
@@ -275,6 +647,9 @@ class Record(object):
         name = '{0}:{1}'.format( self.name, self._get_version_string() )
         self.attr.set( name )
         self.attr.lock()  
+
+        if self._table is not None:
+            self._table._set_version(self.name, value)
         
         
     @property
@@ -285,532 +660,3147 @@ class Record(object):
     
     def _get_version_string(self):
         return '.'.join(map(str, self._version))
-    
-    
-    
-class BaseData(Attr):
-    """Represents data that the user wants to store as Maya attributes
-    
-    Users should inherit from this class and at a minimum override
-    get_atttributes(). get_attributes should either be declared as
-    @classmethod or @staticmethod
-    
-    The python class names will become a compound attribute of the same name.
-    Users can override cls.get_default_flags() to determine how this class
-    looks as an attribute in Maya or pass the flags in on init().
-    
-    The BaseData class is responsible for reading and writing Maya attributes,
-    creating and editing records, as well as class.version management.
-    
-    Any object that has a block of BaseData attributes stored on it will also
-    contain a data block name that matches udata._RECORDS_NAME. Records are
-    used for determing what version BaseData sub-classes are being stored on
-    a given node. If a record for a given class is missing from the records
-    then the udata module won't know that the data exists.
-    """
-    
-    attributes = []
-    """The attributes returned from get_atttributes()
-    
-    These attributes are stored at the class level so the data can be
-    inspected and read without needing to create an instance of the class.
-    Additionally, per instance attrs doesn't make sense in the scheme
-    of how data is stored and used by this module.
+
+
+
+class RecordTable(object):
+    """A parsed view of all the records stored on a single node
+
+    The records are read and parsed once into a name -> (index, version)
+    lookup so asking a node about several classes doesn't re-read the
+    records each time. Tables are cached per node. Changes made through the
+    table are written straight through to Maya.
+
+    Tables are invalidated by the SceneIndex hook when nodes are deleted,
+    files are opened or edits are undone. If you edit a node's records
+    outside of the udata module call RecordTable.invalidate().
     """
 
-    _records = None
-    _node = None
-    _data_stack = []
+    _tables = {}
+    _generation = 0
 
-    def __init__(self, *args, **kwargs):  
-        super(BaseData, self).__init__(self.get_name(), 'compound', *args, **kwargs)
-        
-        self._init_class_attributes()
+    def __init__(self, node):
+        super(RecordTable, self).__init__()
 
-###----Versioning Methods----
+        self._node = node
+        self._generation = RecordTable._generation
+        self._entries = {}
+        self._free = []
+        self._next_index = 0
+        self._has_records = get_backend().has_attr(node, _RECORDS_NAME)
+
+        if self._has_records:
+            self._load()
+
+
+    def _load(self):
+        indices = []
+        for node_name, elements in get_backend().read_multi_strings(_RECORDS_NAME, [self._node]):
+            for i, value in elements:
+                indices.append(i)
+                record = _parse_record_string(value)
+                if record:
+                    self._entries[record[0]] = (i, record[1])
+
+        #Every unused index below the largest index is a free slot
+        if indices:
+            self._next_index = indices[-1] + 1
+            self._free = list(set(range(self._next_index)).difference(indices))
+            heapq.heapify(self._free)
 
-    @classmethod
-    def get_class_version(cls):
-        return (0, 0, 0)
-     
 
     @classmethod
-    def get_version_string(cls):
-        return '.'.join(map(str, cls.get_class_version()))
+    def get(cls, node):
+        """Returns the (possibly cached) RecordTable for the input node"""
+        if not node:
+            _error('udata Module : Can\'t get records. node is None')
+
+        _scene_index.install_hook()
+
+        table = cls._tables.get(node)
+        if table is None or table.is_stale():
+            table = cls(node)
+            cls._tables[node] = table
+
+        return table
 
-###----Record Methods-----
 
     @classmethod
-    def _add_data_to_records(cls):
-        if cls._records:
+    def invalidate(cls, node = None):
+        """Discard the cached table for the input node (or all nodes)"""
+        if node is None:
+            cls._generation += 1
+            cls._tables = {}
+        else:
+            cls._tables.pop(node, None)
+
+
+    def is_stale(self):
+        """Has the table been invalidated since it was read?"""
+        return self._generation != RecordTable._generation
+
+
+    def names(self):
+        """Returns the class names of all the records on the node"""
+        return list(self._entries)
+
+
+    def get_version(self, name):
+        """Returns the version of the named record, else None"""
+        entry = self._entries.get(name)
+        return entry[1] if entry else None
+
+
+    def get_record(self, name):
+        """Returns a Record for the named data if it exists, else None"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+
+        index, version = entry
+        return Record(get_backend().plug(self._node, self._get_plug(index)), name, version, self)
+
 
-            indices = cls._records.getArrayIndices()
-            if not indices:
-                idx = 0
-            else:
-                idx = -1
-                for i in range(0, indices[-1]):
-                    if not i in indices:
-                        idx = i
-                        break
-                    
-                if idx == -1:
-                    idx = indices[-1] + 1
-            
-            #concatenating the name and version is not as clean in code (vs
-            #seperate attributes), but it makes end-user view from the
-            #attribute editor clean while not taking up as much UI space
-            name = '{0}:{1}'.format( cls.get_name(), cls.get_version_string() )
-            cls._records[idx].set( name )
-            cls._records[idx].lock()
-            
-                  
     @staticmethod
-    def _create_records(node):
-        global _RECORDS_NAME
-        pm.addAttr(node, ln = _RECORDS_NAME,  dt = 'string', m= True)
-                          
-       
-    @classmethod     
-    def _get_records(cls, node, force_add ):
-        if not node:
-            pm.error('udata Module : Can\'t get records. node is None')
-            
-        has_records = pm.hasAttr(node, _RECORDS_NAME)
-                
-        if (not has_records) and force_add:
-            cls._create_records( node )
-            has_records = True
-        
-        if has_records:
-            return node.attr(_RECORDS_NAME) #.records
+    def _get_plug(index):
+        return '{0}[{1}]'.format(_RECORDS_NAME, index)
+
+
+    def add(self, name, version):
+        """Write a new record to the first free index and return the index"""
+        if not self._has_records:
+            BaseData._get_records(self._node, True)
+            self._has_records = True
+
+        if self._free:
+            index = heapq.heappop(self._free)
         else:
-            return None
-        
- 
-    @classmethod
-    def get_records(cls, node):
-        """Sees if any records exists on the input node
-        
-        The records attributes will contain all list of all
-        the records stored on the node.
-        
-        Returns the records attribute if found else None.
-        """
-        return cls._get_records(node, False)
- 
+            index = self._next_index
+            self._next_index += 1
 
-    @classmethod
-    def _get_record_by_name(cls, node, data_name):
-        records = cls._get_records(node, False)
-        found_record = None
-        if records:
-            for i in records.getArrayIndices():
-                record = records[i]
-                if not record.get():
-                    continue
-                
-                name, version = record.get().split(':')
-                if name == data_name:
-                    found_record = Record(record)
-                    break
-                
-        return found_record           
+        #concatenating the name and version is not as clean in code (vs
+        #seperate attributes), but it makes end-user view from the
+        #attribute editor clean while not taking up as much UI space
+        value = '{0}:{1}'.format( name, '.'.join(map(str, version)) )
+        backend = get_backend()
+        backend.set_attr(self._node, self._get_plug(index), value, 'string')
+        backend.set_locked(self._node, self._get_plug(index), True)
 
-    
-    #@classmethod
-    #def get_record_by_name(cls, node, data_name):
-        #"""Sees if a record by the input data_name exists on the input node
-        
-        #Returns the record if it exists, else None.
-        #WARNING: This skips any class update checks.  It's better to use
-        #class.get_data(node)
-        #"""
-        #return cls._get_record_by_name( node, data_name )
-    
-    
-    @classmethod
-    def get_record(cls, node):
-        """see if a record matching the get_name() on the input node
-        
-        Returns the record if it exists, else None         
-        """
-        return cls._get_record_by_name( node, cls.get_name() )
-    
-                  
-###----Attribute Methods----
- 
-    @classmethod
-    def _find_attr_conflicts(cls):
-        attr_names = cls.get_attribute_names()
-        flags = cls.get_default_flags()
-        cls._clear_invalid_flags(flags)
-        
-        if 'multi' in flags or 'm' in flags:
-        #if 'multi' in cls._flags or 'm' in cls._flags:
-            #I *believe* attributes that are part of a multi arg won't conflict.            
-            attr_names = []       
-        
-        attr_names.append( cls.get_name() )
-        
-        conflicts = []
-        for attr_name in attr_names:
-            if pm.hasAttr(cls._node, attr_name):
-                conflicts.append(attr_name)
-                
-        if conflicts:
-            record_names = []
-            for i in cls._records.getArrayIndices():
-                record = Record(cls._records[i])
-                record_names.append( record.name )            
+        self._entries[name] = (index, version)
+        return index
 
-            class_name = cls.__name__
-            errorMessage = 'udata Attribute Conflict :: Attribute Name(s) : {0} from class "{1}" conflicts with one of these existing blocks of data : {2}'
-            pm.error( errorMessage.format(conflicts, class_name, record_names) )
- 
-    @classmethod          
-    def _add_attr(cls, attr, prefix, parent_name):
+
+    def remove(self, name):
+        """Remove the named record from the node"""
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+
+        index = entry[0]
+        backend = get_backend()
+        backend.set_locked(self._node, self._get_plug(index), False)
+        backend.remove_multi_instance(self._node, self._get_plug(index))
+
+        if index == self._next_index - 1:
+            self._next_index -= 1
+        else:
+            heapq.heappush(self._free, index)
+
+
+    def _set_version(self, name, version):
+        entry = self._entries.get(name)
+        if entry is not None:
+            self._entries[name] = (entry[0], version)
+
+
+
+PlanEntry = collections.namedtuple('PlanEntry', ['name', 'attr_type', 'type_flag', 'parent', 'child_count', 'flags'])
+"""A single resolved addAttr() call of a SchemaPlan"""
+
+
+
+class SchemaPlan(object):
+    """A flat, pre-resolved recipe for creating a BaseData block
+
+    Compiling the class attributes once means the -at/-dt flag, parent name,
+    child count and prefix of each attribute only need to be worked out a
+    single time. Adding the data to a node is then a replay of the
+    compiled addAttr() calls. Plans are created by
+    BaseData.get_schema_plan() and shouldn't be edited.
+    """
+
+    def __init__(self, data_class):
+        super(SchemaPlan, self).__init__()
+
+        data_class._init_class_attributes()
+        attrs = data_class.attributes
+
+        flags = data_class.get_default_flags()
+        data_class._clear_invalid_flags(flags)
+
+        self.block_name = data_class.get_name()
+        self.version = data_class.get_class_version()
+
+        #I *believe* attributes that are part of a multi arg won't conflict.
+        self.multi = 'multi' in flags or 'm' in flags
+
+        self.sparse = data_class.is_sparse()
+        """Are fields only created once they're given a non-default value?"""
+
+        if self.sparse:
+            if self.multi:
+                _error('udata Module: {0} can\'t be both sparse and multi'.format(self.block_name))
+
+            #Maya can't add children to an existing compound, so sparse fields
+            #are top-level attributes and the block is a string listing them.
+            entries = [PlanEntry(self.block_name, 'string', 'dt', None, None, self._freeze(flags))]
+            parent_name = None
+        else:
+            entries = [PlanEntry(self.block_name, 'compound', 'at', None, len(attrs), self._freeze(flags))]
+            parent_name = self.block_name
+
+        fields = {}
+        self.blobs = {}
+        """The Blob attributes keyed by their class attribute name"""
+
+        self.externals = {}
+        """The External attributes keyed by their class attribute name"""
+
+        prefix = data_class.get_attr_name('')
+        for attr in attrs:
+            self._compile(attr, prefix, parent_name, entries, fields)
+
+        self.entries = tuple(entries)
+        self.names = tuple(entry.name for entry in self.entries)
+
+        self.groups = collections.OrderedDict()
+        """The entries of each top-level field and its children, keyed by
+        the top-level field's long name"""
+
+        self.roots = {}
+        """The long name of the top-level field each entry belongs to"""
+
+        self.children = collections.defaultdict(list)
+        """The child entries of each entry, keyed by long name"""
+
+        for entry in self.entries[1:]:
+            if entry.parent in (None, self.block_name):
+                root = entry.name
+                self.groups[root] = []
+            else:
+                root = self.roots[entry.parent]
+                self.children[entry.parent].append(entry)
+
+            self.roots[entry.name] = root
+            self.groups[root].append(entry)
+        self.fields = fields
+        """PlanEntries keyed by their class attribute (un-prefixed) name"""
+
+        numeric_compounds = set(entry.name for entry in entries if entry.attr_type in Compound.child_types)
+        self.value_fields = tuple(field for field, entry in fields.items()
+                                  if entry.attr_type not in ('compound', 'message')
+                                  and entry.parent not in numeric_compounds)
+        """The fields that hold a value, without the children of numeric compounds"""
+
+        self.attr_fields = dict((entry.name, field) for field, entry in fields.items())
+        """Class attribute names keyed by their Maya long name"""
+
+
+    @staticmethod
+    def _freeze(flags):
+        return tuple(sorted(flags.items()))
+
+
+    def _compile(self, attr, prefix, parent_name, entries, fields):
         attr_name = prefix + attr.name
-        
-        if parent_name:
-            attr._flags['parent'] = parent_name
-           
+        flags = dict(attr._flags)
+        Attr._clear_invalid_flags(flags)
+        flags = self._freeze(flags)
+
+        if isinstance(attr, Blob):
+            self.blobs[attr.name] = attr
+        elif isinstance(attr, External):
+            self.externals[attr.name] = attr
+
         if isinstance(attr, Compound):
             attr.validate()
-            pm.addAttr(cls._node, ln = attr_name, at = attr.attr_type, nc = attr.count(), **attr._flags)
+            entries.append(PlanEntry(attr_name, attr.attr_type, 'at', parent_name, attr.count(), flags))
+            fields[attr.name] = entries[-1]
             for child in attr.get_children():
-                cls._add_attr(child, '', attr_name)
-            
+                self._compile(child, '', attr_name, entries, fields)
+            return
+
         elif attr.attr_type in Attr.data_types:
-            pm.addAttr(cls._node, ln = attr_name, dt = attr.attr_type, **attr._flags)             
-        else:   
-            pm.addAttr(cls._node, ln = attr_name, at = attr.attr_type, **attr._flags)     
-           
-           
-    @classmethod                   
-    def _get_attribute_names(cls, attr, name_list):
-        name_list.append(attr.name)
-        if isinstance(attr, Compound):
-            for child in attr.get_children():
-                cls._get_attribute_names(child, name_list)
-            
-            
-    @classmethod        
-    def get_attribute_names(cls):
-        """returns a flat list of all the attribute names in class.attributes"""
-        name_list = []
-        cls._init_class_attributes()
-            
-        for attr in cls.attributes:
-            cls._get_attribute_names(attr, name_list)
-            
-        return name_list
+            entries.append(PlanEntry(attr_name, attr.attr_type, 'dt', parent_name, None, flags))
+        else:
+            entries.append(PlanEntry(attr_name, attr.attr_type, 'at', parent_name, None, flags))
 
-      
-    @classmethod
-    def _init_class_attributes(cls):
-        if not cls.attributes:
-            cls.attributes = cls.get_attributes()
-        
-        
-    @classmethod
-    def get_attributes(cls):
-        """MUST IMPLEMENT : A list of udata.Attrs stored in this class.
-        
-        Sub-classes of BaseData must override this function and return
-        the attributes they want to create and store in Maya. The function
-        must also be declared as a class or static method.        
+        fields[attr.name] = entries[-1]
+
+
+    def get_entry(self, field):
+        """Returns the PlanEntry of a class attribute name or Maya long name"""
+        entry = self.fields.get(field)
+        if entry is None and field in self.names:
+            entry = self.entries[self.names.index(field)]
+
+        if entry is None:
+            _error('udata Module: "{0}" is not an attribute of {1}'.format(field, self.block_name))
+
+        return entry
+
+
+    def get_conflict_names(self):
+        """The attribute names that can't already exist on a node"""
+        if self.multi:
+            return (self.block_name,)
+
+        return self.names
+
+
+    def get_default(self, entry):
+        """Returns the value an attribute has before anything is written to it
+
+        Sparse data reads the default of every field that hasn't been created.
         """
-        pm.error( 'udata Module: You\'re attempting to get attributes for class {0} that has no get_attributes() overridden'.format(cls.__name__) )       
-       
-       
-###----Update Methods----
-    
-    @classmethod
-    def pre_update_version(cls, old_data, old_version_number):
-        """Determines if the update_version() should be called.
-        
-        Users can override this function if they wish to define their own
-        logic. By default the function returns udata.AUTO_UPDATE, which
-        is False by default.
-        
-        Args:
-            old_data (pymel.general.Attr) : The data that's about to be updated.
-            old_version_number (Tuple) : The version information of the old_data.
-        
-        Returns:
-            Bool: True if update_version() should be called, else False.
+        if entry.attr_type == 'message':
+            return []
+
+        if entry.name in self.children:
+            return tuple(self.get_default(child) for child in self.children[entry.name])
+
+        if entry.type_flag == 'dt':
+            if entry.attr_type in Compound.child_types:
+                return (0,) * int(entry.attr_type[-1])
+            if entry.attr_type == 'matrix':
+                return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+            return None
+
+        flags = dict(entry.flags)
+        default = flags.get('dv', flags.get('defaultValue'))
+        if entry.attr_type == 'bool':
+            return bool(default)
+
+        return default if default is not None else 0
+
+
+    def is_default(self, entry, value):
+        """Does the value match the entry's default?"""
+        if isinstance(value, list) and entry.attr_type != 'message':
+            value = tuple(value)
+
+        default = self.get_default(entry)
+        if isinstance(default, list) and entry.attr_type != 'message':
+            default = tuple(default)
+
+        return value == default
+
+
+    def create(self, node):
+        """Replay the plan's addAttr() calls on the input node
+
+        Only the data block itself is created for sparse data.
         """
-        global AUTO_UPDATE
-        if not AUTO_UPDATE and REPORT_WARNINGS:
-            pm.warning('cg3dguru.udata : Skip updating old data on "{}" of type "{}" because AUTO_UPDATE is False. Consider overriding pre_update_version(). Repress this warning with udata.REPORT_WARNINGS = False'
-                       .format(old_data.node(), cls.__name__))
-        
-        return AUTO_UPDATE
-     
-    @classmethod  
-    def update_version(cls, old_data, old_version_number):
-        """Updates the data to the latest version of the Python defintion.
-        
-        The default implimentation of this happens in five steps.
-        1. A temporary node is created with the latest class data
-        2. The current data values are copied to the temp node using pymel.core.copyAttr
-        3. The current data is deleted off the original node
-        4. The new data is added to the original node.
-        5. The data values are transferred back from the temp node to the original node.
-        
-        Failure of this process could occur during step #2. In this situation
-        udata.VersionUpdateException is raised and the user will need to
-        determine their own logic for how to update/replace their existing
-        data with the new class version.
-        
+        self._add_entries(node, self.entries[:1] if self.sparse else self.entries)
+
+
+    def create_field(self, node, root):
+        """Create a top-level field and its children on the input node
+
         Args:
-            old_data (pymel.general.Attr) : the data of the outdated version.
-            old_version_number (tuple) : The Max, min, patch value of the old data.
-        
-        Returns:
-            Bool : True if the update was successful else False.
+            node (pyNode) : The node that carries the data.
+            root (str) : The long name of the top-level field.
         """
-        
-        
-        #Copy the attribute values to a temporary node
-        #cls._node = old_data.node()
-        
-        temp_node, data = cls.create_node(name = 'TRASH', ss=True)
-        name_list = cls.get_attribute_names()
-        try:
-            pm.copyAttr(cls._node, temp_node, at=name_list, ic=True, oc=True, values=True)
-        except:
-            #delete the tempNode
-            pm.delete(temp_node)
-            
-            message = 'Please impliment custom update logic for class: {0}  oldVersion: {1}  newVersion: {2}'.format( cls.get_name(), old_version_number, cls.get_class_version())
-            raise VersionUpdateException(message)
-        
-        #delete the attributes off the current node
-        pm.deleteAttr( cls._node, at = cls.get_name() )
-        
-        #rebuild with the latest definition
-        cls._create_data()
+        self._add_entries(node, self.groups[root])
+
+
+    def _add_entries(self, node, entries):
+        backend = get_backend()
+        for entry in entries:
+            kwargs = dict(entry.flags)
+            kwargs[entry.type_flag] = entry.attr_type
+            if entry.parent:
+                kwargs['parent'] = entry.parent
+            if entry.child_count is not None:
+                kwargs['nc'] = entry.child_count
+
+            backend.add_attr(node, entry.name, **kwargs)
+
+
+
+class SchemaDiff(object):
+    """The structural difference between a stored data block and a SchemaPlan
+
+    Entries are compared by long name, -at/-dt type and parent name. Entries
+    that match are "kept" and their values and connections can be carried
+    over when the data block is rebuilt.
+
+    Maya doesn't allow children to be added to or removed from an existing
+    compound attribute, so a structural change still means rebuilding the
+    block. What the diff avoids is the temporary node and the double
+    copyAttr() of the old update path.
+    """
+
+    editable_flags = set(['nn', 'niceName', 'min', 'minValue', 'max', 'maxValue',
+                          'hnv', 'hasMinValue', 'hxv', 'hasMaxValue',
+                          'smn', 'softMinValue', 'smx', 'softMaxValue',
+                          'hsn', 'hasSoftMinValue', 'hsx', 'hasSoftMaxValue',
+                          'dv', 'defaultValue', 'en', 'enumName',
+                          'k', 'keyable', 'h', 'hidden'])
+    """addAttr() flags that can be edited on an existing attribute"""
+
+    copyable_data_types = set(['string', 'stringArray', 'matrix', 'float2', 'float3',
+                               'double2', 'double3', 'long2', 'long3', 'short2', 'short3',
+                               'doubleArray', 'floatArray', 'Int32Array', 'vectorArray',
+                               'pointArray'])
+    """-dt types whose values can be read with getAttr() and set with setAttr()"""
+
+
+    def __init__(self, stored_entries, plan, entries = None):
+        super(SchemaDiff, self).__init__()
+
+        self.plan = plan
+        self.entries = tuple(entries or plan.entries)
+        """The PlanEntries being compared, which defaults to the whole plan"""
+
+        stored = dict((entry[0], tuple(entry[1:])) for entry in stored_entries)
+        current = dict((entry.name, (entry.type_flag, entry.attr_type, entry.parent)) for entry in self.entries)
+
+        self.added = [entry.name for entry in self.entries if entry.name not in stored]
+        """Names that only exist in the plan"""
+
+        self.removed = [entry[0] for entry in stored_entries if entry[0] not in current]
+        """Names that only exist in the stored data"""
+
+        self.changed = [entry.name for entry in self.entries
+                        if entry.name in stored and stored[entry.name] != current[entry.name]]
+        """Names whose type or parent differs"""
+
+        self.kept = [entry for entry in self.entries
+                     if entry.name in stored and stored[entry.name] == current[entry.name]]
+        """PlanEntries that match the stored data"""
+
+
+    @staticmethod
+    def read_block(node_name, block_name):
+        """Returns (name, type flag, attr type, parent) for a stored data block"""
+        backend = get_backend()
+        entries = []
+        pending = [(block_name, None)]
+        while pending:
+            attr_name, parent = pending.pop()
+            type_flag, attr_type = backend.get_attr_type(node_name, attr_name)
+            entries.append( (attr_name, type_flag, attr_type, parent) )
+
+            children = backend.list_children(node_name, attr_name)
+            for child in reversed(children):
+                pending.append( (child, attr_name) )
+
+        return entries
 
-        #transfer attributes back to original node
-        pm.copyAttr(temp_node, cls._node, at = name_list, ic = True, oc = True, values = True)  
-        
-        #delete the tempNode
-        pm.delete(temp_node)
-        
-        return True
 
-    @classmethod    
-    def post_update_version(cls, data, update_successful):
-        """Called after update_version()
-        
-        The default implimentation does nothing. Users can override
-        this function if they want to do any post processing after
-        the update_function has been run.
-        
-        args:
-            data (pymel.general.Attr) : The newly updated data if successful
-            else the old data.
-            update_successful (bool) : Was the update successful.
-        """        
-        pass
-    
-    
-###----Data Methods----
-    
-    @classmethod
-    def get_name(cls):
-        """The name of the class as it will appear in Maya's extra attributes
-        
-        By default the name is the same as the class.__name__ This should be
-        determined upfront before using the name in production.  Once changed
-        any existing records and associated data will be orphaned.  If users
-        opt to override this, they must include a @classmethod declarator
-        """
-        return cls.__name__
-    
-    
     @classmethod
-    def get_prefix(cls):
-        """Retuns the prefix to append to all class attributes
-        
-        The deault prefix is an empty string. The prefix is designed to limit
-        the potential of an attribute name collision between mutliple
-        udata blocks assigned to the same maya node. Users can return ''
-        if they don't want a prefix added to their attribute names. Any valid
-        prefix will automaticallly be separated by '_'
-        
-        NOTE: If you decided to change the prefix once the data is production
-        then you'll need to override update_version() with your own logic
-        as old names and new names won't match when updating the data block.        
+    def from_node(cls, node_name, plan):
+        """Compare the data block stored on the named node with the plan"""
+        return cls(cls.read_block(node_name, plan.block_name), plan)
+
+
+    def is_structural(self):
+        """Do attributes need to be added, removed or retyped?"""
+        return bool(self.added or self.removed or self.changed)
+
+
+    def can_migrate(self):
+        """Can the values of every kept attribute be snapshot and restored?"""
+        for entry in self.kept:
+            flags = dict(entry.flags)
+            if 'm' in flags or 'multi' in flags or entry.attr_type == 'fltMatrix':
+                return False
+
+            if entry.type_flag == 'dt' and entry.attr_type not in self.copyable_data_types:
+                return False
+
+        return True
+
+
+    def apply_flags(self, node_name):
+        """Edit the editable flags of the stored attributes to match the plan"""
+        backend = get_backend()
+        for entry in self.entries:
+            if entry.name == self.plan.block_name:
+                continue
+
+            flags = dict((key, value) for key, value in entry.flags if key in self.editable_flags)
+            if flags:
+                backend.edit_attr(node_name, entry.name, **flags)
+
+
+    def snapshot(self, node_name):
+        """Read the values and connections of the kept attributes"""
+        backend = get_backend()
+        values = []
+        connections = set()
+        for entry in self.kept:
+            connections.update(backend.list_connections(node_name, entry.name))
+
+            if entry.child_count is not None or entry.attr_type == 'message':
+                continue
+
+            value = backend.read_value(node_name, entry)
+            if value is not None:
+                values.append( (entry, value, backend.is_locked(node_name, entry.name)) )
+
+        return (values, connections)
+
+
+    def restore(self, node_name, snapshot):
+        """Write a snapshot() back to the rebuilt data block"""
+        backend = get_backend()
+        values, connections = snapshot
+        for entry, value, locked in values:
+            try:
+                backend.write_value(node_name, entry, value)
+                if locked:
+                    backend.set_locked(node_name, entry.name, True)
+            except RuntimeError:
+                if REPORT_WARNINGS:
+                    _warning('cg3dguru.udata : Failed to restore the value of "{0}.{1}" while updating the data'.format(node_name, entry.name))
+
+        for source, destination in connections:
+            try:
+                backend.connect(source, destination)
+            except RuntimeError:
+                if REPORT_WARNINGS:
+                    _warning('cg3dguru.udata : Failed to restore the connection "{0}" -> "{1}" while updating the data'.format(source, destination))
+
+
+
+class BatchResult(object):
+    """The per-node results and timing of a BaseData batch operation"""
+
+    def __init__(self, operation):
+        super(BatchResult, self).__init__()
+
+        self.operation = operation
+        """The name of the batch operation that was run"""
+
+        self.results = []
+        """(node, result) tuples for every node that succeeded"""
+
+        self.errors = []
+        """(node, error message) tuples for every node that failed"""
+
+        self.declined = []
+        """Nodes that were left as they were without an error, ie. outdated
+        data that pre_update_version() declined to update"""
+
+        self.elapsed = 0.0
+        """How many seconds the batch took"""
+
+
+    def __len__(self):
+        return len(self.results)
+
+
+    def get_nodes(self):
+        """Returns the nodes that succeeded"""
+        return [node for node, result in self.results]
+
+
+
+class DataHandle(object):
+    """A proxy for the class data stored on one node
+
+    Class fields are exposed as attributes, so handle.startFrame returns
+    the same attribute object as data.attr(cls.get_attr_name('startFrame')).
+    Each field's attribute and plug is resolved the first time it's used and
+    cached afterwards, which makes the handle cheap to read from every frame.
+    Fields that share a name with a handle method (ie. get) can still be
+    read with handle.get(field).
+
+    If the data block is rebuilt (ie. by a version update) the cached plugs
+    are no longer valid. Call refresh() or get a new handle.
+
+    For sparse data, get() returns the default of fields that haven't been
+    created, while accessing a field as an attribute creates it so the
+    returned attribute can be connected or edited.
+    """
+
+    def __init__(self, data_class, node, data):
+        super(DataHandle, self).__init__()
+
+        self._data_class = data_class
+        self._node = node
+        self._data = data
+        self._plan = data_class.get_schema_plan()
+        self._attrs = {}
+        self._plugs = {}
+
+
+    def __repr__(self):
+        return 'DataHandle({0}, {1})'.format(self._data_class.get_name(), _get_node_name(self._node))
+
+
+    def __dir__(self):
+        return sorted(set(dir(type(self))).union(self._plan.fields))
+
+
+    def __getattr__(self, name):
+        #only called for names that aren't regular attributes
+        if name.startswith('_') or name not in self._plan.fields:
+            raise AttributeError('{0} has no field "{1}"'.format(self._data_class.get_name(), name))
+
+        attr = self._attrs.get(name)
+        if attr is None:
+            entry = self._plan.fields[name]
+            if self._plan.sparse:
+                self._data_class._create_fields(self._node, [self._plan.roots[entry.name]])
+
+            attr = get_backend().plug(self._node, entry.name)
+            self._attrs[name] = attr
+
+        return attr
+
+
+    @property
+    def data(self):
+        """The data as returned by BaseData.get_data()"""
+        return self._data
+
+
+    @property
+    def node(self):
+        """The node that carries the data"""
+        return self._node
+
+
+    @property
+    def data_class(self):
+        """The BaseData sub-class of the data"""
+        return self._data_class
+
+
+    def refresh(self):
+        """Forget every cached attribute and plug"""
+        self._attrs = {}
+        self._plugs = {}
+
+
+    def get(self, field):
+        """Returns the value of a class field through its cached plug"""
+        entry = self._plan.get_entry(field)
+        resolved = self._plugs.get(field)
+        if resolved is None:
+            if self._plan.sparse and self._plan.roots[entry.name] not in self._data_class.get_created_fields(self._node):
+                return self._plan.get_default(entry)
+
+            resolved = get_backend().resolve_plug(self._node, entry.name)
+            self._plugs[field] = resolved
+
+        return get_backend().read_plug(resolved, entry)
+
+
+    def set(self, field, value):
+        """Set the value of a class field"""
+        with _journal.recording([self._node], self._data_class.get_name(), [field]):
+            self._data_class._write_columns([self._node], [self._plan.get_entry(field)], [[value]])
+
+
+    def snapshot(self, fields = None):
+        """Read many fields in one batched read
+
+        Args:
+            fields (str list, optional) : The fields to read. Defaults to
+            every field that holds a value.
+
+        Returns:
+            dict : The values keyed by field name.
         """
-        return ''
+        fields = list(fields or self._plan.value_fields)
+        entries = [self._plan.get_entry(field) for field in fields]
+        columns = self._data_class._read_columns([self._node], entries)
+        return dict((field, column[0]) for field, column in zip(fields, columns))
+
+
+    def apply(self, values, undoable = True):
+        """Write many fields in one batched write
+
+        Args:
+            values (dict) : Values keyed by field name, ie. from snapshot().
+            undoable (bool, optional) : When False the undo queue is turned
+            off while writing, which is faster but can't be undone.
+        """
+        entries = []
+        columns = []
+        for field, value in values.items():
+            entry = self._plan.get_entry(field)
+            if entry.attr_type == 'message':
+                _error('udata Module: "{0}" is a message attribute and can\'t be applied'.format(field))
+
+            entries.append(entry)
+            columns.append([value])
+
+        name = self._data_class.get_name()
+        with _undo_chunk('udata.{0}.apply'.format(name), undoable):
+            with _journal.recording([self._node], name, list(values)):
+                self._data_class._write_columns([self._node], entries, columns)
+
+
+
+class DataRegistry(object):
+    """Every BaseData sub-class, recorded when the class is defined
+
+    Classes are keyed by BaseData.get_name(), so reloading a data module
+    replaces the old definitions instead of adding duplicates. Sub-classes
+    that don't override get_attributes() are treated as abstract bases and
+    aren't listed.
+
+    The flat set of attribute names of each class is read once, the first
+    time names or conflicts are requested after the class registers, and
+    the attribute name -> class names conflict map is updated one class at
+    a time. Classes can be scoped to the module (or package) that defines
+    them.
+    """
+
+    def __init__(self):
+        super(DataRegistry, self).__init__()
+
+        self._classes = collections.OrderedDict()
+        self._attribute_names = {}
+        self._owners = {}
+        self._conflicts = {}
+        self._pending = []
+
+
+    def register(self, data_class):
+        """Add (or replace) a BaseData sub-class"""
+        get_attributes = data_class.get_attributes
+        if getattr(get_attributes, '__func__', get_attributes) is BaseData.get_attributes.__func__:
+            return
+
+        name = data_class.get_name()
+        if name in self._classes:
+            self.unregister(self._classes[name])
+
+        self._classes[name] = data_class
+        self._pending.append(data_class)
+
+
+    def unregister(self, data_class):
+        """Remove a BaseData sub-class"""
+        name = data_class.get_name()
+        if self._classes.get(name) is not data_class:
+            return
+
+        del self._classes[name]
+        if data_class in self._pending:
+            self._pending.remove(data_class)
+
+        for attr_name in self._attribute_names.pop(data_class, ()):
+            #multi classes never own their names, see _resolve()
+            owners = self._owners.get(attr_name)
+            if owners is None or name not in owners:
+                continue
+
+            owners.remove(name)
+            if not owners:
+                del self._owners[attr_name]
+
+            if len(owners) > 1:
+                self._conflicts[attr_name] = list(owners)
+            else:
+                self._conflicts.pop(attr_name, None)
+
+
+    def refresh(self, data_class):
+        """Re-read the attribute names of a class whose attributes changed"""
+        self.unregister(data_class)
+        data_class.attributes = []
+        self.register(data_class)
+
+
+    def _resolve(self):
+        while self._pending:
+            data_class = self._pending.pop(0)
+            attribute_names = frozenset(data_class.get_attribute_names())
+            self._attribute_names[data_class] = attribute_names
+
+            #attributes added with a multi flag can't conflict
+            default_flags = data_class.get_default_flags()
+            if 'm' in default_flags or 'multi' in default_flags:
+                continue
+
+            name = data_class.get_name()
+            for attr_name in attribute_names:
+                owners = self._owners.setdefault(attr_name, [])
+                owners.append(name)
+                if len(owners) > 1:
+                    self._conflicts[attr_name] = list(owners)
+
+
+    @staticmethod
+    def _in_scope(data_class, module):
+        if module is None:
+            return True
+
+        class_module = data_class.__module__
+        return class_module == module or class_module.startswith(module + '.')
+
+
+    def get_classes(self, module = None):
+        """Returns the registered classes in the order they were defined
+
+        Args:
+            module (str, optional) : Only return classes defined in this
+            module or package.
+        """
+        return [data_class for data_class in self._classes.values() if self._in_scope(data_class, module)]
+
+
+    def get_class(self, name):
+        """Returns the class whose get_name() matches the name, else None"""
+        return self._classes.get(name)
+
+
+    def get_attribute_names(self, data_class):
+        """Returns the cached set of attribute names of a registered class"""
+        self._resolve()
+        return self._attribute_names.get(data_class, frozenset())
+
+
+    def get_conflicts(self, module = None):
+        """Returns {attribute name: class names} for names used by several classes
+
+        Args:
+            module (str, optional) : Only consider classes defined in this
+            module or package.
+        """
+        self._resolve()
+        if module is None:
+            return dict((attr_name, list(owners)) for attr_name, owners in self._conflicts.items())
+
+        conflicts = {}
+        for attr_name, owners in self._conflicts.items():
+            owners = [name for name in owners if self._in_scope(self._classes[name], module)]
+            if len(owners) > 1:
+                conflicts[attr_name] = owners
+
+        return conflicts
+
+
+
+_registry = DataRegistry()
+
+
+
+class _BaseDataMeta(type):
+    """Registers every BaseData sub-class with the DataRegistry as it's defined"""
+
+    def __init__(cls, name, bases, namespace):
+        super(_BaseDataMeta, cls).__init__(name, bases, namespace)
+
+        #sub-classes must not share their parent's cached attributes
+        if 'attributes' not in namespace:
+            cls.attributes = []
+
+        if any(isinstance(base, _BaseDataMeta) for base in bases):
+            _registry.register(cls)
+
+
+
+class BaseData(Attr, metaclass = _BaseDataMeta):
+    """Represents data that the user wants to store as Maya attributes
+    
+    Users should inherit from this class and at a minimum override
+    get_atttributes(). get_attributes should either be declared as
+    @classmethod or @staticmethod
+    
+    The python class names will become a compound attribute of the same name.
+    Users can override cls.get_default_flags() to determine how this class
+    looks as an attribute in Maya or pass the flags in on init().
+    
+    The BaseData class is responsible for reading and writing Maya attributes,
+    creating and editing records, as well as class.version management.
+    
+    Any object that has a block of BaseData attributes stored on it will also
+    contain a data block name that matches udata._RECORDS_NAME. Records are
+    used for determing what version BaseData sub-classes are being stored on
+    a given node. If a record for a given class is missing from the records
+    then the udata module won't know that the data exists.
+    """
     
+    attributes = []
+    """The attributes returned from get_atttributes()
     
+    These attributes are stored at the class level so the data can be
+    inspected and read without needing to create an instance of the class.
+    Additionally, per instance attrs doesn't make sense in the scheme
+    of how data is stored and used by this module.
+    """
+
+    _records = None
+    _node = None
+    _data_stack = []
+    _schema_plans = {}
+
+    def __init__(self, *args, **kwargs):  
+        super(BaseData, self).__init__(self.get_name(), 'compound', *args, **kwargs)
+        
+        self._init_class_attributes()
+
+###----Versioning Methods----
+
     @classmethod
-    def get_attr_name(cls, attr_name):
-        """return the input attribute name with an class prefix"""
-        prefix = cls.get_prefix()
-        if prefix:
-            prefix += '_'
+    def get_class_version(cls):
+        return (0, 0, 0)
+     
+
+    @classmethod
+    def get_version_string(cls):
+        return '.'.join(map(str, cls.get_class_version()))
+
+###----Record Methods-----
+
+    @classmethod
+    def _add_data_to_records(cls):
+        if cls._records:
+            table = RecordTable.get(cls._node)
+            table.add(cls.get_name(), cls.get_class_version())
             
-        return prefix + attr_name
+                  
+    @staticmethod
+    def _create_records(node):
+        global _RECORDS_NAME
+        get_backend().add_attr(node, _RECORDS_NAME,  dt = 'string', m= True)
+                          
+       
+    @classmethod     
+    def _get_records(cls, node, force_add ):
+        if not node:
+            _error('udata Module : Can\'t get records. node is None')
+            
+        has_records = get_backend().has_attr(node, _RECORDS_NAME)
+                
+        if (not has_records) and force_add:
+            cls._create_records( node )
+            has_records = True
+        
+        if has_records:
+            return get_backend().plug(node, _RECORDS_NAME) #.records
+        else:
+            return None
+        
+ 
+    @classmethod
+    def get_records(cls, node):
+        """Sees if any records exists on the input node
+        
+        The records attributes will contain all list of all
+        the records stored on the node.
+        
+        Returns the records attribute if found else None.
+        """
+        return cls._get_records(node, False)
+ 
+
+    @classmethod
+    def _get_record_by_name(cls, node, data_name):
+        return RecordTable.get(node).get_record(data_name)
+
+    
+    #@classmethod
+    #def get_record_by_name(cls, node, data_name):
+        #"""Sees if a record by the input data_name exists on the input node
+        
+        #Returns the record if it exists, else None.
+        #WARNING: This skips any class update checks.  It's better to use
+        #class.get_data(node)
+        #"""
+        #return cls._get_record_by_name( node, data_name )
+    
+    
+    @classmethod
+    def get_record(cls, node):
+        """see if a record matching the get_name() on the input node
+        
+        Returns the record if it exists, else None         
+        """
+        return cls._get_record_by_name( node, cls.get_name() )
+    
+                  
+###----Attribute Methods----
+ 
+    @classmethod
+    def _find_attr_conflicts(cls):
+        plan = cls.get_schema_plan()
+        existing = set(get_backend().list_attrs(cls._node))
+        conflicts = [name for name in plan.get_conflict_names() if name in existing]
+                
+        if conflicts:
+            record_names = RecordTable.get(cls._node).names()
+
+            class_name = cls.__name__
+            errorMessage = 'udata Attribute Conflict :: Attribute Name(s) : {0} from class "{1}" conflicts with one of these existing blocks of data : {2}'
+            _error( errorMessage.format(conflicts, class_name, record_names) )
+ 
+    @classmethod                   
+    def _get_attribute_names(cls, attr, name_list):
+        name_list.append(attr.name)
+        if isinstance(attr, Compound):
+            for child in attr.get_children():
+                cls._get_attribute_names(child, name_list)
+            
+            
+    @classmethod        
+    def get_attribute_names(cls):
+        """returns a flat list of all the attribute names in class.attributes"""
+        name_list = []
+        cls._init_class_attributes()
+            
+        for attr in cls.attributes:
+            cls._get_attribute_names(attr, name_list)
+            
+        return name_list
+
+      
+    @classmethod
+    def get_schema_plan(cls):
+        """Returns the compiled SchemaPlan for the current class version
+
+        The plan is compiled the first time it's requested and reused for
+        every node the data is added to afterwards.
+        """
+        key = (cls, cls.get_class_version())
+        plan = BaseData._schema_plans.get(key)
+        if plan is None:
+            plan = SchemaPlan(cls)
+            BaseData._schema_plans[key] = plan
+
+        return plan
+
+
+    @classmethod
+    def _init_class_attributes(cls):
+        if not cls.attributes:
+            cls.attributes = cls.get_attributes()
+        
+        
+    @classmethod
+    def get_attributes(cls):
+        """MUST IMPLEMENT : A list of udata.Attrs stored in this class.
+        
+        Sub-classes of BaseData must override this function and return
+        the attributes they want to create and store in Maya. The function
+        must also be declared as a class or static method.        
+        """
+        _error( 'udata Module: You\'re attempting to get attributes for class {0} that has no get_attributes() overridden'.format(cls.__name__) )       
+       
+       
+###----Update Methods----
+    
+    @classmethod
+    def pre_update_version(cls, old_data, old_version_number):
+        """Determines if the update_version() should be called.
+        
+        Users can override this function if they wish to define their own
+        logic. By default the function returns udata.AUTO_UPDATE, which
+        is False by default.
+        
+        Args:
+            old_data (pymel.general.Attr) : The data that's about to be updated.
+            old_version_number (Tuple) : The version information of the old_data.
+        
+        Returns:
+            Bool: True if update_version() should be called, else False.
+        """
+        global AUTO_UPDATE
+        if not AUTO_UPDATE and REPORT_WARNINGS:
+            _warning('cg3dguru.udata : Skip updating old data on "{}" of type "{}" because AUTO_UPDATE is False. Consider overriding pre_update_version(). Repress this warning with udata.REPORT_WARNINGS = False'
+                       .format(old_data.node(), cls.__name__))
+        
+        return AUTO_UPDATE
+     
+    @classmethod  
+    def update_version(cls, old_data, old_version_number):
+        """Updates the data to the latest version of the Python defintion.
+        
+        The default implimentation compares the stored data with the
+        compiled SchemaPlan. When only attribute flags have changed the
+        flags are edited in-place. When the structure has changed the
+        values and connections of the attributes that still match are kept
+        in memory, the data is rebuilt with the latest definition and the
+        values and connections are restored.
+        
+        If the stored data can't be migrated this way (multi attributes or
+        data types that can't be read with getAttr) then the update falls
+        back to the temporary node round trip of _update_with_temp_node().
+        
+        Args:
+            old_data (pymel.general.Attr) : the data of the outdated version.
+            old_version_number (tuple) : The Max, min, patch value of the old data.
+        
+        Returns:
+            Bool : True if the update was successful else False.
+        """
+        if cls._update_in_place(old_data):
+            return True
+        
+        return cls._update_with_temp_node(old_data, old_version_number)
+
+
+    @classmethod
+    def _update_in_place(cls, old_data):
+        plan = cls.get_schema_plan()
+        node_name = _get_node_name(cls._node)
+        stored_type = get_backend().get_attr_type(node_name, plan.block_name)
+        if stored_type != (plan.entries[0].type_flag, plan.entries[0].attr_type):
+            return False
+
+        if plan.sparse:
+            return cls._update_sparse(node_name)
+
+        diff = SchemaDiff.from_node(node_name, plan)
+        
+        if not diff.is_structural():
+            diff.apply_flags(node_name)
+            return True
+        
+        if plan.multi or not diff.can_migrate():
+            return False
+        
+        snapshot = diff.snapshot(node_name)
+        get_backend().delete_attr( cls._node, plan.block_name )
+        plan.create(cls._node)
+        diff.restore(node_name, snapshot)
+        
+        return True
+
+
+    @classmethod
+    def _update_sparse(cls, node_name):
+        """Update each created sparse field on its own
+
+        Fields that were removed from the class are deleted and fields whose
+        structure changed are rebuilt. Fields that were never created don't
+        need updating.
+        """
+        plan = cls.get_schema_plan()
+        backend = get_backend()
+
+        diffs = []
+        for root in cls.get_created_fields(cls._node):
+            if not backend.has_attr(node_name, root):
+                continue
+
+            if root not in plan.groups:
+                diffs.append( (root, None) )
+                continue
+
+            diff = SchemaDiff(SchemaDiff.read_block(node_name, root), plan, plan.groups[root])
+            if diff.is_structural() and not diff.can_migrate():
+                return False
+
+            diffs.append( (root, diff) )
+
+        created = []
+        for root, diff in diffs:
+            if diff is None:
+                backend.delete_attr(node_name, root)
+                continue
+
+            if diff.is_structural():
+                snapshot = diff.snapshot(node_name)
+                backend.delete_attr(node_name, root)
+                plan.create_field(cls._node, root)
+                diff.restore(node_name, snapshot)
+            else:
+                diff.apply_flags(node_name)
+
+            created.append(root)
+
+        backend.set_attr(node_name, plan.block_name, ','.join(created), 'string')
+        return True
+
+
+    @classmethod
+    def _update_with_temp_node(cls, old_data, old_version_number):
+        """Updates the data by round tripping it through a temporary node
+        
+        This happens in five steps.
+        1. A temporary node is created with the latest class data
+        2. The current data values are copied to the temp node using pymel.core.copyAttr
+        3. The current data is deleted off the original node
+        4. The new data is added to the original node.
+        5. The data values are transferred back from the temp node to the original node.
+        
+        Failure of this process could occur during step #2. In this situation
+        udata.VersionUpdateException is raised and the user will need to
+        determine their own logic for how to update/replace their existing
+        data with the new class version.
+        """
+        
+        
+        #Copy the attribute values to a temporary node
+        #cls._node = old_data.node()
+        
+        backend = get_backend()
+        temp_node, data = cls.create_node(name = 'TRASH', ss=True)
+        name_list = cls.get_attribute_names()
+        try:
+            backend.copy_attrs(cls._node, temp_node, name_list)
+        except:
+            #delete the tempNode
+            _scene_index.remove(temp_node, cls.get_name())
+            backend.delete_node(temp_node)
+            
+            message = 'Please impliment custom update logic for class: {0}  oldVersion: {1}  newVersion: {2}'.format( cls.get_name(), old_version_number, cls.get_class_version())
+            raise VersionUpdateException(message)
+        
+        #delete the attributes off the current node
+        backend.delete_attr( cls._node, cls.get_name() )
+        
+        #rebuild with the latest definition
+        cls._create_data()
+
+        #transfer attributes back to original node
+        backend.copy_attrs(temp_node, cls._node, name_list)
+        
+        #delete the tempNode
+        _scene_index.remove(temp_node, cls.get_name())
+        backend.delete_node(temp_node)
+        
+        return True
+
+    @classmethod
+    def migrate_values(cls, values, old_version_number):
+        """Convert values exported from an older version of the class
+
+        Utils.import_stream() calls this for every record whose version is
+        older than the class. The default implimentation keeps the values
+        whose field still exists, which matches what update_version() keeps.
+        Users can override this to rename or convert fields.
+
+        Args:
+            values (dict) : The exported values keyed by class attribute name.
+            old_version_number (tuple) : The version the values were exported from.
+
+        Returns:
+            dict : The values to write, keyed by class attribute name.
+        """
+        fields = set(cls.get_schema_plan().value_fields)
+        return dict((field, value) for field, value in values.items() if field in fields)
+
+
+    @classmethod    
+    def post_update_version(cls, data, update_successful):
+        """Called after update_version()
+        
+        The default implimentation does nothing. Users can override
+        this function if they want to do any post processing after
+        the update_function has been run.
+        
+        args:
+            data (pymel.general.Attr) : The newly updated data if successful
+            else the old data.
+            update_successful (bool) : Was the update successful.
+        """        
+        pass
+    
+    
+###----Data Methods----
+    
+    @classmethod
+    def get_name(cls):
+        """The name of the class as it will appear in Maya's extra attributes
+        
+        By default the name is the same as the class.__name__ This should be
+        determined upfront before using the name in production.  Once changed
+        any existing records and associated data will be orphaned.  If users
+        opt to override this, they must include a @classmethod declarator
+        """
+        return cls.__name__
+    
+    
+    @classmethod
+    def get_prefix(cls):
+        """Retuns the prefix to append to all class attributes
+        
+        The deault prefix is an empty string. The prefix is designed to limit
+        the potential of an attribute name collision between mutliple
+        udata blocks assigned to the same maya node. Users can return ''
+        if they don't want a prefix added to their attribute names. Any valid
+        prefix will automaticallly be separated by '_'
+        
+        NOTE: If you decided to change the prefix once the data is production
+        then you'll need to override update_version() with your own logic
+        as old names and new names won't match when updating the data block.        
+        """
+        return ''
+    
+    
+    @classmethod
+    def get_attr_name(cls, attr_name):
+        """return the input attribute name with an class prefix"""
+        prefix = cls.get_prefix()
+        if prefix:
+            prefix += '_'
+            
+        return prefix + attr_name
+
+
+    @classmethod
+    def is_sparse(cls):
+        """Should fields only be created once they're given a value?
+
+        By default every field is created when the data is added to a node.
+        Classes with many fields that are rarely changed from their default
+        can override this to return True. The data block is then a single
+        string attribute and each top-level field (with its children) is
+        created the first time it's written with a non-default value. Fields
+        that haven't been created read as their default value.
+
+        Sparse fields are top-level attributes instead of children of the
+        data block, as Maya can't add children to an existing compound.
+        Sparse classes can't use the multi flag.
+
+        NOTE: Switching an existing class between sparse and dense storage
+        needs custom update_version() logic.
+        """
+        return False
+
+
+    @classmethod
+    def get_created_fields(cls, node):
+        """Returns the long names of the sparse top-level fields on the node
+
+        Dense data always has every field, so all of them are returned.
+        """
+        plan = cls.get_schema_plan()
+        if not plan.sparse:
+            return list(plan.groups)
+
+        value = get_backend().get_attr(node, plan.block_name)
+        return [root for root in value.split(',') if root] if value else []
+
+
+    @classmethod
+    def _create_fields(cls, node, roots):
+        """Create the sparse top-level fields that don't exist on the node yet"""
+        plan = cls.get_schema_plan()
+        created = cls.get_created_fields(node)
+        missing = [root for root in plan.groups if root in roots and root not in created]
+        if not missing:
+            return
+
+        for root in missing:
+            plan.create_field(node, root)
+
+        created.extend(missing)
+        get_backend().set_attr(node, plan.block_name, ','.join(created), 'string')
+
+            
+    @classmethod
+    def _create_data(cls):
+        plan = cls.get_schema_plan()
+        plan.create(cls._node)
+         
+        return get_backend().plug(cls._node, plan.block_name)
+        
+    @classmethod   
+    def post_create(cls, data):
+        """Called after the data has been created.
+        
+        This function doesn't do anything by default and exists purely
+        for end-user convenience.  What a great place for adding your new
+        data to an existing node network!
+        
+        Args:
+            data (pymel.general.Attr) : The newly created data. 
+        
+        """        
+        pass
+              
+    @classmethod
+    def get_data(cls, node, force_add = False, as_handle = False):
+        """Attempts to return the class data stored on the input node.
+        
+        Args:
+            node (pyNode) : The node you want to get/store data on
+            force_add (bool) : Should the data be added if none exists?
+            as_handle (bool) : Return a DataHandle instead of the attribute.
+            
+        Returns:
+            pymel.general.Attr : The data stored on the node or None. A
+            DataHandle if as_handle is True and the data exists.
+        """
+
+        #We need to cache the current data, because get_data might be called
+        #while doing an update. As this function gets deeper in scope, we
+        #need to make sure we reset the data as we leave the scope. reseting
+        #happens on exit.
+        cls._data_stack.append((cls._records, cls._node))
+        
+        cls._records = None
+        cls._node    = node
+        
+        record = cls.get_record(node)
+        
+        if not record and force_add:
+            #lets make sure the records data exists
+            cls._records = cls._get_records(node, force_add = True)
+            
+        #If found make sure the data block doesn't need updating.
+        if record:
+            data_name = cls.get_name() 
+            record_version = record.version
+            current_version = cls.get_class_version()
+            
+            #Attempt to updat the version
+            if record_version < current_version:
+                old_data = get_backend().plug(cls._node, data_name)
+                
+                if DEFER_UPDATES and READ_OLD_DATA and not _upgrade_queue.is_updating():
+                    _upgrade_queue.add(node, cls)
+                elif cls.pre_update_version(old_data, record_version):
+                    _upgrade_queue.discard(node, cls)
+                    with _journal.muted():
+                        updated = cls.update_version(old_data, record_version)
+
+                    if updated:
+                        record.version = current_version
+                        _scene_index.add(node, data_name, current_version)
+                        _journal.record(node, data_name, None, 'update')
+                                
+                    data = get_backend().plug(cls._node, data_name)
+                    cls.post_update_version( data, updated )
+
+            
+            data = get_backend().plug(cls._node, data_name)
+                    
+        #else, add the data to the node           
+        elif force_add:
+            cls._find_attr_conflicts()
+            data = cls._create_data()
+            cls._add_data_to_records()
+            _scene_index.add(node, cls.get_name(), cls.get_class_version())
+            _journal.record(node, cls.get_name(), None, 'add')
+            _journal.watch(node)
+            cls.post_create( data )
+            
+        else:
+            data = None
+
+        cls._records, cls._node = cls._data_stack.pop(-1)
+
+        if as_handle and data is not None:
+            return DataHandle(cls, node, data)
+
+        return data      
+    
+    @classmethod  
+    def add_data(cls, node, as_handle = False):
+        """Add class attributes to the input node.
+        
+        If the input node already has data on it then versioning is run to
+        ensure the data format is up-to-date.
+        
+        Args:
+            node (pyNode) : The node to add the data to.
+            as_handle (bool) : Return a DataHandle instead of the attribute.
+                
+        Returns:
+            pymel.general.Attr : The data added to the node.
+        """
+        return cls.get_data(node, force_add=True, as_handle=as_handle)
+    
+
+    @classmethod
+    def delete_data(cls, node):
+        """Remove the class attributes off of the input node
+
+        Args:
+            node (pyNode) : The node to remove the data from.        
+        """
+        table = RecordTable.get(node)
+        
+        if table.get_version(cls.get_name()) is not None:
+            table.remove(cls.get_name())
+            if cls.get_schema_plan().sparse:
+                for root in cls.get_created_fields(node):
+                    if get_backend().has_attr(node, root):
+                        get_backend().delete_attr(node, root)
+
+            get_backend().delete_attr(node, cls.get_name() )
+            _scene_index.remove(node, cls.get_name())
+            _journal.record(node, cls.get_name(), None, 'delete')
+            
+
+###----Misc Methods----
+    
+    @classmethod
+    def create_node(cls, nodeType = DEFAULT_NODE_TYPE, *args, **kwargs):
+        """Creates a new node in Maya that also contains the Class attributes.
+        
+        The default node type that's created is driven by
+        udata._DEFAULT_NODE_TYPE, but users can override this based on
+        the input params.
+        
+        Args:
+            nodeType (str, optional) : The name of the maya node to create.
+            
+        Returns:
+            Tuple : The newly created pyNode as element zero and the data as
+            element 1.
+        """
+        pynode = get_backend().create_node(nodeType, **kwargs)
+    
+        if pynode:
+            #classInstance = cls()
+            data = cls.get_data(pynode, force_add=True)
+            
+        return (pynode, data)
+
+
+###----Batch Methods----
+
+    @classmethod
+    def _run_batch(cls, operation, nodes, func, undoable):
+        result = BatchResult(operation)
+        start = time.perf_counter()
+
+        #compile the schema before the loop so every node replays the same plan
+        cls.get_schema_plan()
+
+        with _undo_chunk('udata.{0}.{1}'.format(cls.get_name(), operation), undoable):
+            for node in nodes:
+                try:
+                    result.results.append( (node, func(node)) )
+                except Exception as e:
+                    result.errors.append( (node, str(e)) )
+
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+    @classmethod
+    def add_data_many(cls, nodes, undoable = True):
+        """Add the class data to many nodes as a single undoable operation
+
+        Args:
+            nodes (pyNode list) : The nodes to add the data to.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the batch, which is faster but can't be undone.
+
+        Returns:
+            BatchResult : The (node, data) results and timing of the batch.
+        """
+        return cls._run_batch('add_data', nodes, cls.add_data, undoable)
+
+
+    @classmethod
+    def delete_data_many(cls, nodes, undoable = True):
+        """Remove the class data from many nodes as a single undoable operation
+
+        Args:
+            nodes (pyNode list) : The nodes to remove the data from.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the batch, which is faster but can't be undone.
+
+        Returns:
+            BatchResult : The (node, None) results and timing of the batch.
+        """
+        return cls._run_batch('delete_data', nodes, cls.delete_data, undoable)
+
+
+    @classmethod
+    def update_version_many(cls, nodes, undoable = True):
+        """Run the version check on many nodes as a single undoable operation
+
+        Args:
+            nodes (pyNode list) : The nodes with outdated class data.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the batch, which is faster but can't be undone.
+
+        Returns:
+            BatchResult : The (node, data) results of the nodes that were
+            updated and the timing of the batch. Nodes whose data is still
+            outdated afterwards (ie. pre_update_version() returned False or
+            the update was deferred) are listed in declined.
+        """
+        current_version = cls.get_class_version()
+        def update(node):
+            data = cls.get_data(node)
+            record = cls.get_record(node)
+            return (data, record is not None and record.version >= current_version)
+
+        result = cls._run_batch('update_version', nodes, update, undoable)
+        result.declined = [node for node, (data, updated) in result.results if not updated]
+        result.results = [(node, data) for node, (data, updated) in result.results if updated]
+        return result
+
+
+    @classmethod
+    def create_nodes(cls, count, values = None, nodeType = DEFAULT_NODE_TYPE, undoable = True, **kwargs):
+        """Create many nodes with the class data as a single undoable operation
+
+        Args:
+            count (int) : How many nodes to create.
+            values (dict or dict list, optional) : Attribute values keyed by
+            class attribute name. A single dict is applied to every node,
+            a list supplies one dict per node.
+            nodeType (str, optional) : The name of the maya node to create.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the batch, which is faster but can't be undone.
+            **kwargs (pymel.createNode flags) : passed to each createNode()
+
+        Returns:
+            BatchResult : The (node, data) results and timing of the batch.
+            Any errors are reported against the index of the failed node.
+        """
+        if isinstance(values, dict):
+            values = [values] * count
+        elif values is not None and len(values) != count:
+            _error('udata Module: create_nodes() needs one values dict per node')
+
+        plan = cls.get_schema_plan()
+        def create(i):
+            pynode, data = cls.create_node(nodeType, **kwargs)
+            if values is not None:
+                with _journal.recording([pynode], cls.get_name(), list(values[i])):
+                    entries = [plan.get_entry(attr_name) for attr_name in values[i]]
+                    cls._write_columns([pynode], entries, [[value] for value in values[i].values()])
+
+            return (pynode, data)
+
+        result = cls._run_batch('create_nodes', range(count), create, undoable)
+        result.results = [item[1] for item in result.results]
+        return result
+
+
+    @classmethod
+    def transfer(cls, src_nodes, dst_nodes = None, mode = 'values', remap = None,
+                 batch_size = 1000, undoable = True):
+        """Copy the class data of many nodes onto other nodes
+
+        Destinations that don't have the class data are given it before
+        anything is copied. Values are read and written in batches through
+        the compiled schema with read_table() and write_table().
+
+        Connections of the source data are rebuilt on the destinations. When
+        the other end of a connection is one of the source nodes, or its name
+        can be remapped to an existing node, the connection is made to that
+        node instead. Incoming connections whose other end can't be mapped
+        are shared with the source, while outgoing ones are skipped since an
+        input can only have one connection.
+
+        Args:
+            src_nodes (pyNode or str list) : The nodes to copy the data from.
+            dst_nodes (pyNode or str list, optional) : One destination per
+            source. If None each destination is found by remapping the name
+            of its source.
+            mode (str, optional) : 'values', 'connections' or 'both'.
+            remap (list or callable, optional) : (regex pattern, replacement)
+            pairs applied in order to node names with re.sub(), or a
+            function that takes a node name and returns the new name.
+            batch_size (int, optional) : How many nodes to read and write
+            at once.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the transfer, which is faster but can't be undone.
+
+        Returns:
+            BatchResult : The (source, destination) results and timing of the
+            transfer. Errors are reported against the source node.
+        """
+        if mode not in ('values', 'connections', 'both'):
+            _error('udata Module: transfer() mode must be "values", "connections" or "both"')
+
+        if dst_nodes is None and remap is None:
+            _error('udata Module: transfer() needs dst_nodes or a remap')
+
+        src_nodes = list(src_nodes)
+        if dst_nodes is not None:
+            dst_nodes = list(dst_nodes)
+            if len(dst_nodes) != len(src_nodes):
+                _error('udata Module: transfer() needs one destination per source node')
+
+        backend = get_backend()
+        plan = cls.get_schema_plan()
+        current_version = cls.get_class_version()
+        result = BatchResult('transfer')
+        start = time.perf_counter()
+
+        def map_name(name):
+            if remap is None:
+                return name
+            if callable(remap):
+                return remap(name)
+
+            for pattern, replacement in remap:
+                name = re.sub(pattern, replacement, name)
+
+            return name
+
+        def find_node(name):
+            #a remapped short name can match DAG nodes under several parents
+            found = backend.ls(name)
+            if len(found) > 1:
+                raise ValueError('"{0}" matches {1} nodes, remap to a unique path'.format(name, len(found)))
+
+            return _get_node_name(found[0]) if found else None
+
+        with _undo_chunk('udata.{0}.transfer'.format(cls.get_name()), undoable):
+            pairs = []
+            for i, src in enumerate(src_nodes):
+                try:
+                    if dst_nodes is not None:
+                        dst = dst_nodes[i]
+                        if not backend.node_exists(dst):
+                            raise ValueError('The destination node "{0}" doesn\'t exist'.format(dst))
+                    else:
+                        dst_name = map_name(_get_node_name(src))
+                        dst = find_node(dst_name)
+                        if dst is None:
+                            raise ValueError('The destination node "{0}" doesn\'t exist'.format(dst_name))
+
+                    cls.get_data(src)
+                    record = cls.get_record(src)
+                    if not record:
+                        raise ValueError('The source node has no {0} data'.format(cls.get_name()))
+                    if record.version < current_version:
+                        raise ValueError('The source {0} data is waiting to be updated'.format(cls.get_name()))
+
+                    #add_data() also updates outdated destination data
+                    cls.add_data(dst)
+                    record = cls.get_record(dst)
+                    if record.version < current_version:
+                        raise ValueError('The destination {0} data is waiting to be updated'.format(cls.get_name()))
+
+                    pairs.append( (src, dst) )
+                except Exception as e:
+                    result.errors.append( (src, str(e)) )
+
+            if mode in ('values', 'both') and plan.value_fields:
+                entries = [plan.fields[field] for field in plan.value_fields]
+                for i in range(0, len(pairs), batch_size):
+                    batch = pairs[i:i + batch_size]
+                    src_batch = [src for src, dst in batch]
+                    dst_batch = [dst for src, dst in batch]
+                    columns = cls._read_columns(src_batch, entries)
+                    with _journal.recording(dst_batch, cls.get_name(), list(plan.value_fields)):
+                        cls._write_columns(dst_batch, entries, columns)
+
+            if mode in ('connections', 'both'):
+                #connections between the sources are rebuilt between their
+                #destinations, matched by full path since short names can repeat
+                mapped = dict((_get_node_name(src), _get_node_name(dst)) for src, dst in pairs)
+
+                for i in range(0, len(pairs), batch_size):
+                    batch = pairs[i:i + batch_size]
+                    plugs = []
+                    for src, dst in batch:
+                        src_name = _get_node_name(src)
+                        fields = cls.get_created_fields(src)
+                        cls._create_fields(dst, fields)
+                        for root in fields:
+                            for entry in plan.groups[root]:
+                                plugs.append( (src_name, entry.name) )
+
+                    owners = dict((_get_node_name(src), _get_node_name(dst)) for src, dst in batch)
+                    connections = set()
+                    for j, own, other, incoming in backend.list_connections_many(plugs):
+                        own_attr = own.split('.', 1)[1]
+                        dst_plug = '{0}.{1}'.format(owners[plugs[j][0]], own_attr)
+
+                        other_name, other_attr = other.split('.', 1)
+                        other_node = mapped.get(other_name)
+                        if other_node is None and remap is not None:
+                            try:
+                                other_node = find_node(map_name(other_name))
+                            except ValueError as e:
+                                _warning('udata Module: transfer() left {0} unmapped. {1}'.format(other, e))
+
+                        if other_node is None:
+                            if not incoming:
+                                continue
+                            other_plug = other
+                        else:
+                            other_plug = '{0}.{1}'.format(other_node, other_attr)
+
+                        connections.add( (other_plug, dst_plug) if incoming else (dst_plug, other_plug) )
+
+                    for source, destination in sorted(connections):
+                        backend.connect(source, destination)
+
+        result.results = pairs
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+
+###----Table Methods----
+
+    @classmethod
+    def read_table(cls, nodes, fields, as_numpy = False):
+        """Read class attribute values from many nodes at once
+        
+        The values are read in bulk by the active Backend. The default
+        CmdsBackend resolves plugs with OpenMaya instead of building a PyNode
+        and pymel Attribute per value. Fields are class attribute names, so
+        prefixes and compound children are resolved automatically.
+        
+        Args:
+            nodes (pyNode or str list) : The nodes to read. Every node must
+            already carry the class data.
+            fields (str list) : The class attribute names to read.
+            as_numpy (bool, optional) : Return each column as a numpy array.
+            
+        Returns:
+            dict : A list (or array) of values per field in the node order.
+        """
+        if as_numpy and numpy is None:
+            _error('udata Module: read_table(as_numpy=True) requires numpy')
+        
+        plan = cls.get_schema_plan()
+        entries = [plan.get_entry(field) for field in fields]
+        columns = dict(zip(fields, cls._read_columns(nodes, entries)))
+                
+        if as_numpy:
+            for field in fields:
+                columns[field] = numpy.asarray(columns[field])
+            
+        return columns
+    
+    
+    @classmethod
+    def write_table(cls, nodes, values, undoable = True):
+        """Write class attribute values to many nodes at once
+        
+        When undoable is False the default CmdsBackend queues every value
+        on one OpenMaya MDGModifier instead of running a setAttr per value.
+        
+        Args:
+            nodes (pyNode or str list) : The nodes to write to. Every node
+            must already carry the class data.
+            values (dict) : A sequence (or numpy array) of values per class
+            attribute name, with one value per node.
+            undoable (bool, optional) : When False the undo queue is turned
+            off while writing, which is faster but can't be undone.
+        """
+        plan = cls.get_schema_plan()
+        nodes = list(nodes)
+        node_count = len(nodes)
+        
+        entries = []
+        columns = []
+        for field, column in values.items():
+            if hasattr(column, 'tolist'):
+                column = column.tolist()
+                
+            if len(column) != node_count:
+                _error('udata Module: write_table() needs one "{0}" value per node'.format(field))
+                
+            entries.append(plan.get_entry(field))
+            columns.append(column)
+            
+        with _undo_chunk('udata.{0}.write_table'.format(cls.get_name()), undoable):
+            with _journal.recording(nodes, cls.get_name(), list(values)):
+                cls._write_columns(nodes, entries, columns)
+
+
+    @classmethod
+    def _get_array_entry(cls, field):
+        if numpy is None:
+            _error('udata Module: array attributes require numpy')
+
+        entry = cls.get_schema_plan().get_entry(field)
+        if entry.type_flag != 'dt' or entry.attr_type not in ARRAY_TYPES:
+            _error('udata Module: "{0}" is not one of the array types {1}'.format(field, sorted(ARRAY_TYPES)))
+
+        return entry
+
+
+    @classmethod
+    def read_array(cls, node, field):
+        """Read an array attribute into a numpy array
+
+        doubleArray, floatArray and Int32Array attributes return a flat
+        array. vectorArray and pointArray attributes return one (x, y, z) or
+        (x, y, z, w) row per element. The CmdsBackend reads the array
+        through its MFn*ArrayData without building any pymel objects.
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the array.
+
+        Returns:
+            numpy.ndarray : The array values.
+        """
+        entry = cls._get_array_entry(field)
+        plan = cls.get_schema_plan()
+        if plan.sparse and plan.roots[entry.name] not in cls.get_created_fields(node):
+            return as_array(entry.attr_type, [])
+
+        return get_backend().read_array(node, entry)
+
+
+    @classmethod
+    def write_array(cls, node, field, array, undoable = True):
+        """Write a numpy array (or any sequence) to an array attribute
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the array.
+            array (numpy.ndarray) : The values, shaped like read_array().
+            Point rows can leave out w, which is then 1.0.
+            undoable (bool, optional) : When False the CmdsBackend sets
+            the array data directly through OpenMaya, which is faster but
+            can't be undone.
+        """
+        entry = cls._get_array_entry(field)
+        if cls.get_schema_plan().sparse:
+            cls._create_fields(node, [cls.get_schema_plan().roots[entry.name]])
+
+        with _journal.recording([node], cls.get_name(), [field]):
+            get_backend().write_array(node, entry, array, undoable)
+
+
+    @classmethod
+    def write_array_chunks(cls, node, field, chunks):
+        """Write an array attribute from an iterable of array chunks
+
+        Each chunk is converted to the written values as it's read, so a
+        generator can produce the array without the caller building, or the
+        backend joining, one large numpy array. The attribute is still set
+        in one go. The CmdsBackend sets the array data through OpenMaya like
+        write_array(undoable = False), which can't be undone. The
+        PymelBackend ends in a normal, undoable setAttr.
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the array.
+            chunks (iterable) : numpy arrays (or sequences) shaped like
+            read_array().
+        """
+        entry = cls._get_array_entry(field)
+        if cls.get_schema_plan().sparse:
+            cls._create_fields(node, [cls.get_schema_plan().roots[entry.name]])
+
+        with _journal.recording([node], cls.get_name(), [field]):
+            get_backend().write_array_chunks(node, entry, chunks)
+
+
+    @classmethod
+    def _get_blob(cls, field):
+        blob = cls.get_schema_plan().blobs.get(field)
+        if blob is None:
+            _error('udata Module: "{0}" is not a Blob of {1}'.format(field, cls.get_name()))
+
+        return blob
+
+
+    @classmethod
+    def read_blob(cls, node, field):
+        """Returns the value stored in a Blob attribute
+
+        The payload is only decoded when its header has changed since the
+        last read, otherwise the cached value is returned. The value is
+        shared with the cache, so edit a copy and pass it to write_blob().
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the Blob.
+
+        Returns:
+            The stored value or None if nothing has been stored.
+        """
+        blob = cls._get_blob(field)
+        plan = cls.get_schema_plan()
+        header_entry = plan.get_entry(blob.header_name)
+        header = cls._read_columns([node], [header_entry])[0][0]
+        if not header:
+            return None
+
+        key = (_get_node_name(node), header_entry.name)
+        found, value = Blob.get_cached(key, header)
+        if not found:
+            chunks = cls._read_columns([node], [plan.get_entry(blob.chunks_name)])[0][0]
+            value = blob.decode(header, chunks)
+            Blob.set_cached(key, header, value)
+
+        return value
+
+
+    @classmethod
+    def write_blob(cls, node, field, value, undoable = True):
+        """Store a JSON serializable value in a Blob attribute
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the Blob.
+            value : The value to store.
+            undoable (bool, optional) : When False the undo queue is turned
+            off while writing, which is faster but can't be undone.
+        """
+        blob = cls._get_blob(field)
+        plan = cls.get_schema_plan()
+        header, chunks = blob.encode(value)
+        entries = [plan.get_entry(blob.chunks_name), plan.get_entry(blob.header_name)]
+
+        with _undo_chunk('udata.{0}.write_blob'.format(cls.get_name()), undoable):
+            with _journal.recording([node], cls.get_name(), [field]):
+                cls._write_columns([node], entries, [[chunks], [header]])
+
+
+    @classmethod
+    def _get_external_entry(cls, field):
+        plan = cls.get_schema_plan()
+        if field not in plan.externals:
+            _error('udata Module: "{0}" is not an External of {1}'.format(field, cls.get_name()))
+
+        return plan.get_entry(field)
+
+
+    @classmethod
+    def read_external(cls, node, field):
+        """Returns the bytes of an External attribute
+
+        The bytes are loaded from the external store the first time they're
+        read and kept in the store's LRU cache afterwards. Keys the current
+        store doesn't have are looked up in the store they were written to.
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the External.
+
+        Returns:
+            bytes : The stored bytes or None if nothing has been stored.
+        """
+        value = cls._read_columns([node], [cls._get_external_entry(field)])[0][0]
+        if not value:
+            return None
+
+        key, location = External.split_value(value)
+        store = get_external_store()
+        try:
+            return store.get(key)
+        except KeyError:
+            pass
+
+        #the key was written to another store, ie. before a Save As
+        fallback = _get_fallback_store(location) if location != store.location else None
+        if fallback is not None:
+            try:
+                return fallback.get(key)
+            except KeyError:
+                pass
+
+        _error('udata Module: "{0}" of {1} refers to "{2}", which is missing from the external store{3}'
+               .format(field, _get_node_name(node), key, ' and ' + location if location else ''))
+
+
+    @classmethod
+    def write_external(cls, node, field, data):
+        """Store bytes in the external store and their key on the node
+
+        Args:
+            node (pyNode) : The node that carries the class data.
+            field (str) : The class attribute name of the External.
+            data (bytes) : The bytes to store.
+
+        Returns:
+            str : The key the bytes are stored under.
+        """
+        entry = cls._get_external_entry(field)
+        store = get_external_store()
+        key = store.put(data)
+        with _journal.recording([node], cls.get_name(), [field]):
+            cls._write_columns([node], [entry], [[External.join_value(key, store.location)]])
+
+        return key
+
+
+    @classmethod
+    def _read_columns(cls, nodes, entries):
+        """Backend.read_columns() that reads defaults for missing sparse fields"""
+        plan = cls.get_schema_plan()
+        if not plan.sparse:
+            return get_backend().read_columns(nodes, entries)
+
+        nodes = list(nodes)
+        created = [set(cls.get_created_fields(node)) for node in nodes]
+        columns = []
+        for entry in entries:
+            root = plan.roots[entry.name]
+            present = [i for i, roots in enumerate(created) if root in roots]
+            column = [plan.get_default(entry) for node in nodes]
+            if present:
+                values = get_backend().read_columns([nodes[i] for i in present], [entry])[0]
+                for i, value in zip(present, values):
+                    column[i] = value
+
+            columns.append(column)
+
+        return columns
+
+
+    @classmethod
+    def _write_columns(cls, nodes, entries, columns):
+        """Backend.write_columns() that creates sparse fields on demand
+
+        Default values written to sparse fields that don't exist are skipped.
+        """
+        plan = cls.get_schema_plan()
+        if not plan.sparse:
+            get_backend().write_columns(nodes, entries, columns)
+            return
+
+        backend = get_backend()
+        for i, node in enumerate(nodes):
+            created = set(cls.get_created_fields(node))
+            writes = []
+            for entry, column in zip(entries, columns):
+                value = column[i]
+                if plan.roots[entry.name] in created or not plan.is_default(entry, value):
+                    writes.append( (entry, value) )
+
+            roots = set(plan.roots[entry.name] for entry, value in writes)
+            cls._create_fields(node, roots)
+            for entry, value in writes:
+                backend.write_value(node, entry, value)
+
+
+
+class SceneIndex(object):
+    """An in-memory lookup of which nodes carry which BaseData records
+
+    The index is built in a single pass the first time it's queried and is
+    then kept up-to-date by BaseData.add_data(), delete_data() and
+    create_node(). Changes made outside of the udata module (new nodes,
+    deleted nodes, file imports, undo, etc.) are reported by the installed
+    IndexHook. Nodes added to the scene are only inspected on the next query,
+    since their attributes might not exist yet when the node is created.
+    """
+
+    def __init__(self, hook = None):
+        super(SceneIndex, self).__init__()
+
+        self._classes = {}
+        self._nodes = {}
+        self._pending = set()
+        self._built = False
+        self._hook = None
+        self._default_hook = hook
+
+
+    def install_hook(self):
+        """Install the default IndexHook if no hook has been installed yet"""
+        if self._hook is None:
+            self.set_hook(self._default_hook or get_backend().create_index_hook())
+
+
+    def set_hook(self, hook):
+        """Replace the IndexHook that reports scene changes to the index"""
+        if self._hook is not None:
+            self._hook.uninstall()
+
+        self._hook = hook
+        if self._hook is not None:
+            self._hook.install(self)
+
+        self.invalidate()
+
+
+    def is_built(self):
+        """Has the index been built since the last invalidation?"""
+        return self._built
+
+
+    def is_tracking(self):
+        """Does the index or any cached RecordTable need to hear about
+        removed nodes?"""
+        return self._built or bool(RecordTable._tables)
+
+
+    def invalidate(self):
+        """Clear the index so it's rebuilt on the next query"""
+        RecordTable.invalidate()
+        _index_node.invalidate()
+        self._clear()
+
+
+    def _clear(self):
+        self._classes = {}
+        self._nodes = {}
+        self._pending = set()
+        self._built = False
+
+
+    def build(self):
+        """Inspect every node in the scene and rebuild the index"""
+        self.install_hook()
+
+        self._clear()
+        backend = get_backend()
+        unindexed = set()
+        if USE_INDEX_NODE and _index_node.exists():
+            #nodes that got records while nothing kept the index node
+            #up-to-date (ie. before the hook was installed) are read too
+            indexed = _index_node.get_nodes()
+            unindexed = set(_index_node.get_unindexed_nodes(indexed))
+            records = Utils.scan_records(indexed + sorted(unindexed))
+        else:
+            records = Utils.scan_records()
+
+        for node_name, name, version in records:
+            node = backend.to_node(node_name)
+            self._add(node, name, version)
+            if node_name in unindexed:
+                _index_node.add(node, name, version)
+
+        self._built = True
+
+
+    def _add(self, node, name, version):
+        self._classes.setdefault(name, {})[node] = version
+        self._nodes.setdefault(node, {})[name] = version
+
+
+    def _sync(self):
+        if not self._built:
+            self.build()
+
+        if self._pending:
+            backend = get_backend()
+            pending = self._pending
+            if self._hook is not None:
+                pending = [self._hook.get_node(handle) for handle in pending]
+
+            pending = [node for node in pending if node is not None and backend.node_exists(node)]
+            self._pending = set()
+
+            for node_name, name, version in Utils.scan_records(pending):
+                node = backend.to_node(node_name)
+                self._add(node, name, version)
+
+                #ie. duplicated or imported nodes that carry data
+                if USE_INDEX_NODE:
+                    _index_node.add(node, name, version)
+
+
+    def add(self, node, name, version):
+        """Record that the input node carries the named data at version"""
+        if USE_INDEX_NODE:
+            _index_node.add(node, name, version)
+
+        if self._built:
+            self._add(node, name, version)
+
+
+    def remove(self, node, name = None):
+        """Forget the named data (or all data if name is None) on the node"""
+        if USE_INDEX_NODE and name is not None:
+            _index_node.remove(node, name)
+
+        if not self._built:
+            return
+
+        names = self._nodes.get(node, {})
+        if name is not None:
+            names = {name: None} if name in names else {}
+
+        for data_name in list(names):
+            self._classes[data_name].pop(node, None)
+            self._nodes[node].pop(data_name, None)
+
+        if not self._nodes.get(node, True):
+            self._nodes.pop(node)
+
+
+    def node_added(self, node):
+        """Called by an IndexHook when a node is added to the scene
+
+        The node can be any handle the hook's get_node() turns into a node.
+        """
+        if self._built:
+            self._pending.add(node)
+
+
+    def node_removed(self, node):
+        """Called by an IndexHook when a node is removed from the scene"""
+        self._pending.discard(node)
+        RecordTable.invalidate(node)
+        self.remove(node)
+
+
+    def has_data(self, node, name = None):
+        """Does the node carry the named data (or any data if name is None)?"""
+        self._sync()
+        names = self._nodes.get(node)
+        if not names:
+            return False
+
+        return name is None or name in names
+
+
+    def get_nodes(self, name = None):
+        """Returns the nodes that carry the named data (or any data if None)"""
+        self._sync()
+        if name is None:
+            return list(self._nodes)
+
+        return list(self._classes.get(name, {}))
+
+
+    def get_version(self, node, name):
+        """Returns the indexed record version of the named data on the node"""
+        self._sync()
+        return self._nodes.get(node, {}).get(name)
+
+
+
+_scene_index = SceneIndex()
+
+
+
+class IndexNode(object):
+    """Saves which nodes carry which BaseData records on a node in the scene
+
+    Each class gets a message multi that the data nodes are connected to
+    and a string multi with the version of each connected node. The
+    SceneIndex keeps the node up-to-date when USE_INDEX_NODE is True and
+    builds itself from the connected nodes, so the first query after a
+    scene is opened only reads the records of the indexed nodes.
+
+    Index nodes that come in with imported or referenced files are read
+    too. Nodes that carry records but aren't connected to an index node
+    (ie. a script added records with cmds) are found with one ls() when
+    the SceneIndex is built, and are read and connected then.
+    """
+
+    node_name = 'udataIndex'
+    """The name of the index node"""
+
+    marker_name = 'udataIndexFormat'
+    """The attribute that marks a node as an index node"""
+
+    nodes_prefix = 'udx_'
+    """Prefix of the per-class message multi"""
+
+    versions_prefix = 'udxv_'
+    """Prefix of the per-class version string multi"""
+
+    def __init__(self):
+        super(IndexNode, self).__init__()
+        self._node = None
+        self._elements = None
+        self._next_index = {}
+
+
+    def invalidate(self):
+        """Forget the cached index node and its connections"""
+        self._node = None
+        self._elements = None
+        self._next_index = {}
+
+
+    def get_node(self):
+        """Returns the index node this scene writes to, else None"""
+        backend = get_backend()
+        if self._node is not None and backend.node_exists(self._node):
+            return self._node
+
+        self.invalidate()
+        for node in backend.ls(self.node_name):
+            if backend.has_attr(node, self.marker_name):
+                self._node = node
+                break
+
+        return self._node
+
+
+    def exists(self):
+        return self.get_node() is not None
+
+
+    def get_index_nodes(self):
+        """Returns every index node, including imported and referenced ones"""
+        backend = get_backend()
+        nodes = backend.ls('*' + self.node_name + '*', recursive = True)
+        return [node for node in nodes if backend.has_attr(node, self.marker_name)]
+
+
+    def get_nodes(self):
+        """Returns the names of every node connected to an index node"""
+        backend = get_backend()
+        node_names = collections.OrderedDict()
+        for index_node in self.get_index_nodes():
+            for attr_name in backend.list_attrs(index_node):
+                if not attr_name.startswith(self.nodes_prefix):
+                    continue
+
+                for source, destination in backend.list_connections(index_node, attr_name):
+                    node_names[source.split('.')[0]] = True
+
+        return list(node_names)
+
+
+    def get_unindexed_nodes(self, indexed = None):
+        """Returns the names of the nodes with records that no index node has
+
+        Args:
+            indexed (str list, optional) : The result of get_nodes(), if
+            the caller already has it.
+        """
+        backend = get_backend()
+        if indexed is None:
+            indexed = self.get_nodes()
+
+        #find_attrs() names the indexed nodes the same way as every other node
+        found = backend.find_attrs([_RECORDS_NAME])[_RECORDS_NAME]
+        connected = set(backend.find_attrs([_RECORDS_NAME], indexed)[_RECORDS_NAME])
+        return [node_name for node_name in found if node_name not in connected]
+
+
+    def _get_elements(self, index_node):
+        #(class name, node) -> element index of the index node we write to
+        if self._elements is None:
+            backend = get_backend()
+            self._elements = {}
+            for attr_name in backend.list_attrs(index_node):
+                if not attr_name.startswith(self.nodes_prefix):
+                    continue
+
+                name = attr_name[len(self.nodes_prefix):]
+                for source, destination in backend.list_connections(index_node, attr_name):
+                    index = int(destination.rsplit('[', 1)[1].rstrip(']'))
+                    self._elements[(name, backend.to_node(source.split('.')[0]))] = index
+
+        return self._elements
+
+
+    def _get_attrs(self, index_node, name):
+        backend = get_backend()
+        nodes_attr = self.nodes_prefix + name
+        versions_attr = self.versions_prefix + name
+        if not backend.has_attr(index_node, nodes_attr):
+            backend.add_attr(index_node, nodes_attr, at = 'message', m = True, im = False)
+            backend.add_attr(index_node, versions_attr, dt = 'string', m = True)
+
+        if name not in self._next_index:
+            indices = backend.get_multi_indices(index_node, versions_attr)
+            self._next_index[name] = indices[-1] + 1 if indices else 0
+
+        return (nodes_attr, versions_attr)
+
+
+    def add(self, node, name, version):
+        """Connect the node to the index and save the version of its data
+
+        If the scene has no index node yet, the whole scene is indexed.
+        """
+        index_node = self.get_node()
+        if index_node is None:
+            self.repair()
+            return
+
+        backend = get_backend()
+        elements = self._get_elements(index_node)
+        nodes_attr, versions_attr = self._get_attrs(index_node, name)
+        index_node_name = _get_node_name(index_node)
+
+        index = elements.get((name, node))
+        if index is None:
+            index = self._next_index[name]
+            self._next_index[name] += 1
+            backend.connect('{0}.message'.format(_get_node_name(node)),
+                            '{0}.{1}[{2}]'.format(index_node_name, nodes_attr, index))
+            elements[(name, node)] = index
+
+        backend.set_attr(index_node, '{0}[{1}]'.format(versions_attr, index),
+                         '.'.join(map(str, version)), 'string')
+
+
+    def remove(self, node, name):
+        """Disconnect the node's named data from the index"""
+        index_node = self.get_node()
+        if index_node is None:
+            return
+
+        index = self._get_elements(index_node).pop((name, node), None)
+        if index is None:
+            return
+
+        backend = get_backend()
+        backend.remove_multi_instance(index_node, '{0}{1}[{2}]'.format(self.nodes_prefix, name, index))
+        backend.remove_multi_instance(index_node, '{0}{1}[{2}]'.format(self.versions_prefix, name, index))
+
+
+    def get_versions(self, index_node = None):
+        """Returns the saved {class name: {node name: version}} of an index node"""
+        backend = get_backend()
+        index_node = index_node or self.get_node()
+        versions = {}
+        if index_node is None:
+            return versions
+
+        for attr_name in backend.list_attrs(index_node):
+            if not attr_name.startswith(self.nodes_prefix):
+                continue
+
+            name = attr_name[len(self.nodes_prefix):]
+            saved = dict(backend.read_multi_strings(self.versions_prefix + name, [index_node])[0][1])
+            for source, destination in backend.list_connections(index_node, attr_name):
+                index = int(destination.rsplit('[', 1)[1].rstrip(']'))
+                record = _parse_record_string('{0}:{1}'.format(name, saved.get(index, '')))
+                if record:
+                    versions.setdefault(name, {})[source.split('.')[0]] = record[1]
+
+        return versions
+
+
+    def repair(self, undoable = True):
+        """Rebuild the index node from a scan of every node in the scene
+
+        Returns:
+            int : How many records were indexed.
+        """
+        backend = get_backend()
+        with _undo_chunk('udata.IndexNode.repair', undoable):
+            index_node = self.get_node()
+            if index_node is None:
+                index_node = backend.create_node(DEFAULT_NODE_TYPE, name = self.node_name)
+                backend.add_attr(index_node, self.marker_name, at = 'long', dv = 1)
+            else:
+                for attr_name in backend.list_attrs(index_node):
+                    if attr_name.startswith(self.nodes_prefix) or attr_name.startswith(self.versions_prefix):
+                        backend.delete_attr(index_node, attr_name)
+
+            self.invalidate()
+            self._node = index_node
+
+            records = Utils.scan_records()
+            for node_name, name, version in records:
+                self.add(backend.to_node(node_name), name, version)
+
+        return len(records)
+
+
+
+_index_node = IndexNode()
+
+
+
+ChangeEntry = collections.namedtuple('ChangeEntry', ['seq', 'node', 'name', 'field', 'action'])
+"""A (sequence number, node name, class name, field, action) journal entry
+
+The action is 'add', 'update', 'delete' or 'set'. The field is None when
+the whole data block was added, updated or deleted.
+"""
+
+
+
+class ChangeJournal(object):
+    """An opt-in log of the udata blocks that changed
+
+    Once enabled, every block that's added, updated or deleted and every
+    field that's set through the udata API is journaled with a
+    monotonically increasing sequence number. The installed JournalHook
+    also reports fields that are set outside of udata (ie. in the attribute
+    editor). Consumers remember the latest() sequence number they processed
+    and ask for changes_since() it on their next run.
+
+    The journal only keeps the newest max_entries entries. The journal can
+    be saved to (and loaded from) a node in the scene so the sequence
+    numbers survive a save and re-open. The default MayaJournalHook does
+    this automatically.
+    """
+
+    node_name = 'udataChangeJournal'
+    """The name of the node the journal is saved on"""
+
+    attr_name = 'udataJournal'
+    """The string attribute the journal is saved in"""
+
+    def __init__(self, max_entries = 100000):
+        super(ChangeJournal, self).__init__()
+
+        self.max_entries = max_entries
+        self._seq = 0
+        self._seqs = []
+        self._entries = []
+        self._enabled = False
+        self._muted = 0
+        self._hook = None
+
+
+    def enable(self, hook = None):
+        """Start journaling changes
+
+        Args:
+            hook (JournalHook, optional) : Reports edits made outside of
+            udata. Defaults to the active Backend's journal hook.
+        """
+        if self._enabled:
+            return
+
+        self._enabled = True
+        self._hook = hook or get_backend().create_journal_hook()
+        self._hook.install(self)
+        for node in _scene_index.get_nodes():
+            self._hook.watch(node)
+
+
+    def disable(self):
+        """Stop journaling changes, the entries are kept"""
+        if self._hook is not None:
+            self._hook.uninstall()
+
+        self._hook = None
+        self._enabled = False
+
+
+    def is_enabled(self):
+        return self._enabled
+
+
+    def latest(self):
+        """Returns the sequence number of the newest entry"""
+        return self._seq
+
+
+    def clear(self):
+        """Forget every entry, sequence numbers keep increasing"""
+        self._seqs = []
+        self._entries = []
+
+
+    def watch(self, node):
+        """Ask the hook to report the edits made to the input node"""
+        if self._enabled:
+            self._hook.watch(node)
+
+
+    @contextlib.contextmanager
+    def muted(self):
+        """Ignore the hook while udata makes its own (journaled) edits"""
+        self._muted += 1
+        try:
+            yield
+        finally:
+            self._muted -= 1
+
+
+    def record(self, node, name, field = None, action = 'set'):
+        """Add an entry and return its sequence number (None if disabled)"""
+        if not self._enabled:
+            return None
+
+        self._seq += 1
+        self._seqs.append(self._seq)
+        self._entries.append( ChangeEntry(self._seq, _get_node_name(node), name, field, action) )
+
+        if len(self._entries) > self.max_entries:
+            del self._seqs[:-self.max_entries]
+            del self._entries[:-self.max_entries]
+
+        return self._seq
+
+
+    @contextlib.contextmanager
+    def recording(self, nodes, name, fields = (None,), action = 'set'):
+        """Make udata edits and journal them once the edits are done"""
+        with self.muted():
+            yield
+
+        if self._enabled:
+            for node in nodes:
+                for field in fields:
+                    self.record(node, name, field, action)
+
+
+    def attribute_changed(self, node_name, attr_name, action = 'set'):
+        """Called by a JournalHook when an attribute of a watched node is set
+
+        Hooks report connections made or broken with the 'connect' action.
+        """
+        if not self._enabled or self._muted or attr_name == _RECORDS_NAME:
+            return
+
+        node = get_backend().to_node(node_name)
+        for name in RecordTable.get(node).names():
+            data_class = _registry.get_class(name)
+            if data_class is None:
+                continue
+
+            plan = data_class.get_schema_plan()
+            if attr_name == plan.block_name:
+                self.record(node, name, None, action)
+            elif attr_name in plan.attr_fields:
+                self.record(node, name, plan.attr_fields[attr_name], action)
+
+
+    def changes_since(self, seq):
+        """Returns the ChangeEntries newer than the sequence number
+
+        Returns None if entries newer than seq have already been dropped,
+        in which case everything should be re-processed.
+        """
+        if self._seqs and seq < self._seqs[0] - 1:
+            return None
+        if not self._seqs and seq < self._seq:
+            return None
+
+        return self._entries[bisect.bisect_right(self._seqs, seq):]
+
+
+    def get_changed_nodes(self, seq, name = None):
+        """Returns the names of the nodes changed since the sequence number
+
+        Args:
+            seq (int) : The latest() value of the last processed run.
+            name (str, optional) : Only report changes to this class's data.
+
+        Returns:
+            list : Node names in the order they first changed, or None if
+            the journal no longer reaches back to seq.
+        """
+        changes = self.changes_since(seq)
+        if changes is None:
+            return None
+
+        nodes = collections.OrderedDict()
+        for entry in changes:
+            if name is None or entry.name == name:
+                nodes[entry.node] = True
+
+        return list(nodes)
+
+
+    def to_dict(self):
+        return {'seq': self._seq, 'entries': [list(entry) for entry in self._entries]}
+
+
+    def from_dict(self, data):
+        self._entries = [ChangeEntry(*entry) for entry in data.get('entries', [])]
+        self._seqs = [entry.seq for entry in self._entries]
+        self._seq = data.get('seq', self._seqs[-1] if self._seqs else 0)
+
+
+    def save(self):
+        """Write the journal to a node in the scene"""
+        backend = get_backend()
+        nodes = backend.ls(self.node_name)
+        if nodes:
+            node = nodes[0]
+        else:
+            node = backend.create_node(DEFAULT_NODE_TYPE, name = self.node_name)
+
+        if not backend.has_attr(node, self.attr_name):
+            backend.add_attr(node, self.attr_name, dt = 'string')
+
+        with self.muted():
+            backend.set_attr(node, self.attr_name, json.dumps(self.to_dict()), 'string')
+
+
+    def load(self):
+        """Replace the journal with the one saved in the scene (if any)
+
+        Returns:
+            bool : True if a saved journal was found.
+        """
+        backend = get_backend()
+        nodes = backend.ls(self.node_name)
+        if not nodes or not backend.has_attr(nodes[0], self.attr_name):
+            self.clear()
+            return False
+
+        self.from_dict(json.loads(backend.get_attr(nodes[0], self.attr_name) or '{}'))
+        return True
+
+
 
-            
-    @classmethod
-    def _create_data(cls):     
-        attrs = cls.attributes
-        long_name = cls.get_name()
-        
-        flags = cls.get_default_flags()
-        cls._clear_invalid_flags(flags)        
-        
-        pm.addAttr(cls._node, ln = long_name, at = 'compound', nc = len( attrs ), **flags )
+_journal = ChangeJournal()
 
-        prefix = cls.get_prefix()
-        if prefix:
-            prefix += '_'
 
-        for attr in attrs:
-            cls._add_attr(attr, prefix, long_name)       
-         
-        return cls._node.attr(long_name)
-        
-    @classmethod   
-    def post_create(cls, data):
-        """Called after the data has been created.
-        
-        This function doesn't do anything by default and exists purely
-        for end-user convenience.  What a great place for adding your new
-        data to an existing node network!
-        
-        Args:
-            data (pymel.general.Attr) : The newly created data. 
-        
-        """        
-        pass
-              
-    @classmethod
-    def get_data(cls, node, force_add = False):
-        """Attempts to return the class data stored on the input node.
-        
+
+UpgradeProgress = collections.namedtuple('UpgradeProgress', ['done', 'failed', 'total', 'node', 'name'])
+"""Sent to UpgradeQueue callbacks after each deferred update"""
+
+
+
+class UpgradeQueue(object):
+    """Outdated (node, class) pairs waiting to be updated when Maya is idle
+
+    When udata.DEFER_UPDATES is True, BaseData.get_data() adds outdated
+    data to the queue instead of updating it. The queue asks its scheduler
+    to call it back when Maya is idle and then updates at most batch_size
+    pairs or time_budget seconds worth before handing control back, so a
+    large scene is migrated without freezing the UI.
+
+    Callbacks are called with an UpgradeProgress after every update. The
+    queue is finished when done equals total.
+    """
+
+    def __init__(self, batch_size = 50, time_budget = 0.05):
+        super(UpgradeQueue, self).__init__()
+
+        self.batch_size = batch_size
+        """The most updates made per idle callback"""
+
+        self.time_budget = time_budget
+        """The most seconds spent per idle callback, 0 for no limit"""
+
+        self.scheduler = None
+        """A callable that runs a function later, ie. maya.utils.executeDeferred.
+        Defaults to the active Backend.defer()"""
+
+        self._pending = collections.OrderedDict()
+        self._callbacks = []
+        self._scheduled = False
+        self._updating = 0
+        self._done = 0
+        self._failed = 0
+        self._total = 0
+
+
+    def __len__(self):
+        return len(self._pending)
+
+
+    @staticmethod
+    def _get_key(node, data_class):
+        return (_get_node_name(node), data_class.get_name())
+
+
+    def add(self, node, data_class):
+        """Queue the data of a class on a node for a deferred update"""
+        key = self._get_key(node, data_class)
+        if key in self._pending:
+            return
+
+        self._pending[key] = (node, data_class)
+        self._total += 1
+        self._schedule()
+
+
+    def discard(self, node, data_class):
+        """Take the pair off the queue if it's there"""
+        if self._pending and self._pending.pop(self._get_key(node, data_class), None):
+            self._total -= 1
+
+
+    def is_pending(self, node, data_class):
+        """Is the data of the class on the node waiting to be updated?"""
+        return self._get_key(node, data_class) in self._pending
+
+
+    def is_updating(self):
+        """Is the queue running an update right now?"""
+        return self._updating > 0
+
+
+    def clear(self):
+        """Forget every queued pair without updating it"""
+        self._pending.clear()
+        self._done = self._failed = self._total = 0
+
+
+    def add_callback(self, callback):
+        """Call callback(UpgradeProgress) after every deferred update"""
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+
+    def remove_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+
+    def _schedule(self):
+        if self._scheduled or not self._pending:
+            return
+
+        self._scheduled = True
+        scheduler = self.scheduler or get_backend().defer
+        scheduler(self._run)
+
+
+    def _run(self):
+        self._scheduled = False
+        self.process()
+        self._schedule()
+
+
+    def _update(self, node, data_class):
+        if not get_backend().node_exists(node):
+            return False
+
+        self._updating += 1
+        try:
+            data_class.get_data(node)
+        finally:
+            self._updating -= 1
+
+        return RecordTable.get(node).get_version(data_class.get_name()) == data_class.get_class_version()
+
+
+    def process(self, batch_size = None, time_budget = None):
+        """Update the next batch of queued pairs
+
         Args:
-            node (pyNode) : The node you want to get/store data on
-            force_add (bool) : Should the data be added if none exists?
-            
+            batch_size (int, optional) : Defaults to self.batch_size.
+            time_budget (float, optional) : Defaults to self.time_budget.
+            0 processes the whole batch.
+
         Returns:
-            pymel.general.Attr : The data stored on the node or None.        
+            int : How many pairs were processed.
         """
+        batch_size = batch_size or self.batch_size
+        time_budget = self.time_budget if time_budget is None else time_budget
 
-        #We need to cache the current data, because get_data might be called
-        #while doing an update. As this function gets deeper in scope, we
-        #need to make sure we reset the data as we leave the scope. reseting
-        #happens on exit.
-        cls._data_stack.append((cls._records, cls._node))
-        
-        cls._records = None
-        cls._node    = node
-        
-        record = cls.get_record(node)
-        
-        if not record and force_add:
-            #lets make sure the records data exists
-            cls._records = cls._get_records(node, force_add = True)
-            
-        #If found make sure the data block doesn't need updating.
-        if record:
-            data_name = cls.get_name() 
-            record_version = record.version
-            current_version = cls.get_class_version()
-            
-            #Attempt to updat the version
-            if record_version < current_version:
-                old_data = cls._node.attr(data_name)
-                
-                if cls.pre_update_version(old_data, record_version):
-                    updated = cls.update_version(old_data, record_version)
-                    if updated:
-                        record.version = current_version
-                                
-                    data = cls._node.attr(data_name)
-                    cls.post_update_version( data, updated )
+        start = time.perf_counter()
+        count = 0
+        with _undo_chunk('udata.deferred_update'):
+            while self._pending and count < batch_size:
+                if count and time_budget and time.perf_counter() - start >= time_budget:
+                    break
 
-            
-            data = cls._node.attr(data_name)
-                    
-        #else, add the data to the node           
-        elif force_add:
-            cls._find_attr_conflicts()
-            data = cls._create_data()
-            cls._add_data_to_records()
-            cls.post_create( data )
-            
-        else:
-            data = None
+                key, (node, data_class) = self._pending.popitem(last=False)
+                try:
+                    updated = self._update(node, data_class)
+                except Exception as e:
+                    updated = False
+                    if REPORT_WARNINGS:
+                        _warning('cg3dguru.udata : Deferred update of {0} on "{1}" failed : {2}'.format(key[1], key[0], e))
 
-        cls._records, cls._node = cls._data_stack.pop(-1)
+                count += 1
+                self._done += 1
+                self._failed += 0 if updated else 1
+                self._notify(UpgradeProgress(self._done, self._failed, self._total, node, key[1]))
+
+        if not self._pending:
+            self._done = self._failed = self._total = 0
+
+        return count
+
+
+    def flush(self):
+        """Update every queued pair right now
 
-        return data      
-    
-    @classmethod  
-    def add_data(cls, node):
-        """Add class attributes to the input node.
-        
-        If the input node already has data on it then versioning is run to
-        ensure the data format is up-to-date.
-        
-        Args:
-            node (pyNode) : The node to add the data to.
-                
         Returns:
-            pymel.general.Attr : The data added to the node.
+            int : How many pairs were processed.
         """
-        return cls.get_data(node, force_add=True)
-    
+        count = 0
+        while self._pending:
+            count += self.process(len(self._pending), time_budget = 0)
 
-    @classmethod
-    def delete_data(cls, node):
-        """Remove the class attributes off of the input node
+        return count
+
+
+    def _notify(self, progress):
+        for callback in list(self._callbacks):
+            callback(progress)
+
+
+
+_upgrade_queue = UpgradeQueue()
+
+
+
+DataEdge = collections.namedtuple('DataEdge', ['source', 'name', 'field', 'target'])
+"""A message connection from a field of the named class on source to target"""
+
+
+
+class DataGraph(object):
+    """The message attribute network between nodes that carry class data
+
+    Every message field of the graph's classes is an edge from the node
+    that carries the data to the node on the other end of the connection,
+    whichever way round the connection was made. All of the connections are
+    read with one Backend.list_connections_many() call when the graph is
+    built, after which traversals are answered from memory and cached.
+
+    Graphs are built (and re-used) by Utils.build_data_graph(). A graph is
+    stale once records are invalidated (ie. a scene is opened) or, with an
+    enabled ChangeJournal, once the journal reports data being added,
+    deleted, updated or a message field being connected. Without the
+    journal, edits to connections can't be seen, so rebuild the graph after
+    editing the network.
+    """
+
+    def __init__(self, classes):
+        super(DataGraph, self).__init__()
+
+        self.classes = tuple(classes)
+        self.nodes = set()
+        """The names of the nodes that carry data of the graph's classes"""
+
+        self._names = set(data_class.get_name() for data_class in self.classes)
+        self._message_fields = dict((data_class.get_name(), set(field for field, entry in data_class.get_schema_plan().fields.items()
+                                                                if entry.attr_type == 'message'))
+                                    for data_class in self.classes)
+        self._out = collections.defaultdict(list)
+        self._in = collections.defaultdict(list)
+        self._cache = {}
+        self._seq = _journal.latest()
+        self._generation = RecordTable._generation
+
+
+    def build(self):
+        """Read the scene's connections into the graph"""
+        self._out.clear()
+        self._in.clear()
+        self._cache = {}
+        self.nodes = set()
+        self._seq = _journal.latest()
+        self._generation = RecordTable._generation
+
+        classes = dict((data_class.get_name(), data_class) for data_class in self.classes)
+        plugs = []
+        plug_edges = []
+        for record in Utils.scan_records():
+            if record.name not in classes:
+                continue
+
+            self.nodes.add(record.node)
+            plan = classes[record.name].get_schema_plan()
+            for field in sorted(self._message_fields[record.name]):
+                plugs.append( (record.node, plan.fields[field].name) )
+                plug_edges.append( (record.node, record.name, field) )
+
+        seen = set()
+        for i, own, other, incoming in get_backend().list_connections_many(plugs):
+            source, name, field = plug_edges[i]
+            edge = DataEdge(source, name, field, other.split('.')[0])
+            if edge not in seen:
+                seen.add(edge)
+                self._out[edge.source].append(edge)
+                self._in[edge.target].append(edge)
+
+        return self
+
+
+    def is_stale(self):
+        """Has the network changed since the graph was built?"""
+        if self._generation != RecordTable._generation:
+            return True
+
+        if not _journal.is_enabled():
+            return False
+
+        changes = _journal.changes_since(self._seq)
+        if changes is None:
+            return True
+
+        for entry in changes:
+            if entry.name not in self._names:
+                continue
+
+            if entry.action in ('add', 'delete', 'update') or entry.field in self._message_fields[entry.name]:
+                return True
+
+        #nothing relevant changed, skip these entries next time
+        self._seq = _journal.latest()
+        return False
+
+
+    def edges(self, node):
+        """Returns the DataEdges that start at the node"""
+        return list(self._out.get(_get_node_name(node), []))
+
+
+    def referrers(self, node):
+        """Returns the DataEdges that end at the node (a reverse lookup)"""
+        return list(self._in.get(_get_node_name(node), []))
+
+
+    def successors(self, node):
+        """Returns the names of the nodes the node links to"""
+        return list(collections.OrderedDict.fromkeys(edge.target for edge in self.edges(node)))
+
+
+    def predecessors(self, node):
+        """Returns the names of the nodes that link to the node"""
+        return list(collections.OrderedDict.fromkeys(edge.source for edge in self.referrers(node)))
+
+
+    def _neighbours(self, node_name, reverse):
+        edges = self._in.get(node_name, []) if reverse else self._out.get(node_name, [])
+        return [edge.source if reverse else edge.target for edge in edges]
+
+
+    def bfs(self, start, reverse = False):
+        """Returns the node names reachable from start in breadth-first order
 
         Args:
-            node (pyNode) : The node to remove the data from.        
+            start (pyNode or str) : The node to start from. It's included
+            as the first item.
+            reverse (bool, optional) : Follow the edges backwards.
         """
-        record = cls.get_record(node)
-        
-        if record:
-            record.attr.unlock()
-            pm.removeMultiInstance(record.attr, b=True)
-            pm.deleteAttr(node, at = cls.get_name() )   
-            
+        start = _get_node_name(start)
+        key = ('bfs', start, reverse)
+        if key not in self._cache:
+            order = [start]
+            visited = set(order)
+            queue = collections.deque(order)
+            while queue:
+                for neighbour in self._neighbours(queue.popleft(), reverse):
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        order.append(neighbour)
+                        queue.append(neighbour)
 
-###----Misc Methods----
-    
-    @classmethod
-    def create_node(cls, nodeType = DEFAULT_NODE_TYPE, *args, **kwargs):
-        """Creates a new node in Maya that also contains the Class attributes.
-        
-        The default node type that's created is driven by
-        udata._DEFAULT_NODE_TYPE, but users can override this based on
-        the input params.
-        
-        Args:
-            nodeType (str, optional) : The name of the maya node to create.
-            
-        Returns:
-            Tuple : The newly created pyNode as element zero and the data as
-            element 1.
+            self._cache[key] = tuple(order)
+
+        return list(self._cache[key])
+
+
+    def dfs(self, start, reverse = False):
+        """Returns the node names reachable from start in depth-first pre-order
+
+        See bfs() for the args.
         """
-        pynode = pm.general.createNode(nodeType, **kwargs)
-    
-        if pynode:
-            #classInstance = cls()
-            data = cls.get_data(pynode, force_add=True)
-            
-        return (pynode, data)   
-    
+        start = _get_node_name(start)
+        key = ('dfs', start, reverse)
+        if key not in self._cache:
+            order = []
+            visited = set()
+            stack = [start]
+            while stack:
+                node_name = stack.pop()
+                if node_name in visited:
+                    continue
+
+                visited.add(node_name)
+                order.append(node_name)
+                stack.extend(reversed(self._neighbours(node_name, reverse)))
+
+            self._cache[key] = tuple(order)
+
+        return list(self._cache[key])
+
+
+    def get_reachable(self, start, reverse = False):
+        """Returns the set of node names reachable from start, start included"""
+        start = _get_node_name(start)
+        key = ('reachable', start, reverse)
+        if key not in self._cache:
+            self._cache[key] = frozenset(self.bfs(start, reverse))
+
+        return self._cache[key]
+
+
+    def is_reachable(self, source, target):
+        """Can target be reached from source by following the edges?"""
+        return _get_node_name(target) in self.get_reachable(source)
+
+
+
+_data_graphs = {}
+
+
 
-    
 class Utils(object):
     """Easy module and maya scene inspection
     
@@ -826,25 +3816,49 @@ class Utils(object):
     
     
     @staticmethod
-    def get_classes():
-        """Returns all BaseData subclass"""
-        classes = BaseData.__subclasses__()
-        return classes
+    def get_classes(module = None):
+        """Returns all BaseData subclasses, including subclasses of subclasses
+
+        Args:
+            module (str, optional) : Only return classes defined in this
+            module or package.
+        """
+        return _registry.get_classes(module)
     
     
     @staticmethod
-    def get_class_names():
-        """Returns a list of all BaseData subclass names."""
-        sub_classes = Utils.get_classes()
+    def get_class_names(module = None):
+        """Returns a dict of BaseData subclasses keyed by their get_name()
+
+        Args:
+            module (str, optional) : Only return classes defined in this
+            module or package.
+        """
         class_names = {}
-        for subclass in sub_classes:
+        for subclass in _registry.get_classes(module):
             class_names[ subclass.get_name() ] = subclass
             
         return class_names
 
+
+    @staticmethod
+    def get_class(name):
+        """Returns the BaseData subclass whose get_name() matches, else None"""
+        return _registry.get_class(name)
+
+
+    @staticmethod
+    def get_registry():
+        """Returns the DataRegistry that records every BaseData subclass
+
+        Call get_registry().refresh(data_class) if a class's attributes are
+        changed after it has been defined.
+        """
+        return _registry
+
     
     @staticmethod
-    def find_attribute_conflicts(error_on_conflict = True):
+    def find_attribute_conflicts(error_on_conflict = True, module = None):
         """Find any attribute naming conflicts between the BasData subclasses.
         
         Since the BaseData.attributes are written to Maya as basic attributes
@@ -857,43 +3871,29 @@ class Utils(object):
         should be a non-issue. this function will print any found conflicts
         in the output window and optionally raise an error if a conflict has
         been found.
-        
-        Args:
-            error_on_conflict (bool) : Should an error be raised if a
-            conflict is found?
-        """
-        
-        conflicts = {}
-        attrs = {}
-        for subclass in Utils.get_classes():
-            default_flags = subclass.get_default_flags()
-            
-            #if the Class is going to be added with a mutli flag, then
-            #there shouldn't be any conflicts with its attributes
-            if 'm' in default_flags or 'multi' in default_flags:
-                continue
-            
-            attribute_names = subclass.get_attribute_names()
-            for attr_name in attribute_names:
-                if attr_name not in attrs:
-                    attrs[attr_name] = [subclass.__name__]
-                else:
-                    attrs[attr_name].append(subclass.__name__)
-                    
-        for attr_name in attrs:
-            classes = attrs[attr_name]
-            
-            if len(classes) > 1:
-                conflicts[attr_name] = classes
+
+        The conflicts are maintained by the DataRegistry as classes are
+        defined, so this doesn't re-inspect every class.
+        
+        Args:
+            error_on_conflict (bool) : Should an error be raised if a
+            conflict is found?
+            module (str, optional) : Only consider classes defined in this
+            module or package.
+
+        Returns:
+            dict : The names of the conflicting classes keyed by attribute name.
+        """
+        conflicts = _registry.get_conflicts(module)
                 
         if conflicts:
             for attr_name in conflicts:
                 classes = conflicts[attr_name]
                 if REPORT_WARNINGS:
-                    pm.warning( 'udata.Utils :: Attr conflict. : "{0}" exists in classes: {1}'.format(attr_name, classes))
+                    _warning( 'udata.Utils :: Attr conflict. : "{0}" exists in classes: {1}'.format(attr_name, classes))
                 
             if error_on_conflict:
-                pm.error( 'udata.Utils :: Found conflict between attribute names. See console for info.')
+                _error( 'udata.Utils :: Found conflict between attribute names. See console for info.')
                 
         return conflicts
     
@@ -906,6 +3906,9 @@ class Utils(object):
         provided they can pass in the standard pymel.core.ls args to generate
         a list of node to inspect.
         
+        When udata.USE_SCENE_INDEX is True the search is answered from the
+        SceneIndex, so only nodes with outdated data are inspected in Maya.
+        
         Args:
             nodes (pyNode list, optional) : What nodes should the function
             search?
@@ -917,10 +3920,13 @@ class Utils(object):
         Returns:
             list : A list of pyNodes that match the given search criteria. 
         """
+        if USE_SCENE_INDEX:
+            return Utils._get_indexed_nodes_with_data(nodes, data_class, *args, **kwargs)
+
         if not nodes:
-            nodes = pm.ls(*args, **kwargs)
+            nodes = get_backend().ls(*args, **kwargs)
             nodes.sort()
-        
+
         data_nodes = []
         for node in nodes:
             if data_class:
@@ -932,8 +3938,575 @@ class Utils(object):
                 data_nodes.append(node)
                 
         return data_nodes
-    
-    
+
+
+    @staticmethod
+    def _get_indexed_nodes_with_data(nodes, data_class, *args, **kwargs):
+        name = data_class.get_name() if data_class else None
+
+        if not nodes and not args and not kwargs:
+            data_nodes = _scene_index.get_nodes(name)
+            data_nodes.sort()
+        else:
+            if not nodes:
+                nodes = get_backend().ls(*args, **kwargs)
+                nodes.sort()
+
+            data_nodes = [node for node in nodes if _scene_index.has_data(node, name)]
+
+        #get_data() performs the version check on outdated data, so only
+        #the nodes whose indexed version is old need to be touched.
+        if data_class:
+            current_version = data_class.get_class_version()
+            for node in data_nodes:
+                if _scene_index.get_version(node, name) < current_version:
+                    data_class.get_data(node)
+
+        return data_nodes
+
+
+    @staticmethod
+    def scan_records(nodes = None, data_class = None):
+        """Returns every record found on the input nodes or in the scene
+
+        This is a strictly read-only scan. Unlike get_nodes_with_data() no
+        version checks are run, so outdated data is reported as-is. All
+        record strings are read with one Backend.read_multi_strings() call,
+        which the default CmdsBackend answers through one batch of MPlugs.
+
+        Args:
+            nodes (pyNode or str list, optional) : Limit the scan to these
+            nodes. The whole scene is scanned if this is None.
+            data_class (BaseData sub-class, optional) : Only report records
+            of this class.
+
+        Returns:
+            list : ScanRecord (node name, class name, version) tuples.
+        """
+        data_name = data_class.get_name() if data_class else None
+
+        found = []
+        for node_name, elements in get_backend().read_multi_strings(_RECORDS_NAME, nodes):
+            for index, value in elements:
+                record = _parse_record_string(value)
+                if not record:
+                    continue
+
+                if data_name is None or record[0] == data_name:
+                    found.append(ScanRecord(node_name, *record))
+
+        return found
+
+
+    @staticmethod
+    def _iter_record_chunks(nodes = None, data_class = None, node_type = None, chunk_size = 1000, time_budget = None):
+        """Yield lists of ScanRecords, reading chunk_size nodes at a time
+
+        A list is yielded once it holds chunk_size records or time_budget
+        seconds have passed since the last yield, so lists may be empty.
+        """
+        backend = get_backend()
+        if nodes is None:
+            names = backend.iter_node_names(node_type)
+        else:
+            names = (backend.node_name(node) for node in nodes)
+
+        data_name = data_class.get_name() if data_class else None
+        found = []
+        pending = []
+        start = time.perf_counter()
+
+        def scan():
+            for node_name, elements in backend.read_multi_strings(_RECORDS_NAME, pending):
+                for index, value in elements:
+                    record = _parse_record_string(value)
+                    if record and (data_name is None or record[0] == data_name):
+                        found.append(ScanRecord(node_name, *record))
+
+        for name in names:
+            pending.append(name)
+            if len(pending) < chunk_size:
+                continue
+
+            scan()
+            pending = []
+            if len(found) >= chunk_size or (time_budget is not None and time.perf_counter() - start >= time_budget):
+                yield found
+                found = []
+                start = time.perf_counter()
+
+        if pending:
+            scan()
+
+        if found:
+            yield found
+
+
+    @staticmethod
+    def iter_nodes_with_data(nodes = None, data_class = None, node_type = None, chunk_size = 1000, time_budget = None):
+        """Yield lists of the nodes that have any (or specific) data attached
+
+        Unlike get_nodes_with_data() the scene is never listed in one go.
+        Node names are walked with a lightweight iterator (the CmdsBackend
+        uses MItDependencyNodes) and their records are read chunk_size nodes
+        at a time, so memory stays flat no matter how big the scene is. Like
+        scan_records() this is read-only and no version checks are run.
+
+        Callers that spread the work across idle events can pass a
+        time_budget. A list (possibly empty) is then yielded whenever the
+        budget runs out, handing control back to the caller.
+
+        Args:
+            nodes (pyNode iterable, optional) : The nodes to search. Every
+            node in the scene is searched if this is None.
+            data_class (BaseData sub-class, optional) : Only yield nodes
+            with this class data.
+            node_type (str, optional) : Only search nodes of this exact type.
+            chunk_size (int, optional) : How many nodes are read at once and
+            the most nodes yielded at once.
+            time_budget (float, optional) : The most seconds between yields.
+
+        Yields:
+            list : Node handles, in scene order.
+        """
+        backend = get_backend()
+        for records in Utils._iter_record_chunks(nodes, data_class, node_type, chunk_size, time_budget):
+            node_names = collections.OrderedDict.fromkeys(record.node for record in records)
+            yield [backend.to_node(node_name) for node_name in node_names]
+
+
+    @staticmethod
+    def _get_stream_classes(classes):
+        if classes is None:
+            return Utils.get_class_names()
+
+        stream_classes = {}
+        for data_class in classes:
+            if isinstance(data_class, str):
+                name = data_class
+                data_class = _registry.get_class(name)
+                if data_class is None:
+                    _error('udata Module: Unknown class "{0}"'.format(name))
+
+            stream_classes[data_class.get_name()] = data_class
+
+        return stream_classes
+
+
+    @staticmethod
+    def _open_stream(path, mode, compress):
+        if compress is None:
+            compress = path.endswith('.gz')
+
+        if compress:
+            return gzip.open(path, mode + 't', encoding='utf-8')
+
+        return open(path, mode, encoding='utf-8')
+
+
+    @staticmethod
+    def _read_stored_values(node_name, data_class, fields):
+        """Read the fields that still exist on outdated data"""
+        backend = get_backend()
+        plan = data_class.get_schema_plan()
+        values = {}
+        for field in fields:
+            entry = plan.get_entry(field)
+            if backend.has_attr(node_name, entry.name):
+                values[field] = backend.read_value(node_name, entry)
+
+        return values
+
+
+    @staticmethod
+    def _iter_stream_records(records, classes):
+        groups = collections.OrderedDict()
+        for record in records:
+            if record.name in classes:
+                groups.setdefault(record.name, []).append(record)
+
+        for name, group in groups.items():
+            data_class = classes[name]
+            version = data_class.get_class_version()
+            fields = list(data_class.get_schema_plan().value_fields)
+
+            current = [record for record in group if record.version == version]
+            columns = data_class.read_table([record.node for record in current], fields) if current else {}
+            for i, record in enumerate(current):
+                values = dict((field, columns[field][i]) for field in fields)
+                yield {'node': record.node, 'class': name, 'version': list(record.version), 'values': values}
+
+            for record in group:
+                if record.version != version:
+                    values = Utils._read_stored_values(record.node, data_class, fields)
+                    yield {'node': record.node, 'class': name, 'version': list(record.version), 'values': values}
+
+
+    @staticmethod
+    def export_stream(path, classes = None, compress = None, chunk_size = 1000):
+        """Write the udata of every node in the scene as NDJSON
+
+        The first line is a header with the format, udata version and the
+        version and fields of each exported class. Every other line is one
+        (node, class) record with its version and values. Records are
+        streamed from iter_nodes_with_data() and read a chunk at a time with
+        BaseData.read_table(), so memory stays flat on huge scenes.
+
+        Message attributes aren't exported, External attributes export their
+        key and records of classes that aren't loaded are skipped.
+
+        Args:
+            path (str) : The file to write.
+            classes (BaseData sub-class or name list, optional) : Only export
+            these classes. Every loaded class is exported by default.
+            compress (bool, optional) : gzip the file. Defaults to True when
+            the path ends with '.gz'.
+            chunk_size (int, optional) : How many nodes are read at once.
+
+        Returns:
+            int : How many records were written.
+        """
+        classes = Utils._get_stream_classes(classes)
+        header = {'format': STREAM_FORMAT, 'format_version': STREAM_FORMAT_VERSION,
+                  'udata_version': __version__, 'scene': get_backend().scene_path(),
+                  'classes': dict((name, {'version': list(data_class.get_class_version()),
+                                          'fields': list(data_class.get_schema_plan().value_fields)})
+                                  for name, data_class in classes.items())}
+
+        count = 0
+        with Utils._open_stream(path, 'w', compress) as stream:
+            stream.write(json.dumps(header, sort_keys=True) + '\n')
+            for records in Utils._iter_record_chunks(chunk_size = chunk_size):
+                for record in Utils._iter_stream_records(records, classes):
+                    stream.write(json.dumps(record, sort_keys=True) + '\n')
+                    count += 1
+
+        return count
+
+
+    @staticmethod
+    def _import_batch(records, result, create_missing, node_type):
+        backend = get_backend()
+        classes = Utils.get_class_names()
+        groups = collections.OrderedDict()
+
+        for record in records:
+            node_name = record.get('node')
+            try:
+                data_class = classes.get(record['class'])
+                if data_class is None:
+                    _error('udata Module: The class "{0}" isn\'t loaded'.format(record['class']))
+
+                version = tuple(record['version'])
+                current_version = data_class.get_class_version()
+                if version > current_version:
+                    _error('udata Module: {0} {1} is newer than the loaded {2}'.format(record['class'], version, current_version))
+
+                values = record.get('values', {})
+                if version < current_version:
+                    values = data_class.migrate_values(values, version)
+
+                if backend.node_exists(node_name):
+                    node = backend.to_node(node_name)
+                elif create_missing:
+                    node = Utils._create_stream_node(node_name, node_type)
+                else:
+                    _error('udata Module: The node "{0}" doesn\'t exist'.format(node_name))
+
+                data_class.add_data(node)
+                groups.setdefault((data_class, tuple(sorted(values))), []).append( (node, values) )
+            except Exception as e:
+                result.errors.append( (node_name, str(e)) )
+
+        for (data_class, fields), items in groups.items():
+            nodes = [node for node, values in items]
+            if fields:
+                columns = dict((field, [values[field] for node, values in items]) for field in fields)
+                try:
+                    data_class.write_table(nodes, columns)
+                except Exception as e:
+                    result.errors.extend( (backend.node_name(node), str(e)) for node in nodes )
+                    continue
+
+            result.results.extend( (node, data_class.get_name()) for node in nodes )
+
+
+    @staticmethod
+    def _create_stream_node(node_name, node_type):
+        """Create the node of an import_stream() record under its exported parent
+
+        Exported DAG nodes are named by their '|parent|name' path, which
+        isn't a valid createNode name, so the node gets the leaf name and is
+        parented to the node at the rest of the path.
+        """
+        backend = get_backend()
+        parent, separator, name = node_name.rpartition('|')
+        if not parent:
+            return backend.create_node(node_type, name = name)
+
+        if not backend.node_exists(parent):
+            _error('udata Module: Can\'t create "{0}", its parent doesn\'t exist'.format(node_name))
+
+        return backend.create_node(node_type, name = name, parent = parent)
+
+
+    @staticmethod
+    def import_stream(path, compress = None, create_missing = False, node_type = DEFAULT_NODE_TYPE,
+                      batch_size = 1000, undoable = True):
+        """Apply the records of an export_stream() file to the scene
+
+        Records are read a batch at a time. Each node gets the class data
+        (running the usual version checks on data already in the scene) and
+        the values of the batch are written with BaseData.write_table().
+        Records exported from an older class version go through
+        BaseData.migrate_values() first.
+
+        Args:
+            path (str) : The file to read.
+            compress (bool, optional) : The file is gzipped. Defaults to True
+            when the path ends with '.gz'.
+            create_missing (bool, optional) : Create nodes that aren't in the
+            scene instead of reporting an error. Nodes named by a DAG path
+            are created under their parent, which must already exist.
+            node_type (str, optional) : The type of created nodes.
+            batch_size (int, optional) : How many records are written at once.
+            undoable (bool, optional) : When False the undo queue is turned
+            off for the import, which is faster but can't be undone.
+
+        Returns:
+            BatchResult : (node, class name) results and (node name, error
+            message) errors.
+        """
+        result = BatchResult('import_stream')
+        start = time.perf_counter()
+
+        with Utils._open_stream(path, 'r', compress) as stream:
+            try:
+                header = json.loads(stream.readline())
+            except ValueError:
+                header = None
+
+            if not isinstance(header, dict) or header.get('format') != STREAM_FORMAT:
+                _error('udata Module: {0} isn\'t a udata stream'.format(path))
+            if header.get('format_version', 0) > STREAM_FORMAT_VERSION:
+                _error('udata Module: {0} was written by a newer version of udata'.format(path))
+
+            with _undo_chunk('udata.import_stream', undoable):
+                batch = []
+                for line in stream:
+                    if not line.strip():
+                        continue
+
+                    batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        Utils._import_batch(batch, result, create_missing, node_type)
+                        batch = []
+
+                if batch:
+                    Utils._import_batch(batch, result, create_missing, node_type)
+
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+    @staticmethod
+    def check_scene(nodes = None):
+        """Find records and data blocks that don't agree with each other
+
+        Every record string is read in one bulk pass, the nodes carrying each
+        data block name in another (one ls() per name with the CmdsBackend),
+        and the two are cross-referenced in memory. If the scene has an
+        index node, records on nodes that aren't connected to it are
+        reported too. Nothing is changed, call repair() on the result to
+        fix what was found.
+
+        Args:
+            nodes (pyNode list, optional) : Limit the check to these nodes.
+            The whole scene is checked if this is None.
+
+        Returns:
+            SceneCheck : The problems that were found.
+        """
+        check = SceneCheck()
+        start = time.perf_counter()
+        backend = get_backend()
+
+        records = {}
+        for node_name, elements in backend.read_multi_strings(_RECORDS_NAME, nodes):
+            indices = collections.OrderedDict()
+            for index, value in elements:
+                record = _parse_record_string(value)
+                if record is None:
+                    check.malformed.append( (node_name, index, value) )
+                else:
+                    indices.setdefault(record[0], []).append( (record[1], index) )
+
+            records[node_name] = indices
+
+        classes = Utils.get_class_names()
+        names = set(classes)
+        for indices in records.values():
+            names.update(indices)
+
+        blocks = collections.defaultdict(set)
+        for name, node_names in backend.find_attrs(sorted(names), nodes).items():
+            for node_name in node_names:
+                blocks[node_name].add(name)
+
+        for node_name, indices in records.items():
+            for name, found in indices.items():
+                found.sort()
+                if len(found) > 1:
+                    check.duplicates.append( (node_name, name, [index for version, index in found]) )
+
+                if name not in blocks[node_name]:
+                    check.missing_blocks.append( (node_name, name, found[0][1]) )
+
+        for node_name, names in blocks.items():
+            recorded = records.get(node_name, {})
+            for name in sorted(names):
+                if name in classes and name not in recorded:
+                    check.orphan_blocks.append( (node_name, name) )
+
+        if _index_node.exists():
+            for node_name in _index_node.get_unindexed_nodes():
+                for name in records.get(node_name, {}):
+                    check.unindexed.append( (node_name, name) )
+
+        check.elapsed = time.perf_counter() - start
+        return check
+
+
+    @staticmethod
+    def get_external_keys(nodes = None):
+        """Returns the set of external store keys referenced by the nodes
+
+        This is read-only like scan_records(), so outdated data isn't
+        updated. Its External attributes are read if they still exist.
+
+        Args:
+            nodes (pyNode list, optional) : The nodes to inspect. Defaults
+            to every node with data in the scene.
+        """
+        classes = Utils.get_class_names()
+        current = collections.defaultdict(list)
+        outdated = collections.defaultdict(list)
+        for record in Utils.scan_records(nodes):
+            data_class = classes.get(record.name)
+            if data_class is None or not data_class.get_schema_plan().externals:
+                continue
+
+            if record.version == data_class.get_class_version():
+                current[data_class].append(record.node)
+            else:
+                outdated[data_class].append(record.node)
+
+        backend = get_backend()
+        keys = set()
+        for data_class, node_names in current.items():
+            columns = data_class.read_table(node_names, list(data_class.get_schema_plan().externals))
+            for column in columns.values():
+                keys.update(External.split_value(value)[0] for value in column if ExternalStore.is_key(value))
+
+        for data_class, node_names in outdated.items():
+            attr_names = [data_class.get_attr_name(field) for field in data_class.get_schema_plan().externals]
+            for node_name in node_names:
+                for attr_name in attr_names:
+                    if backend.has_attr(node_name, attr_name):
+                        value = backend.get_attr(node_name, attr_name, 'string')
+                        if ExternalStore.is_key(value):
+                            keys.add(External.split_value(value)[0])
+
+        return keys
+
+
+    @staticmethod
+    def collect_external_garbage(store = None, dry_run = False):
+        """Remove the bytes in the external store that no node refers to
+
+        Only the open scene is inspected, so a store shared by several scenes
+        shouldn't be collected this way. The keys of data whose class isn't
+        loaded can't be found, so nothing is removed while the scene carries
+        such data.
+
+        Args:
+            store (udata.ExternalStore, optional) : Defaults to
+            udata.get_external_store().
+            dry_run (bool, optional) : Only report what would be removed.
+
+        Returns:
+            list : The unreferenced keys.
+        """
+        unknown = set(record.name for record in Utils.scan_records()).difference(Utils.get_class_names())
+        if unknown and not dry_run:
+            _error('udata Module: Can\'t collect external garbage while the classes {0} aren\'t loaded'.format(sorted(unknown)))
+
+        store = store or get_external_store()
+        return store.collect_garbage(Utils.get_external_keys(), dry_run)
+
+
+    @staticmethod
+    def build_data_graph(classes = None, rebuild = False):
+        """Returns the DataGraph of the message connections between data nodes
+
+        The graph of the same classes is re-used until it's stale, see
+        DataGraph.is_stale().
+
+        Args:
+            classes (BaseData sub-class list, optional) : The classes whose
+            message fields are edges. Defaults to every loaded class.
+            rebuild (bool, optional) : Build a new graph even if the cached
+            one isn't stale.
+        """
+        if classes is None:
+            classes = Utils.get_classes()
+
+        key = tuple(sorted(data_class.get_name() for data_class in classes))
+        graph = _data_graphs.get(key)
+        if graph is None or rebuild or graph.is_stale():
+            graph = DataGraph(classes).build()
+            _data_graphs[key] = graph
+
+        return graph
+
+
+    @staticmethod
+    def get_upgrade_queue():
+        """Returns the UpgradeQueue used when udata.DEFER_UPDATES is True"""
+        return _upgrade_queue
+
+
+    @staticmethod
+    def get_change_journal():
+        """Returns the ChangeJournal of the udata blocks that changed
+
+        The journal is off by default. Call get_change_journal().enable()
+        to start journaling changes.
+        """
+        return _journal
+
+
+    @staticmethod
+    def get_index_node():
+        """Returns the IndexNode that saves the scene index in the scene
+
+        Set udata.core.USE_INDEX_NODE = True to keep it up-to-date and
+        call get_index_node().repair() if it has drifted from the scene.
+        """
+        return _index_node
+
+
+    @staticmethod
+    def get_scene_index():
+        """Returns the SceneIndex used to answer scene queries
+
+        Users can call get_scene_index().set_hook() to replace how
+        scene changes are reported to the index or invalidate() to force
+        a rebuild on the next query.
+        """
+        return _scene_index
+
+
     @staticmethod
     def validate_version(nodes = None, *args, **kwargs):
         """Force version validation on the given node conditions
@@ -955,26 +4528,221 @@ class Utils(object):
         the scene against every potential class like this:
         
         Utils.validate_version()
+        
+        Either way each node's records are read once in a single bulk scan
+        and only the classes found in those records are checked. Outdated
+        data is grouped by class and updated one class at a time with
+        BaseData.update_version_many().
             
         Args:
             nodes (pyNode list, optional) : What nodes should the function
             search?
+            undoable (bool, optional) : When False the undo queue is turned
+            off while updating, which is faster but can't be undone.
+            defer (bool, optional) : Put outdated data on the UpgradeQueue
+            instead of updating it. Defaults to udata.DEFER_UPDATES.
             **kwargs (pymel.ls flags) : Only considered if nodes is None.
+            
+        Returns:
+            VersionReport : What was found, what was updated and how long
+            each phase took.
         """
+        undoable = kwargs.pop('undoable', True)
+        defer = kwargs.pop('defer', DEFER_UPDATES)
+        report = VersionReport()
+        
+        start = time.perf_counter()
         if not nodes:
-            nodes = pm.ls(*args, **kwargs)        
+            nodes = get_backend().ls(*args, **kwargs) if (args or kwargs) else None
+            
+        records = Utils.scan_records(nodes)
+        report.timings['scan'] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        classes = Utils.get_class_names()
+        for node_name, name, version in records:
+            key = (name, version)
+            report.counts[key] = report.counts.get(key, 0) + 1
+            
+            data_class = classes.get(name)
+            if data_class and version < data_class.get_class_version():
+                report.outdated.setdefault(name, []).append(node_name)
                 
-        classes= Utils.get_classes()
+        report.timings['group'] = time.perf_counter() - start
         
-        for data_class in classes:
-            #instance = data_class()
-            for node in nodes:
-                #this forces a version check
-                data_class.get_data(node)
-                #instance.get_data(node)
+        start = time.perf_counter()
+        for name, node_names in report.outdated.items():
+            nodes = [get_backend().to_node(node_name) for node_name in node_names]
+            if defer:
+                for node in nodes:
+                    _upgrade_queue.add(node, classes[name])
 
-        
+                report.queued[name] = len(nodes)
+            else:
+                report.results[name] = classes[name].update_version_many(nodes, undoable)
             
+        report.timings['update'] = time.perf_counter() - start
+        
+        return report
+
+
+
+class SceneCheck(object):
+    """The problems found by Utils.check_scene() and how to repair them
+
+    Each problem is a tuple of node name, class name and record index(es).
+    """
+
+    def __init__(self):
+        super(SceneCheck, self).__init__()
+
+        self.missing_blocks = []
+        """(node, name, index) : records whose data block doesn't exist"""
+
+        self.orphan_blocks = []
+        """(node, name) : data blocks of loaded classes that have no record"""
+
+        self.duplicates = []
+        """(node, name, indices) : classes recorded more than once on a node"""
+
+        self.malformed = []
+        """(node, index, value) : records that aren't a 'name:version' string"""
+
+        self.unindexed = []
+        """(node, name) : records on nodes that aren't connected to the index node"""
+
+        self.elapsed = 0.0
+        """How many seconds the check took"""
+
+
+    def __len__(self):
+        return len(self.missing_blocks) + len(self.orphan_blocks) + len(self.duplicates) + len(self.malformed) + \
+            len(self.unindexed)
+
+
+    def __str__(self):
+        lines = []
+        for node, name, index in self.missing_blocks:
+            lines.append('{0} : record {1}[{2}] has no data block'.format(node, name, index))
+        for node, name in self.orphan_blocks:
+            lines.append('{0} : data block {1} has no record'.format(node, name))
+        for node, name, indices in self.duplicates:
+            lines.append('{0} : {1} is recorded at {2}'.format(node, name, indices))
+        for node, index, value in self.malformed:
+            lines.append('{0} : record [{1}] is malformed : "{2}"'.format(node, index, value))
+        for node, name in self.unindexed:
+            lines.append('{0} : {1} isn\'t on the index node'.format(node, name))
+
+        lines.append('{0} problem(s) found in {1:.3f}s'.format(len(self), self.elapsed))
+        return '\n'.join(lines)
+
+
+    def repair(self, undoable = True):
+        """Fix every problem in one undo chunk
+
+        Malformed records and records without a data block are removed.
+        Duplicate records are reduced to the one with the lowest version, so
+        the next get_data() re-validates the block. Orphan blocks get a
+        record at the current class version if they match the class
+        definition, otherwise at version 0.0.0 so the next get_data()
+        migrates them. Orphan blocks of a class whose version is 0.0.0 and
+        that don't match the definition are left alone. Unindexed records
+        that are still on their node are connected to the index node.
+
+        Args:
+            undoable (bool, optional) : When False the undo queue is turned
+            off while repairing, which is faster but can't be undone.
+
+        Returns:
+            int : How many problems were fixed.
+        """
+        backend = get_backend()
+        removals = collections.defaultdict(set)
+        for node, name, index in self.missing_blocks:
+            removals[node].add(index)
+        for node, index, value in self.malformed:
+            removals[node].add(index)
+        for node, name, indices in self.duplicates:
+            removals[node].update(indices[1:])
+
+        fixed = 0
+        with _undo_chunk('udata.repair', undoable):
+            for node_name, indices in removals.items():
+                node = backend.to_node(node_name)
+                for index in sorted(indices):
+                    plug = RecordTable._get_plug(index)
+                    backend.set_locked(node, plug, False)
+                    backend.remove_multi_instance(node, plug)
+
+                RecordTable.invalidate(node)
+
+            fixed += len(self.missing_blocks) + len(self.malformed) + len(self.duplicates)
+
+            classes = Utils.get_class_names()
+            for node_name, name in self.orphan_blocks:
+                data_class = classes[name]
+                plan = data_class.get_schema_plan()
+                version = plan.version
+                if not plan.sparse and SchemaDiff.from_node(node_name, plan).is_structural():
+                    if version == (0, 0, 0):
+                        continue
+
+                    version = (0, 0, 0)
+
+                node = backend.to_node(node_name)
+                RecordTable.invalidate(node)
+                RecordTable.get(node).add(name, version)
+                fixed += 1
+
+            for node_name, name in self.unindexed:
+                node = backend.to_node(node_name)
+                version = RecordTable.get(node).get_version(name)
+                if version is not None:
+                    _index_node.add(node, name, version)
+                    fixed += 1
+
+        _scene_index.invalidate()
+        return fixed
+
+
+
+class VersionReport(object):
+    """The results of Utils.validate_version()"""
     
-    
+    def __init__(self):
+        super(VersionReport, self).__init__()
+        
+        self.counts = {}
+        """How many nodes carry each (class name, version)"""
+        
+        self.outdated = {}
+        """The names of the nodes with outdated data keyed by class name"""
+        
+        self.results = {}
+        """The BatchResult of each outdated class keyed by class name"""
+
+        self.queued = {}
+        """How many nodes were queued for a deferred update keyed by class name"""
+        
+        self.timings = collections.OrderedDict()
+        """How many seconds each phase of the validation took"""
+        
+        
+    def __str__(self):
+        lines = []
+        for name, version in sorted(self.counts):
+            version_string = '.'.join(map(str, version))
+            lines.append('{0} {1} : {2} node(s)'.format(name, version_string, self.counts[(name, version)]))
+            
+        for name in sorted(self.results):
+            result = self.results[name]
+            lines.append('{0} : updated {1} node(s), declined {2}, {3} error(s)'.format(
+                name, len(result), len(result.declined), len(result.errors)))
 
+        for name in sorted(self.queued):
+            lines.append('{0} : queued {1} node(s) for a deferred update'.format(name, self.queued[name]))
+            
+        for phase, elapsed in self.timings.items():
+            lines.append('{0} : {1:.3f}s'.format(phase, elapsed))
+            
+        return '\n'.join(lines)
@@ -10,16 +10,31 @@ import cg3dguru.udata
 
 WINDOW_NAME = 'User Data Editor'
 
+#milliseconds to wait for the selection to settle before the buttons are updated
+SELECTION_DELAY = 150
+
        
 class UserDataEditor(ui.Window):
     
-    def __init__(self, windowKey, uiFilepath, *args, **kwargs):
+    def __init__(self, windowKey, uiFilepath, data_module = None, *args, **kwargs):
         super(UserDataEditor, self).__init__(windowKey, uiFilepath)
 
+        #when a data module is given only its classes are listed
+        self.data_module = data_module
+
+        self.selection = pm.ls(sl=True)
+        self.maya_nodes_selected = len(self.selection) > 0
+
+        #box selecting fires SelectionChanged many times, so updates wait
+        #until the selection stops changing
+        self.selection_timer = ui.QTimer()
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.setInterval(SELECTION_DELAY)
+        self.selection_timer.timeout.connect(self.refresh_selection)
+
         self.add_script_job()
-        self.maya_nodes_selected = len(pm.ls(sl=True)) > 0
 
-        self.classes = cg3dguru.udata.Utils.get_class_names()
+        self.classes = cg3dguru.udata.Utils.get_class_names(module = self.data_module)
         keys = list(self.classes.keys())
         keys.sort()
         self.ui.createDataList.addItems(keys)
@@ -37,7 +52,7 @@ class UserDataEditor(ui.Window):
         
         
     def on_attribute_conflicts(self, *args, **kwargs):
-        conflicts = cg3dguru.udata.Utils.find_attribute_conflicts(error_on_conflict=False)
+        conflicts = cg3dguru.udata.Utils.find_attribute_conflicts(error_on_conflict=False, module=self.data_module)
 
         output = ''
         if conflicts:
@@ -52,17 +67,38 @@ class UserDataEditor(ui.Window):
         
         
     def add_script_job(self):
-        jobId   = pm.scriptJob( event=['SelectionChanged', self.maya_selection_changed] )
-        #print 'New Job: {0}'.format(jobId)
-        self.handler = lambda : self.remove_script_job(jobId)
+        jobIds = [pm.scriptJob( event=['SelectionChanged', self.maya_selection_changed] )]
+        
+        #undo, redo and new scenes can change records without changing the selection
+        for event in ['Undo', 'Redo', 'SceneOpened', 'NewSceneOpened']:
+            jobIds.append( pm.scriptJob( event=[event, self.maya_selection_changed] ) )
+            
+        #print 'New Job: {0}'.format(jobIds)
+        self.handler = lambda : self.remove_script_job(jobIds)
         #self.jobId = jobId
         self.ui.destroyed.connect( self.handler )        
         
         
-    def remove_script_job(self, jobId):
-        #print 'Nuke Job: {0}'.format(jobId)
+    def remove_script_job(self, jobIds):
+        #print 'Nuke Job: {0}'.format(jobIds)
         self.ui.destroyed.disconnect( self.handler )
-        pm.scriptJob( kill = jobId )
+        self.selection_timer.stop()
+        for jobId in jobIds:
+            pm.scriptJob( kill = jobId )
+            
+            
+    def get_selected_records(self):
+        """Returns a set of record names for each selected node
+        
+        The names come from each node's cached RecordTable, which udata
+        keeps current as data is added, removed or updated.
+        """
+        records = []
+        for node in self.selection:
+            if node.exists():
+                records.append( set(cg3dguru.udata.RecordTable.get(node).names()) )
+                
+        return records
         
         
     def _get_item_names(self, listWidget):
@@ -74,6 +110,14 @@ class UserDataEditor(ui.Window):
         return names
         
         
+    def _report_errors(self, result):
+        for node, error in result.errors:
+            pm.warning('{0} : {1}'.format(node, error))
+            
+        if result.errors:
+            self.ui.statusbar.showMessage('{0} node(s) failed. See script editor.'.format(len(result.errors)), 5000)
+        
+        
     def on_create(self):
         names = self._get_item_names(self.ui.createDataList)
         newNodes = []
@@ -92,11 +136,12 @@ class UserDataEditor(ui.Window):
     def on_add(self):
         names = self._get_item_names(self.ui.createDataList)
         cg3dguru.udata.Utils.validate_version(sl=True)
+        selection = pm.ls(sl=True)
         
         for name in names:
             data_class = self.classes[name] #()
-            for maya_node in pm.ls(sl=True):
-                data_class.add_data( maya_node )
+            result = data_class.add_data_many( selection )
+            self._report_errors(result)
                 
         self.on_selection_changed(self.ui.createDataList)
     
@@ -107,10 +152,10 @@ class UserDataEditor(ui.Window):
         
         for name in names:
             data_class = self.classes[name] #()
-            for mayaNode in selection:
-                data_class.delete_data( mayaNode )
+            result = data_class.delete_data_many( selection )
+            self._report_errors(result)
                 
-        self.maya_selection_changed()
+        self.refresh_selection()
     
     
     
@@ -149,13 +194,15 @@ class UserDataEditor(ui.Window):
             hasData  = False
             missData = False
             
-            for name in names:
-                data = None
-                data = cg3dguru.udata.Utils.get_nodes_with_data(data_class = self.classes[name], sl=True)
-                if data:
-                    hasData  = True
-                
-                missData = len(data) != len(pm.ls(sl=True))
+            if names and self.maya_nodes_selected:
+                records = self.get_selected_records()
+                for name in names:
+                    found = sum(1 for node_records in records if name in node_records)
+                    if found:
+                        hasData  = True
+                    
+                    if found != len(records):
+                        missData = True
             
      
             self.ui.createData.setEnabled(enable)   
@@ -166,7 +213,13 @@ class UserDataEditor(ui.Window):
             
             
     def maya_selection_changed(self):
-        self.maya_nodes_selected = len( pm.ls(sl=True) ) > 0
+        #restarting the timer drops the pending update
+        self.selection_timer.start()
+        
+        
+    def refresh_selection(self):
+        self.selection = pm.ls(sl=True)
+        self.maya_nodes_selected = len( self.selection ) > 0
         
         if self.ui.createDataList.isVisible():
             self.on_selection_changed(self.ui.createDataList)
@@ -184,6 +237,6 @@ def run(data_module = None):
                 return
 
     filepath = os.path.join(cg3dguru.udata.__path__[0],  'user_data.ui' )
-    editor = UserDataEditor(WINDOW_NAME, filepath)
+    editor = UserDataEditor(WINDOW_NAME, filepath, data_module)
     editor.ui.show()
     
\ No newline at end of file
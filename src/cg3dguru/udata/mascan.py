@@ -0,0 +1,436 @@
+"""Find udata records and values in Maya ASCII files without launching Maya
+
+The scanner streams a .ma file one statement at a time and only looks at the
+createNode, select, addAttr and setAttr statements it needs to rebuild
+each node's DataRecords and the values of the attributes stored under each
+data block. Nothing in this module imports Maya, so large asset libraries can
+be scanned from any Python interpreter.
+
+Scanning a library might look something like this:
+
+    python -m cg3dguru.udata.mascan /assets -o udata.ndjson -j 8 --current ExportData=1.2.0
+
+Every (node, class) pair that's found is written as one line of JSON.
+"""
+
+__author__ = "Nathaniel Albright"
+__email__ = "developer@3dcg.guru"
+
+
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+
+#This must match udata.core._RECORDS_NAME
+RECORDS_NAME = 'DataRecords'
+"""The name of the custom attr that tracks what data is on a node"""
+
+_COMMANDS = set(['createNode', 'select', 'addAttr', 'setAttr'])
+"""The MEL commands the scanner needs to inspect"""
+
+_SETATTR_FLAGS = {'-l': 1, '-lock': 1, '-k': 1, '-keyable': 1, '-cb': 1, '-channelBox': 1,
+                  '-s': 1, '-size': 1, '-type': 1, '-ca': 1, '-caching': 1,
+                  '-av': 0, '-alteredValue': 0}
+"""setAttr flags and how many arguments each one takes"""
+
+_SPECIAL_CHARS = re.compile(r'["\\;]')
+_TOKENS = re.compile(r'"((?:[^"\\]|\\.)*)"|([^\s"]+)')
+_FLAG = re.compile(r'^-[A-Za-z]')
+_ESCAPES = re.compile(r'\\(.)')
+_ESCAPE_VALUES = {'n': '\n', 't': '\t', 'r': '\r'}
+_INDEX = re.compile(r'^(?P<name>[^\[]+)(\[(?P<start>\d+)(:(?P<end>\d+))?\])?$')
+
+
+
+def iter_statements(stream):
+    """Yield each MEL statement (without the ';') from a stream of lines
+
+    Statements can span several lines and strings can contain ';' so the
+    stream is split on semicolons that aren't inside a string.
+    """
+    parts = []
+    in_string = False
+
+    for line in stream:
+        if not parts and not in_string:
+            stripped = line.lstrip()
+            if not stripped or stripped.startswith('//'):
+                continue
+
+        start = 0
+        skip = -1
+        for match in _SPECIAL_CHARS.finditer(line):
+            char = match.group()
+            position = match.start()
+            if position == skip:
+                continue
+
+            if in_string:
+                if char == '\\':
+                    skip = position + 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == ';':
+                parts.append(line[start:position])
+                yield ''.join(parts).strip()
+                parts = []
+                start = position + 1
+
+        remainder = line[start:]
+        if parts or in_string or remainder.strip():
+            parts.append(remainder)
+
+    tail = ''.join(parts).strip()
+    if tail:
+        yield tail
+
+
+def _unescape(value):
+    return _ESCAPES.sub(lambda match: _ESCAPE_VALUES.get(match.group(1), match.group(1)), value)
+
+
+def tokenize(statement):
+    """Split a MEL statement into (is_string, value) tokens"""
+    tokens = []
+    for match in _TOKENS.finditer(statement):
+        string, word = match.groups()
+        if word is None:
+            tokens.append( (True, _unescape(string)) )
+        else:
+            tokens.append( (False, word) )
+
+    return tokens
+
+
+def _convert(token):
+    is_string, value = token
+    if is_string:
+        return value
+
+    lowered = value.lower()
+    if lowered in ('on', 'yes', 'true'):
+        return True
+    if lowered in ('off', 'no', 'false'):
+        return False
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _get_flags(tokens):
+    """Returns the {flag: value} of a command whose flags all take one argument"""
+    flags = {}
+    i = 0
+    while i < len(tokens):
+        is_string, value = tokens[i]
+        if not is_string and _FLAG.match(value):
+            if i + 1 < len(tokens) and (tokens[i + 1][0] or not _FLAG.match(tokens[i + 1][1])):
+                flags[value] = tokens[i + 1][1]
+                i += 1
+            else:
+                flags[value] = True
+
+        i += 1
+
+    return flags
+
+
+def parse_record_string(value):
+    """Splits a 'name:version' record string into (name, version tuple)
+
+    Returns None if the value isn't a valid record string.
+    """
+    try:
+        name, str_version = value.split(':')
+        return (name, tuple(map(int, str_version.split('.'))))
+    except (AttributeError, ValueError):
+        return None
+
+
+
+class ScannedNode(object):
+    """The dynamic attributes, records and values found for a single node"""
+
+    def __init__(self, name, node_type = None, parent = None):
+        super(ScannedNode, self).__init__()
+
+        self.name = name
+        self.node_type = node_type
+        self.parent = parent
+        self.short_names = {}
+        self.parents = {}
+        self.records = {}
+        self.values = {}
+
+
+    def add_attr(self, flags):
+        long_name = flags.get('-ln') or flags.get('-longName')
+        if not long_name:
+            return
+
+        short_name = flags.get('-sn') or flags.get('-shortName') or long_name
+        self.short_names[short_name] = long_name
+        self.parents[long_name] = flags.get('-p') or flags.get('-parent')
+
+
+    def set_attr(self, path, values):
+        match = _INDEX.match(path.lstrip('.').split('.')[-1])
+        if not match:
+            return
+
+        name = self.short_names.get(match.group('name'), match.group('name'))
+        if name == RECORDS_NAME:
+            if match.group('start') is None:
+                return
+
+            start = int(match.group('start'))
+            for offset, value in enumerate(values):
+                self.records[start + offset] = value
+        elif name in self.parents:
+            self.values[name] = values[0] if len(values) == 1 else values
+
+
+    def get_block(self, attr_name):
+        """Returns the name of the top-level data block the attribute is under"""
+        block = attr_name
+        seen = set()
+        while self.parents.get(block) and block not in seen:
+            seen.add(block)
+            block = self.parents[block]
+
+        return block
+
+
+    def iter_records(self):
+        """Yield a result dict for each record found on the node"""
+        blocks = {}
+        for attr_name, value in self.values.items():
+            blocks.setdefault(self.get_block(attr_name), {})[attr_name] = value
+
+        for index in sorted(self.records):
+            value = self.records[index]
+            result = {'node': self.name, 'node_type': self.node_type, 'index': index}
+            if self.parent:
+                result['parent'] = self.parent
+
+            record = parse_record_string(value)
+            if record is None:
+                result['error'] = 'malformed record'
+                result['record'] = value
+            else:
+                result['class'] = record[0]
+                result['version'] = list(record[1])
+                result['values'] = blocks.get(record[0], {})
+
+            yield result
+
+
+
+def _resolve_path(name, paths):
+    """Returns the full path of a node name as Maya writes it, else None
+
+    Maya only writes as much of a DAG path as it needs to be unique, so
+    'root' or 'rigA|root' can both name '|rigA|root'. Parents are created
+    before their children, so the most recent match is the one in scope.
+
+    Args:
+        name (str) : The name or partial DAG path.
+        paths (dict) : The full paths of the created nodes keyed by their
+        short name, in the order they were created.
+    """
+    candidates = paths.get(name.split('|')[-1], [])
+    suffix = name if name.startswith('|') else '|' + name
+    for full_path in reversed(candidates):
+        if full_path == name or full_path.endswith(suffix):
+            return full_path
+
+    return None
+
+
+def iter_file_records(path, versions = None):
+    """Yield a result dict for every record found in a Maya ASCII file
+
+    Args:
+        path (str) : The .ma file to scan.
+        versions (dict, optional) : Current version tuples keyed by class
+        name. When supplied, each result reports if its data is outdated.
+    """
+    nodes = {}
+    paths = {}
+    current = None
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as stream:
+        for statement in iter_statements(stream):
+            command = statement.split(None, 1)[0]
+            if command not in _COMMANDS:
+                continue
+
+            tokens = tokenize(statement)[1:]
+            if command == 'createNode':
+                flags = _get_flags(tokens[1:])
+                name = flags.get('-n') or flags.get('-name') or tokens[0][1]
+                parent = flags.get('-p') or flags.get('-parent')
+
+                #DAG nodes are keyed by their full path, since only the path
+                #is unique
+                full_path = name
+                if parent:
+                    parent = _resolve_path(parent, paths) or parent
+                    if not parent.startswith('|'):
+                        parent = '|' + parent
+
+                    full_path = '{0}|{1}'.format(parent, name)
+
+                current = ScannedNode(full_path, tokens[0][1], parent)
+                nodes[full_path] = current
+                paths.setdefault(name, []).append(full_path)
+
+            elif command == 'select':
+                names = [value for is_string, value in tokens if is_string or not _FLAG.match(value)]
+                if names:
+                    name = _resolve_path(names[0], paths) or names[0]
+                    current = nodes.setdefault(name, ScannedNode(name))
+
+            elif current is None:
+                continue
+
+            elif command == 'addAttr':
+                current.add_attr(_get_flags(tokens))
+
+            else:
+                attr_path = None
+                values = []
+                i = 0
+                while i < len(tokens):
+                    is_string, value = tokens[i]
+                    if not is_string and value in _SETATTR_FLAGS:
+                        i += _SETATTR_FLAGS[value] + 1
+                        continue
+
+                    if attr_path is None and is_string and value.startswith('.'):
+                        attr_path = value
+                    elif attr_path is not None:
+                        values.append(_convert(tokens[i]))
+
+                    i += 1
+
+                if attr_path is not None and values:
+                    current.set_attr(attr_path, values)
+
+    for node in nodes.values():
+        for result in node.iter_records():
+            result['file'] = path
+            if versions and result.get('class') in versions:
+                result['outdated'] = tuple(result['version']) < tuple(versions[result['class']])
+
+            yield result
+
+
+def scan_file(path, versions = None):
+    """Returns a list of every record found in a Maya ASCII file
+
+    See iter_file_records() for the args.
+    """
+    return list(iter_file_records(path, versions))
+
+
+def find_scenes(roots, pattern = '*.ma'):
+    """Yield the path of every file below the roots that matches the pattern"""
+    for root in roots:
+        if os.path.isfile(root):
+            yield root
+            continue
+
+        for folder, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            for file_name in sorted(fnmatch.filter(file_names, pattern)):
+                yield os.path.join(folder, file_name)
+
+
+def _scan_worker(args):
+    path, versions = args
+    try:
+        return (path, scan_file(path, versions), None)
+    except Exception as e:
+        return (path, [], str(e))
+
+
+def scan_paths(paths, output, processes = None, versions = None, chunk_size = 4):
+    """Scan many Maya ASCII files in parallel and write the results as NDJSON
+
+    Each line of the output is one (file, node, class) result. Files that
+    fail to scan are written as a line with an 'error' key.
+
+    Args:
+        paths (str iterable) : The .ma files to scan.
+        output (file) : A writeable text stream for the results.
+        processes (int, optional) : The size of the process pool. Defaults
+        to the number of CPUs.
+        versions (dict, optional) : Current version tuples keyed by class
+        name so results can be flagged as outdated.
+        chunk_size (int, optional) : How many files each worker takes at once.
+
+    Returns:
+        int : How many results were written.
+    """
+    count = 0
+    jobs = ((path, versions) for path in paths)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for path, results, error in pool.imap_unordered(_scan_worker, jobs, chunk_size):
+            if error is not None:
+                results = [{'file': path, 'error': error}]
+
+            for result in results:
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+                count += 1
+    finally:
+        pool.close()
+        pool.join()
+
+    return count
+
+
+def _parse_version(text):
+    name, version = text.split('=')
+    return (name, tuple(map(int, version.split('.'))))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Find udata records in Maya ASCII files.')
+    parser.add_argument('roots', nargs='+', help='.ma files or folders to scan')
+    parser.add_argument('-o', '--output', help='NDJSON output file (defaults to stdout)')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker process count')
+    parser.add_argument('-p', '--pattern', default='*.ma', help='file name pattern to scan')
+    parser.add_argument('--current', action='append', default=[], type=_parse_version,
+                        metavar='CLASS=VERSION', help='current class version, used to flag outdated data')
+    args = parser.parse_args(argv)
+
+    versions = dict(args.current)
+    paths = find_scenes(args.roots, args.pattern)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            scan_paths(paths, output, args.processes, versions)
+    else:
+        scan_paths(paths, sys.stdout, args.processes, versions)
+
+
+
+if __name__ == '__main__':
+    main()
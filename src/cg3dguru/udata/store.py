@@ -0,0 +1,416 @@
+"""Content-addressed storage for udata fields that live outside the scene
+
+Baked caches, analysis results and other heavy payloads make scene files
+slow to open and save. An udata.External attribute only stores a key on the
+node while the bytes are kept in an ExternalStore next to the scene. Keys
+are the sha256 of the bytes, so identical payloads are only stored once and
+a key always refers to the same bytes.
+
+Two stores are available:
+
+1. SqliteStore : A single SQLite file. This is the default store.
+
+2. PackStore : An append-only pack file that's read through mmap, with a
+JSON index. Reads don't copy the pack into memory and the pack can be
+compacted after garbage collection.
+
+MemoryStore keeps everything in memory and is meant for the MemoryBackend.
+
+Stores that live on disk have a location, ie. 'sqlite:/shots/shot010.udata.sqlite',
+which open_store() turns back into a store. udata saves the location next to
+each key so the bytes can still be found after the scene is saved under a new
+name or referenced into another scene.
+"""
+
+__author__ = "Nathaniel Albright"
+__email__ = "developer@3dcg.guru"
+
+
+import collections
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+
+
+KEY_PREFIX = 'sha256:'
+"""The prefix of every store key"""
+
+
+
+class ExternalStore(object):
+    """Bytes keyed by the sha256 of their content
+
+    Loaded bytes are kept in an LRU cache of up to cache_size bytes so
+    repeated reads of the same key don't touch the disk. Sub-classes
+    implement _read(), _write(), _delete() and keys().
+    """
+
+    def __init__(self, cache_size = 64 * 1024 * 1024):
+        super(ExternalStore, self).__init__()
+
+        self.cache_size = cache_size
+        """How many bytes the LRU cache can hold"""
+
+        self.location = None
+        """The string open_store() can re-open the store from, else None"""
+
+        self._cache = collections.OrderedDict()
+        self._cached_bytes = 0
+
+
+    @staticmethod
+    def make_key(data):
+        """Returns the key the bytes are stored under"""
+        return KEY_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+    @staticmethod
+    def is_key(value):
+        """Is the value a store key?"""
+        return isinstance(value, str) and value.startswith(KEY_PREFIX)
+
+
+    def put(self, data):
+        """Store the bytes and return their key
+
+        Bytes that are already stored aren't written again.
+        """
+        data = bytes(data)
+        key = self.make_key(data)
+        if not self.has(key):
+            self._write(key, data)
+
+        self._cache_data(key, data)
+        return key
+
+
+    def get(self, key):
+        """Returns the bytes stored under the key
+
+        Raises:
+            KeyError : If nothing is stored under the key.
+            ValueError : If the stored bytes don't match the key.
+        """
+        data = self._cache.get(key)
+        if data is not None:
+            self._cache.move_to_end(key)
+            return data
+
+        data = self._read(key)
+        if data is None:
+            raise KeyError(key)
+
+        if self.make_key(data) != key:
+            raise ValueError('udata Module: The data stored under "{0}" is corrupt'.format(key))
+
+        self._cache_data(key, data)
+        return data
+
+
+    def has(self, key):
+        """Is anything stored under the key?"""
+        return key in self._cache or key in self.keys()
+
+
+    def delete(self, key):
+        """Remove the bytes stored under the key"""
+        self._uncache(key)
+        self._delete(key)
+
+
+    def clear_cache(self):
+        """Forget every loaded value"""
+        self._cache.clear()
+        self._cached_bytes = 0
+
+
+    def collect_garbage(self, referenced, dry_run = False):
+        """Delete every key that isn't referenced
+
+        Args:
+            referenced (str iterable) : The keys that are still in use.
+            dry_run (bool, optional) : Only report the unreferenced keys.
+
+        Returns:
+            list : The unreferenced keys.
+        """
+        referenced = set(referenced)
+        garbage = sorted(key for key in self.keys() if key not in referenced)
+        if not dry_run:
+            for key in garbage:
+                self.delete(key)
+
+        return garbage
+
+
+    def close(self):
+        """Release any open files"""
+        self.clear_cache()
+
+
+    def _cache_data(self, key, data):
+        if len(data) > self.cache_size:
+            return
+
+        self._uncache(key)
+        self._cache[key] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.cache_size:
+            old_key, old_data = self._cache.popitem(last=False)
+            self._cached_bytes -= len(old_data)
+
+
+    def _uncache(self, key):
+        data = self._cache.pop(key, None)
+        if data is not None:
+            self._cached_bytes -= len(data)
+
+
+    def keys(self):
+        """Returns a set of every stored key"""
+        raise NotImplementedError()
+
+
+    def _read(self, key):
+        """Returns the stored bytes or None"""
+        raise NotImplementedError()
+
+
+    def _write(self, key, data):
+        raise NotImplementedError()
+
+
+    def _delete(self, key):
+        raise NotImplementedError()
+
+
+
+class MemoryStore(ExternalStore):
+    """Keeps the bytes in memory, for use with the MemoryBackend"""
+
+    def __init__(self, cache_size = 64 * 1024 * 1024):
+        super(MemoryStore, self).__init__(cache_size)
+        self._data = {}
+
+
+    def keys(self):
+        return set(self._data)
+
+
+    def _read(self, key):
+        return self._data.get(key)
+
+
+    def _write(self, key, data):
+        self._data[key] = data
+
+
+    def _delete(self, key):
+        self._data.pop(key, None)
+
+
+
+class SqliteStore(ExternalStore):
+    """Keeps the bytes in a single SQLite file"""
+
+    def __init__(self, path, cache_size = 64 * 1024 * 1024):
+        super(SqliteStore, self).__init__(cache_size)
+
+        self.path = path
+        self.location = 'sqlite:' + os.path.abspath(path)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, size INTEGER, data BLOB)')
+        self._connection.commit()
+
+
+    def keys(self):
+        return set(row[0] for row in self._connection.execute('SELECT key FROM blobs'))
+
+
+    def has(self, key):
+        if key in self._cache:
+            return True
+
+        return self._connection.execute('SELECT 1 FROM blobs WHERE key = ?', (key,)).fetchone() is not None
+
+
+    def _read(self, key):
+        row = self._connection.execute('SELECT data FROM blobs WHERE key = ?', (key,)).fetchone()
+        return bytes(row[0]) if row else None
+
+
+    def _write(self, key, data):
+        with self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO blobs (key, size, data) VALUES (?, ?, ?)',
+                                     (key, len(data), sqlite3.Binary(data)))
+
+
+    def _delete(self, key):
+        with self._connection:
+            self._connection.execute('DELETE FROM blobs WHERE key = ?', (key,))
+
+
+    def vacuum(self):
+        """Give the space of deleted bytes back to the file system"""
+        self._connection.execute('VACUUM')
+
+
+    def close(self):
+        super(SqliteStore, self).close()
+        self._connection.close()
+
+
+
+class PackStore(ExternalStore):
+    """Keeps the bytes in an append-only pack file read through mmap
+
+    The pack is path and its index is path + '.index'. The index is a log
+    with one JSON line per put ([key, offset, size]) or delete ([key, null]),
+    so neither has to rewrite it. Deleting a key only removes it from the
+    index, call compact() to rewrite the pack and the index without the
+    deleted bytes.
+    """
+
+    def __init__(self, path, cache_size = 64 * 1024 * 1024):
+        super(PackStore, self).__init__(cache_size)
+
+        self.path = path
+        self.location = 'pack:' + os.path.abspath(path)
+        self.index_path = path + '.index'
+        self._index = {}
+        self._map = None
+        self._index_stream = None
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as stream:
+                for line in stream:
+                    if not line.strip():
+                        continue
+
+                    entry = json.loads(line)
+                    if entry[1] is None:
+                        self._index.pop(entry[0], None)
+                    else:
+                        self._index[entry[0]] = (entry[1], entry[2])
+
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+
+
+    def keys(self):
+        return set(self._index)
+
+
+    def has(self, key):
+        return key in self._index
+
+
+    def _get_map(self):
+        if self._map is None and os.path.getsize(self.path):
+            with open(self.path, 'rb') as stream:
+                self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self._map
+
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+    def _log(self, entry):
+        if self._index_stream is None:
+            self._index_stream = open(self.index_path, 'a')
+
+        self._index_stream.write(json.dumps(entry) + '\n')
+        self._index_stream.flush()
+
+
+    def _close_index(self):
+        if self._index_stream is not None:
+            self._index_stream.close()
+            self._index_stream = None
+
+
+    def _save_index(self):
+        self._close_index()
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as stream:
+            for key in sorted(self._index):
+                offset, size = self._index[key]
+                stream.write(json.dumps([key, offset, size]) + '\n')
+
+        os.replace(temp_path, self.index_path)
+
+
+    def _read(self, key):
+        location = self._index.get(key)
+        if location is None:
+            return None
+
+        offset, size = location
+        if not size:
+            #there's nothing to map while the pack is empty
+            return b''
+
+        return bytes(self._get_map()[offset:offset + size])
+
+
+    def _write(self, key, data):
+        #the map only covers the old end of the file
+        self._close_map()
+        with open(self.path, 'ab') as stream:
+            offset = stream.seek(0, os.SEEK_END)
+            stream.write(data)
+
+        self._index[key] = (offset, len(data))
+        self._log([key, offset, len(data)])
+
+
+    def _delete(self, key):
+        if self._index.pop(key, None) is not None:
+            self._log([key, None])
+
+
+    def compact(self):
+        """Rewrite the pack without the bytes of deleted keys"""
+        temp_path = self.path + '.tmp'
+        index = {}
+        with open(temp_path, 'wb') as stream:
+            for key in sorted(self._index):
+                data = self._read(key)
+                index[key] = (stream.tell(), len(data))
+                stream.write(data)
+
+        self._close_map()
+        os.replace(temp_path, self.path)
+        self._index = index
+        self._save_index()
+
+
+    def close(self):
+        super(PackStore, self).close()
+        self._close_map()
+        self._close_index()
+
+
+
+_STORE_TYPES = {'sqlite': SqliteStore, 'pack': PackStore}
+"""The store classes that open_store() can open, keyed by location prefix"""
+
+
+def open_store(location):
+    """Returns the store at an ExternalStore.location
+
+    Returns None if the location is empty, unknown or its files no longer
+    exist.
+    """
+    store_type, _, path = (location or '').partition(':')
+    store_class = _STORE_TYPES.get(store_type)
+    if store_class is None or not os.path.exists(path):
+        return None
+
+    return store_class(path)
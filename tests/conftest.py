@@ -0,0 +1,29 @@
+import pytest
+
+from cg3dguru.udata import core
+from cg3dguru.udata.backend import MemoryBackend
+from cg3dguru.udata.store import MemoryStore
+
+
+@pytest.fixture(autouse = True)
+def backend():
+    """Run every test against an empty MemoryBackend scene"""
+    previous = (core._backend, core.AUTO_UPDATE, core.REPORT_WARNINGS)
+    core.AUTO_UPDATE = True
+    core.REPORT_WARNINGS = False
+
+    backend = MemoryBackend()
+    core.set_backend(backend)
+    core.set_external_store(MemoryStore())
+
+    yield backend
+
+    journal = core.Utils.get_change_journal()
+    journal.disable()
+    journal.clear()
+    core.Utils.get_upgrade_queue().clear()
+
+    core.set_external_store(None)
+    core.set_backend(previous[0])
+    core.AUTO_UPDATE, core.REPORT_WARNINGS = previous[1:]
+    core.Blob.clear_cache()
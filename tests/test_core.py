@@ -0,0 +1,563 @@
+import json
+
+import pytest
+
+from cg3dguru.udata import core
+
+
+
+class CoreData(core.BaseData):
+    version = (1, 0, 0)
+
+    @classmethod
+    def get_class_version(cls):
+        return cls.version
+
+
+    @classmethod
+    def get_attributes(cls):
+        attrs = [core.Attr('count', 'long'),
+                 core.Attr('label', 'string'),
+                 core.Compound('pos', 'float3'),
+                 core.Attr('link', 'message')]
+        if cls.version >= (1, 1, 0):
+            attrs.append(core.Attr('weight', 'double', dv = 0.5))
+
+        return attrs
+
+
+
+class SparseData(core.BaseData):
+    @classmethod
+    def is_sparse(cls):
+        return True
+
+
+    @classmethod
+    def get_attributes(cls):
+        return [core.Attr('frames', 'long', dv = 24),
+                core.Attr('comment', 'string'),
+                core.Compound('offset', 'float3')]
+
+
+
+class BlobData(core.BaseData):
+    @classmethod
+    def get_attributes(cls):
+        return [core.Blob('poses', chunk_size = 64),
+                core.Blob('maps', codec = 'lzma')]
+
+
+
+class ExternalData(core.BaseData):
+    @classmethod
+    def get_attributes(cls):
+        return [core.External('cache')]
+
+
+
+class ArrayData(core.BaseData):
+    @classmethod
+    def get_attributes(cls):
+        return [core.Attr('weights', 'doubleArray'),
+                core.Attr('points', 'pointArray')]
+
+
+
+@pytest.fixture
+def core_data():
+    yield CoreData
+    CoreData.version = (1, 0, 0)
+    core.Utils.get_registry().refresh(CoreData)
+
+
+def _bump_version(data_class, version):
+    data_class.version = version
+    core.Utils.get_registry().refresh(data_class)
+
+
+def test_add_get_delete(backend, core_data):
+    node = backend.create_node('network')
+    assert core_data.get_data(node) is None
+
+    core_data.add_data(node)
+    assert core_data.get_data(node) is not None
+    assert core.Utils.get_nodes_with_data(data_class = core_data) == [node]
+
+    core_data.write_table([node], {'count': [3], 'label': ['a']})
+    assert core_data.read_table([node], ['count', 'label']) == {'count': [3], 'label': ['a']}
+
+    core_data.delete_data(node)
+    assert core_data.get_data(node) is None
+    assert core.Utils.get_nodes_with_data(data_class = core_data) == []
+    assert not backend.has_attr(node, core_data.get_name())
+
+
+def test_validate_version(backend, core_data):
+    nodes = [backend.create_node('network') for i in range(3)]
+    core_data.add_data_many(nodes)
+    core_data.write_table(nodes, {'count': [1, 2, 3]})
+
+    _bump_version(core_data, (1, 1, 0))
+    report = core.Utils.validate_version()
+
+    assert len(report.outdated[core_data.get_name()]) == 3
+    assert len(report.results[core_data.get_name()]) == 3
+    assert core.Utils.scan_records(data_class = core_data)[0].version == (1, 1, 0)
+    assert core_data.read_table(nodes, ['count', 'weight']) == {'count': [1, 2, 3], 'weight': [0.5] * 3}
+
+    report = core.Utils.validate_version()
+    assert not report.outdated
+
+
+def test_validate_version_declined(backend, core_data):
+    nodes = [backend.create_node('network') for i in range(2)]
+    core_data.add_data_many(nodes)
+
+    core.AUTO_UPDATE = False
+    _bump_version(core_data, (1, 1, 0))
+    result = core.Utils.validate_version().results[core_data.get_name()]
+
+    assert len(result) == 0
+    assert result.declined == nodes
+    assert core.Utils.scan_records(data_class = core_data)[0].version == (1, 0, 0)
+
+
+def test_sparse_round_trip(backend):
+    node = backend.create_node('network')
+    handle = SparseData.add_data(node, as_handle = True)
+    assert SparseData.get_created_fields(node) == []
+    assert handle.get('frames') == 24
+
+    #writing a default doesn't create the field
+    SparseData.write_table([node], {'frames': [24], 'comment': ['hi']})
+    assert SparseData.get_created_fields(node) == [SparseData.get_attr_name('comment')]
+
+    handle.set('offset', (1.0, 2.0, 3.0))
+    assert SparseData.read_table([node], ['frames', 'comment', 'offset']) == \
+        {'frames': [24], 'comment': ['hi'], 'offset': [(1.0, 2.0, 3.0)]}
+
+    SparseData.delete_data(node)
+    assert not backend.has_attr(node, SparseData.get_attr_name('comment'))
+
+
+def test_blob_round_trip(backend):
+    node = backend.create_node('network')
+    BlobData.add_data(node)
+    assert BlobData.read_blob(node, 'poses') is None
+
+    value = dict(('pose{0}'.format(i), list(range(20))) for i in range(20))
+    BlobData.write_blob(node, 'poses', value)
+    BlobData.write_blob(node, 'maps', [1, 2, 3])
+    assert len(backend.get_attr(node, 'posesChunks')) > 1
+
+    core.Blob.clear_cache()
+    assert BlobData.read_blob(node, 'poses') == value
+    assert BlobData.read_blob(node, 'maps') == [1, 2, 3]
+
+
+def test_blob_checksum(backend):
+    node = backend.create_node('network')
+    BlobData.add_data(node)
+    BlobData.write_blob(node, 'poses', {'a': 1})
+
+    backend.set_attr(node, 'posesChunks', ['AAAA'], 'stringArray')
+    core.Blob.clear_cache()
+    with pytest.raises(RuntimeError):
+        BlobData.read_blob(node, 'poses')
+
+
+def test_external_round_trip(backend):
+    node = backend.create_node('network')
+    ExternalData.add_data(node)
+    assert ExternalData.read_external(node, 'cache') is None
+
+    key = ExternalData.write_external(node, 'cache', b'payload' * 100)
+    assert backend.get_attr(node, ExternalData.get_attr_name('cache')) == key
+
+    store = core.get_external_store()
+    store.clear_cache()
+    assert ExternalData.read_external(node, 'cache') == b'payload' * 100
+
+    orphan = store.put(b'orphan')
+    assert core.Utils.collect_external_garbage() == [orphan]
+    assert store.keys() == set([key])
+
+
+def test_stream_round_trip(backend, core_data, tmp_path):
+    nodes = [backend.create_node('network') for i in range(5)]
+    core_data.add_data_many(nodes)
+    core_data.write_table(nodes, {'count': list(range(5)), 'label': ['n{0}'.format(i) for i in range(5)]})
+
+    path = str(tmp_path / 'data.ndjson.gz')
+    assert core.Utils.export_stream(path, classes = [core_data], chunk_size = 2) == 5
+
+    backend.new_scene()
+    result = core.Utils.import_stream(path, create_missing = True, batch_size = 2)
+    assert len(result) == 5 and not result.errors
+
+    imported = core.Utils.get_nodes_with_data(data_class = core_data)
+    values = core_data.read_table(imported, ['count', 'label'])
+    assert sorted(zip(values['count'], values['label'])) == [(i, 'n{0}'.format(i)) for i in range(5)]
+
+
+def test_registry_redefine_multi_class():
+    def define():
+        class RegistryMulti(core.BaseData):
+            @classmethod
+            def get_default_flags(cls):
+                return {'m': True}
+
+            @classmethod
+            def get_attributes(cls):
+                return [core.Attr('multiValue', 'long')]
+
+        return RegistryMulti
+
+    registry = core.Utils.get_registry()
+    first = define()
+    assert registry.get_attribute_names(first)
+
+    second = define()
+    assert registry.get_class('RegistryMulti') is second
+    assert registry.get_attribute_names(second)
+    assert 'multiValue' not in registry.get_conflicts()
+
+    registry.unregister(second)
+    assert registry.get_class('RegistryMulti') is None
+
+
+def test_external_after_save_as(backend, tmp_path):
+    core.set_external_store(None)
+    backend.new_scene(str(tmp_path / 'shot.ma'))
+
+    node = backend.create_node('network')
+    ExternalData.add_data(node)
+    key = ExternalData.write_external(node, 'cache', b'payload')
+    first_store = core.get_external_store()
+    assert backend.get_attr(node, ExternalData.get_attr_name('cache')) == \
+        core.External.join_value(key, first_store.location)
+
+    backend.save_scene(str(tmp_path / 'shot_v002.ma'))
+    assert core.get_external_store() is not first_store
+    assert ExternalData.read_external(node, 'cache') == b'payload'
+    assert core.Utils.get_external_keys() == set([key])
+
+
+def test_transfer_remap(backend, core_data):
+    sources = [backend.create_node('network', n = 'old_{0}'.format(i)) for i in range(2)]
+    targets = [backend.create_node('network', n = 'new_{0}'.format(i)) for i in range(2)]
+    driver = backend.create_node('transform', n = 'driver')
+    core_data.add_data_many(sources)
+    core_data.write_table(sources, {'count': [1, 2], 'label': ['a', 'b']})
+
+    link = core_data.get_attr_name('link')
+    backend.connect('old_0.message', 'old_1.' + link)
+    backend.connect('driver.message', 'old_0.' + link)
+
+    result = core_data.transfer(sources, mode = 'both', remap = [('^old_', 'new_')])
+    assert not result.errors
+    assert [dst for src, dst in result.results] == ['new_0', 'new_1']
+    assert core_data.read_table(targets, ['count', 'label']) == {'count': [1, 2], 'label': ['a', 'b']}
+    assert backend.list_connections('new_1', link) == [('new_0.message', 'new_1.' + link)]
+    assert backend.list_connections('new_0', link) == [('driver.message', 'new_0.' + link)]
+
+
+def test_transfer_rejects_ambiguous_names(backend, core_data):
+    source = backend.create_node('network', n = 'old_0')
+    for i in range(2):
+        backend.create_node('network', n = 'new_{0}'.format(i))
+
+    core_data.add_data(source)
+    result = core_data.transfer([source], remap = lambda name: 'new_*')
+    assert not result.results
+    assert 'matches 2 nodes' in result.errors[0][1]
+
+
+def test_index_node_finds_unindexed_records(backend, core_data, monkeypatch):
+    monkeypatch.setattr(core, 'USE_INDEX_NODE', True)
+    nodes = [backend.create_node('network', n = 'n{0}'.format(i)) for i in range(2)]
+    core_data.add_data(nodes[0])
+
+    #records added while nothing keeps the index node up-to-date
+    monkeypatch.setattr(core, 'USE_INDEX_NODE', False)
+    core_data.add_data(nodes[1])
+    monkeypatch.setattr(core, 'USE_INDEX_NODE', True)
+    core.Utils.get_scene_index().invalidate()
+
+    check = core.Utils.check_scene()
+    assert check.unindexed == [('n1', core_data.get_name())]
+
+    assert sorted(core.Utils.get_nodes_with_data(data_class = core_data)) == nodes
+    assert core.Utils.get_index_node().get_unindexed_nodes() == []
+    assert not core.Utils.check_scene()
+
+
+def test_check_scene_repairs_unindexed_records(backend, core_data, monkeypatch):
+    node = backend.create_node('network')
+    core_data.add_data(node)
+    core.Utils.get_index_node().repair()
+
+    other = backend.create_node('network', n = 'other')
+    core_data.add_data(other)
+
+    check = core.Utils.check_scene()
+    assert check.unindexed == [('other', core_data.get_name())]
+    assert check.repair() == 1
+    assert not core.Utils.check_scene()
+
+
+def _rename_stream_nodes(path, names):
+    with core.Utils._open_stream(path, 'r', None) as stream:
+        lines = [json.loads(line) for line in stream]
+
+    for record in lines[1:]:
+        record['node'] = names[record['node']]
+
+    with core.Utils._open_stream(path, 'w', None) as stream:
+        stream.writelines(json.dumps(line) + '\n' for line in lines)
+
+
+def test_import_stream_creates_dag_paths(backend, core_data, tmp_path):
+    nodes = [backend.create_node('transform', n = name) for name in ('ctrl', 'lost')]
+    core_data.add_data_many(nodes)
+    core_data.write_table(nodes, {'count': [1, 2]})
+
+    path = str(tmp_path / 'data.ndjson')
+    core.Utils.export_stream(path, classes = [core_data])
+    _rename_stream_nodes(path, {'ctrl': '|grp|ctrl', 'lost': '|missing|lost'})
+
+    backend.new_scene()
+    backend.create_node('transform', n = 'grp')
+    for i in range(2):
+        result = core.Utils.import_stream(path, create_missing = True, node_type = 'transform')
+        assert [backend.node_name(node) for node, name in result.results] == ['ctrl']
+        assert [name for name, error in result.errors] == ['|missing|lost']
+
+    assert backend.to_node('ctrl').path() == '|grp|ctrl'
+    assert core.Utils.get_nodes_with_data(data_class = core_data) == [backend.to_node('ctrl')]
+    assert core_data.read_table(['ctrl'], ['count']) == {'count': [1]}
+
+
+def test_import_stream_failed_write_is_not_a_result(backend, core_data, tmp_path):
+    node = backend.create_node('network', n = 'node')
+    core_data.add_data(node)
+    core_data.write_table([node], {'count': [1]})
+
+    path = str(tmp_path / 'data.ndjson')
+    core.Utils.export_stream(path, classes = [core_data])
+
+    backend.set_locked(node, core_data.get_attr_name('count'), True)
+    result = core.Utils.import_stream(path)
+    assert not result.results
+    assert [name for name, error in result.errors] == ['node']
+
+
+def test_index_hook_reports_scene_changes(backend, core_data):
+    index = core.Utils.get_scene_index()
+    node = backend.create_node('network', n = 'node')
+    core_data.add_data(node)
+    assert index.get_nodes(core_data.get_name()) == [node]
+
+    backend.delete_node(node)
+    assert index.get_nodes(core_data.get_name()) == []
+
+    #records written outside of udata are read on the next query
+    other = backend.create_node('network', n = 'other')
+    backend.add_attr(other, 'DataRecords', dt = 'string', m = True)
+    backend.set_attr(other, 'DataRecords[0]', core_data.get_name() + ':1.0.0', 'string')
+    assert index.get_nodes(core_data.get_name()) == [other]
+
+    index.invalidate()
+    assert not index.is_built()
+    assert index.get_version(other, core_data.get_name()) == (1, 0, 0)
+
+
+def test_index_node_versions(backend, core_data, monkeypatch):
+    monkeypatch.setattr(core, 'USE_INDEX_NODE', True)
+    nodes = [backend.create_node('network', n = 'n{0}'.format(i)) for i in range(2)]
+    core_data.add_data_many(nodes)
+
+    index_node = core.Utils.get_index_node()
+    assert index_node.exists()
+    assert index_node.get_versions() == {core_data.get_name(): {'n0': (1, 0, 0), 'n1': (1, 0, 0)}}
+
+    core_data.delete_data(nodes[0])
+    assert index_node.get_nodes() == ['n1']
+
+    core.Utils.get_scene_index().invalidate()
+    assert core.Utils.get_nodes_with_data(data_class = core_data) == [nodes[1]]
+
+
+def test_journal_changes_since(backend, core_data):
+    journal = core.Utils.get_change_journal()
+    journal.enable()
+    node = backend.create_node('network', n = 'node')
+    core_data.add_data(node)
+    seq = journal.latest()
+
+    core_data.write_table([node], {'count': [2]})
+    backend.set_attr(node, core_data.get_attr_name('label'), 'edited', 'string')
+
+    changes = journal.changes_since(seq)
+    assert [(entry.node, entry.field, entry.action) for entry in changes] == \
+        [('node', 'count', 'set'), ('node', 'label', 'set')]
+    assert journal.get_changed_nodes(seq, core_data.get_name()) == ['node']
+    assert journal.changes_since(journal.latest()) == []
+
+
+def test_journal_drops_old_entries(backend, core_data):
+    journal = core.Utils.get_change_journal()
+    journal.enable()
+    journal.max_entries = 2
+    try:
+        node = backend.create_node('network')
+        core_data.add_data(node)
+        for i in range(3):
+            core_data.write_table([node], {'count': [i]})
+
+        assert journal.changes_since(0) is None
+        assert len(journal.changes_since(journal.latest() - 2)) == 2
+    finally:
+        journal.max_entries = 100000
+
+
+def test_journal_save_load(backend, core_data):
+    journal = core.Utils.get_change_journal()
+    journal.enable()
+    core_data.add_data(backend.create_node('network', n = 'node'))
+    saved = journal.changes_since(0)
+    seq = journal.latest()
+    journal.save()
+
+    journal.clear()
+    assert journal.load()
+    assert journal.latest() == seq
+    assert journal.changes_since(0) == saved
+
+    backend.new_scene()
+    assert not journal.load()
+    assert journal.changes_since(seq) == []
+
+
+def test_upgrade_queue_run_deferred(backend, core_data, monkeypatch):
+    nodes = [backend.create_node('network') for i in range(3)]
+    core_data.add_data_many(nodes)
+    _bump_version(core_data, (1, 1, 0))
+
+    monkeypatch.setattr(core, 'DEFER_UPDATES', True)
+    queue = core.Utils.get_upgrade_queue()
+    progress = []
+    queue.add_callback(progress.append)
+    try:
+        for node in nodes:
+            assert core_data.get_data(node) is not None
+
+        assert len(queue) == 3 and queue.is_pending(nodes[0], core_data)
+        assert core.Utils.scan_records(data_class = core_data)[0].version == (1, 0, 0)
+
+        queue.batch_size = 2
+        assert backend.run_deferred() == 2
+    finally:
+        queue.remove_callback(progress.append)
+        queue.batch_size = 50
+
+    assert len(queue) == 0
+    assert [(item.done, item.failed, item.total) for item in progress] == [(1, 0, 3), (2, 0, 3), (3, 0, 3)]
+    assert set(record.version for record in core.Utils.scan_records(data_class = core_data)) == set([(1, 1, 0)])
+
+
+def test_check_scene_repair(backend, core_data):
+    name = core_data.get_name()
+    missing = backend.create_node('network', n = 'missing')
+    core.RecordTable.get(missing).add(name, (1, 0, 0))
+
+    orphan = backend.create_node('network', n = 'orphan')
+    core_data.add_data(orphan)
+    core.RecordTable.get(orphan).remove(name)
+
+    duplicate = backend.create_node('network', n = 'duplicate')
+    core_data.add_data(duplicate)
+    backend.set_attr(duplicate, 'DataRecords[3]', name + ':0.9.0', 'string')
+    backend.set_attr(duplicate, 'DataRecords[4]', 'garbage', 'string')
+
+    check = core.Utils.check_scene()
+    assert check.missing_blocks == [('missing', name, 0)]
+    assert check.orphan_blocks == [('orphan', name)]
+    assert check.duplicates == [('duplicate', name, [3, 0])]
+    assert check.malformed == [('duplicate', 4, 'garbage')]
+
+    assert check.repair() == 4
+    assert not core.Utils.check_scene()
+    assert core.RecordTable.get(orphan).get_version(name) == (1, 0, 0)
+    assert core.RecordTable.get(duplicate).get_version(name) == (0, 9, 0)
+    assert core.RecordTable.get(missing).names() == []
+
+
+def test_data_graph_traversal(backend, core_data):
+    nodes = [backend.create_node('network', n = name) for name in ('a', 'b', 'c')]
+    core_data.add_data_many(nodes)
+    link = core_data.get_attr_name('link')
+    backend.connect('a.message', 'b.' + link)
+    backend.connect('b.message', 'c.' + link)
+
+    graph = core.Utils.build_data_graph([core_data])
+    assert graph.nodes == set(['a', 'b', 'c'])
+    assert graph.edges('b') == [core.DataEdge('b', core_data.get_name(), 'link', 'a')]
+    assert graph.successors('c') == ['b'] and graph.predecessors('a') == ['b']
+    assert graph.bfs('c') == ['c', 'b', 'a']
+    assert graph.dfs('a', reverse = True) == ['a', 'b', 'c']
+    assert graph.is_reachable('c', 'a') and not graph.is_reachable('a', 'c')
+
+    assert core.Utils.build_data_graph([core_data]) is graph
+    core.RecordTable.invalidate()
+    assert graph.is_stale()
+    assert core.Utils.build_data_graph([core_data]) is not graph
+
+
+def test_data_handle_apply_snapshot(backend, core_data):
+    node = backend.create_node('network')
+    handle = core_data.add_data(node, as_handle = True)
+
+    handle.apply({'count': 4, 'label': 'x', 'pos': (1.0, 2.0, 3.0)})
+    assert handle.snapshot() == {'count': 4, 'label': 'x', 'pos': (1.0, 2.0, 3.0)}
+    assert handle.snapshot(['count']) == {'count': 4}
+    assert handle.get('label') == 'x'
+
+    with pytest.raises(RuntimeError):
+        handle.apply({'link': 'other'})
+
+
+def test_create_nodes_values(backend, core_data):
+    result = core_data.create_nodes(2, values = [{'count': 1}, {'count': 2, 'label': 'b'}])
+    assert len(result) == 2 and not result.errors
+
+    nodes = core.Utils.get_nodes_with_data(data_class = core_data)
+    assert core_data.read_table(nodes, ['count', 'label']) == {'count': [1, 2], 'label': [None, 'b']}
+
+    result = core_data.create_nodes(2, values = {'count': 7})
+    nodes = [node for node, data in result.results]
+    assert core_data.read_table(nodes, ['count']) == {'count': [7, 7]}
+
+    with pytest.raises(RuntimeError):
+        core_data.create_nodes(2, values = [{'count': 1}])
+
+
+def test_array_round_trip(backend):
+    numpy = pytest.importorskip('numpy')
+    node = backend.create_node('network')
+    ArrayData.add_data(node)
+    assert ArrayData.read_array(node, 'weights').shape == (0,)
+
+    ArrayData.write_array(node, 'weights', numpy.arange(5, dtype = 'float64'))
+    assert ArrayData.read_array(node, 'weights').tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    #points can leave out w
+    ArrayData.write_array_chunks(node, 'points', (numpy.full((2, 3), i, dtype = 'float64') for i in range(2)))
+    points = ArrayData.read_array(node, 'points')
+    assert points.shape == (4, 4)
+    assert points[:, 0].tolist() == [0.0, 0.0, 1.0, 1.0]
+    assert points[:, 3].tolist() == [1.0] * 4
+
+    with pytest.raises(RuntimeError):
+        ArrayData.read_array(node, 'missing')
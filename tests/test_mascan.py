@@ -0,0 +1,40 @@
+import os
+
+from cg3dguru.udata import mascan
+
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+
+def _records(file_name, versions = None):
+    path = os.path.join(DATA, file_name)
+    return dict((result['node'], result) for result in mascan.scan_file(path, versions))
+
+
+def test_scan_records():
+    records = _records('duplicate_names.ma', {'ScanData': (1, 1, 0)})
+
+    assert records['settings']['class'] == 'Other'
+    assert records['settings']['version'] == [2, 0, 0]
+    assert records['|rigA|root']['outdated'] is True
+    assert records['|rigB|root']['outdated'] is False
+
+
+def test_duplicate_short_names():
+    records = _records('duplicate_names.ma')
+
+    assert sorted(records) == ['settings', '|rigA|root', '|rigB|root']
+    assert records['|rigA|root']['parent'] == '|rigA'
+    assert records['|rigB|root']['parent'] == '|rigB'
+    assert records['|rigA|root']['values'] == {'count': 5}
+    assert records['|rigB|root']['values'] == {'count': 7}
+
+
+def test_resolve_path():
+    paths = {'rigA': ['rigA'], 'root': ['|rigA|root', '|rigB|root']}
+
+    assert mascan._resolve_path('root', paths) == '|rigB|root'
+    assert mascan._resolve_path('rigA|root', paths) == '|rigA|root'
+    assert mascan._resolve_path('|rigA|root', paths) == '|rigA|root'
+    assert mascan._resolve_path('missing', paths) is None
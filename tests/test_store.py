@@ -0,0 +1,47 @@
+import pytest
+
+from cg3dguru.udata import store
+
+
+
+@pytest.mark.parametrize('store_class', [store.SqliteStore, store.PackStore])
+def test_round_trip(store_class, tmp_path):
+    first = store_class(str(tmp_path / 'data'))
+    keys = [first.put(data) for data in (b'', b'a', b'bb' * 100)]
+    first.delete(keys[1])
+    first.close()
+
+    second = store.open_store(first.location)
+    assert type(second) is store_class
+    assert second.keys() == set([keys[0], keys[2]])
+    assert second.get(keys[0]) == b''
+    assert second.get(keys[2]) == b'bb' * 100
+    with pytest.raises(KeyError):
+        second.get(keys[1])
+
+    second.close()
+
+
+def test_pack_empty_value(tmp_path):
+    pack = store.PackStore(str(tmp_path / 'data.pack'))
+    key = pack.put(b'')
+    pack.clear_cache()
+    assert pack.get(key) == b''
+    pack.close()
+
+
+def test_pack_index_is_appended(tmp_path):
+    pack = store.PackStore(str(tmp_path / 'data.pack'))
+    keys = [pack.put(str(i).encode('utf-8')) for i in range(10)]
+    pack.delete(keys[0])
+
+    with open(pack.index_path) as stream:
+        assert len(stream.readlines()) == 11
+
+    pack.compact()
+    with open(pack.index_path) as stream:
+        assert len(stream.readlines()) == 9
+
+    pack.clear_cache()
+    assert pack.get(keys[5]) == b'5'
+    pack.close()